@@ -1,5 +1,5 @@
 from django.contrib import admin
-from accounts.models import CustomUser, VerificationToken, PasswordResetToken
+from accounts.models import CustomUser, VerificationToken, PasswordResetToken, OutgoingEmail
 
 class CustomUserAdmin(admin.ModelAdmin):
     list_display = ('id', 'email', 'username', 'is_subscribed', 'is_completed', 'theme')
@@ -16,7 +16,13 @@ class PasswordResetTokenAdmin(admin.ModelAdmin):
     list_filter = ('is_used', 'created_at', 'expires_at')
     search_fields = ('user__email', 'token')
 
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'recipients', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'recipients')
+
 # Register your models here.
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(VerificationToken, VerificationTokenAdmin)
-admin.site.register(PasswordResetToken, PasswordResetTokenAdmin)
\ No newline at end of file
+admin.site.register(PasswordResetToken, PasswordResetTokenAdmin)
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
\ No newline at end of file
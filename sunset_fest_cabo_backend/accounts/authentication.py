@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import CustomUser
+from .revocation import revocation_list
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user through the cache instead of a
+    primary-key query on every request.
+
+    Users are cached by id and token version, without the password hash, and
+    dropped whenever the user is saved. A token is rejected when its JTI has
+    been revoked, its user is inactive or its `token_version` claim no longer
+    matches the user. With `JWT_TRUST_USER_CLAIMS` enabled, read-only requests
+    carrying the profile claims added by MyTokenObtainPairSerializer skip the
+    lookup entirely.
+    """
+
+    def authenticate(self, request):
+        self.trust_claims = (
+            settings.JWT_TRUST_USER_CLAIMS and request.method in SAFE_METHODS
+        )
+        return super().authenticate(request)
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if revocation_list.is_revoked(validated_token[api_settings.JTI_CLAIM]):
+            raise InvalidToken("Token has been revoked")
+        return validated_token
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        token_version = validated_token.get("token_version", 0)
+
+        if getattr(self, "trust_claims", False):
+            user = self.get_user_from_claims(validated_token)
+            if user is not None:
+                return user
+
+        key = CustomUser.auth_cache_key(user_id, token_version)
+        fields = cache.get(key)
+        if fields is None:
+            fields = (
+                CustomUser.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values(*CustomUser.AUTH_CACHE_FIELDS)
+                .first()
+            )
+            if fields is None:
+                raise AuthenticationFailed("User not found", code="user_not_found")
+            cache.set(key, fields, settings.JWT_USER_CACHE_TIMEOUT)
+        # The other fields, the password hash among them, stay deferred
+        user = CustomUser.from_fields(fields)
+
+        self.check_user(user.is_active, user.token_version, token_version)
+        return user
+
+    def check_user(self, is_active, user_token_version, token_version):
+        if api_settings.CHECK_USER_IS_ACTIVE and not is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        if token_version != user_token_version:
+            raise AuthenticationFailed(
+                "Token is no longer valid", code="token_version_changed"
+            )
+
+    def get_user_from_claims(self, validated_token):
+        """
+        Build a user from the token's profile and permission claims, or
+        return None if the token was not issued with them (e.g. tokens of
+        staff users, or issued before a claim was added). The user is still
+        rejected if it was deactivated or its tokens revoked since.
+        """
+        claims = CustomUser.TOKEN_PROFILE_CLAIMS + CustomUser.TOKEN_PERMISSION_CLAIMS + ["image"]
+        if any(claim not in validated_token for claim in claims):
+            return None
+
+        user_id = validated_token[api_settings.USER_ID_CLAIM]
+        token_version = validated_token.get("token_version", 0)
+        state = cache.get(CustomUser.auth_state_key(user_id))
+        if state is not None:
+            self.check_user(state["is_active"], state["token_version"], token_version)
+
+        return CustomUser.from_fields({
+            "id": user_id,
+            "token_version": token_version,
+            **{claim: validated_token[claim] for claim in claims},
+        })
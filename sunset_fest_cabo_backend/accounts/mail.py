@@ -0,0 +1,109 @@
+from datetime import timedelta
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def queue_email(subject, message, from_email, recipient_list):
+    """
+    Store an email in the outbox instead of talking to the mail server on the
+    request path. The `send_queued_emails` command delivers it.
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email,
+        recipients=list(recipient_list),
+    )
+
+
+def _claim_batch(batch_size):
+    """
+    Lease a batch of due emails by pushing their next attempt into the future.
+    The lease is taken in a short transaction so the database is not locked
+    while talking to the mail server, and a crashed worker's batch simply
+    becomes due again once the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        queryset = OutgoingEmail.objects.filter(
+            status="pending", next_attempt_at__lte=now
+        ).order_by("next_attempt_at")
+        # Let several workers drain the outbox without picking the same rows
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True)
+        emails = list(queryset[:batch_size])
+        OutgoingEmail.objects.filter(id__in=[email.id for email in emails]).update(
+            next_attempt_at=now + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE)
+        )
+    return emails
+
+
+def _record_failure(email, error):
+    email.attempts += 1
+    email.last_error = str(error)
+    if email.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+        email.status = "failed"
+    else:
+        # Exponential backoff: base, 2 * base, 4 * base, ...
+        delay = settings.EMAIL_OUTBOX_RETRY_BACKOFF * 2 ** (email.attempts - 1)
+        email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+    email.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Deliver one batch of due emails over a single mail server connection.
+    Returns (claimed, sent): how many emails were taken from the outbox and
+    how many of them went out.
+    """
+    batch_size = batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE
+    sent = 0
+
+    emails = _claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    mail_connection = get_connection(fail_silently=False)
+    try:
+        mail_connection.open()
+    except Exception as e:
+        logger.warning("Could not open mail connection: %s", e)
+        for email in emails:
+            _record_failure(email, e)
+        return len(emails), 0
+
+    try:
+        for email in emails:
+            message = EmailMessage(
+                subject=email.subject,
+                body=email.body,
+                from_email=email.from_email,
+                to=email.recipients,
+                connection=mail_connection,
+            )
+            try:
+                # One message per call so a rejected recipient only retries
+                # its own email, the connection itself stays open
+                mail_connection.send_messages([message])
+            except Exception as e:
+                logger.warning("Could not send email %s: %s", email.id, e)
+                _record_failure(email, e)
+                continue
+
+            email.status = "sent"
+            email.attempts += 1
+            email.sent_at = timezone.now()
+            email.save(update_fields=["status", "attempts", "sent_at"])
+            sent += 1
+    finally:
+        mail_connection.close()
+
+    return len(emails), sent
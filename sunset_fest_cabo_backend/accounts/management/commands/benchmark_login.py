@@ -0,0 +1,74 @@
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import RequestFactory
+
+from accounts.models import CustomUser
+from accounts.serializers import MyTokenObtainPairSerializer
+
+EMAIL = "login-benchmark@example.com"
+PASSWORD = "benchmark-password"
+
+
+class Command(BaseCommand):
+    help = "Measure login throughput and password hashes per login with the configured hasher"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--logins", type=int, default=20)
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=1,
+            help="Concurrent logins, to simulate a login storm",
+        )
+
+    def handle(self, *args, **options):
+        hasher = get_hasher()
+        summary = hasher.safe_summary(hasher.encode(PASSWORD, hasher.salt()))
+        self.stdout.write(f"Hasher: {dict(summary)}")
+
+        CustomUser.objects.filter(email=EMAIL).delete()
+        CustomUser.objects.create_user(username=EMAIL, email=EMAIL, password=PASSWORD)
+        try:
+            hashes, elapsed = self.run_logins(options["logins"], options["threads"])
+        finally:
+            CustomUser.objects.filter(email=EMAIL).delete()
+
+        logins = options["logins"]
+        self.stdout.write(
+            f"{logins} logins in {elapsed:.2f}s: "
+            f"{logins / elapsed:.1f} logins/s, "
+            f"{elapsed / logins * 1000:.1f} ms/login, "
+            f"{hashes / logins:.1f} password hashes/login"
+        )
+
+    def run_logins(self, logins, threads):
+        factory = RequestFactory()
+        counter = itertools.count()
+        hasher_class = type(get_hasher())
+        verify = hasher_class.verify
+
+        def counting_verify(self, password, encoded):
+            next(counter)
+            return verify(self, password, encoded)
+
+        def login(_):
+            serializer = MyTokenObtainPairSerializer(
+                data={"email": EMAIL, "password": PASSWORD},
+                context={"request": factory.post("/api/accounts/login/")},
+            )
+            serializer.is_valid(raise_exception=True)
+            close_old_connections()
+
+        with mock.patch.object(hasher_class, "verify", counting_verify):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(login, range(logins)))
+            elapsed = time.perf_counter() - start
+
+        return next(counter), elapsed
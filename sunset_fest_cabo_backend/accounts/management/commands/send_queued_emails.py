@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches over a reused mail connection"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.EMAIL_OUTBOX_BATCH_SIZE,
+            help="Maximum number of emails sent per connection",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep when the outbox is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the outbox once and exit instead of running as a worker",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        while True:
+            claimed, sent = send_queued_emails(batch_size=batch_size)
+            if sent:
+                self.stdout.write(f"Sent {sent} email(s)")
+            # A full batch means more may be due, even if every send failed
+            if claimed < batch_size:
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
@@ -0,0 +1,34 @@
+# Generated by Django 5.2 on 2026-10-18 22:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_revokedtoken'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['is_active', 'date_joined'], name='accounts_cu_is_acti_243c63_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresettoken',
+            index=models.Index(fields=['expires_at'], name='accounts_pa_expires_01b447_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='passwordresettoken',
+            index=models.Index(fields=['is_used'], name='accounts_pa_is_used_095170_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationtoken',
+            index=models.Index(fields=['expires_at'], name='accounts_ve_expires_1a25b4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='verificationtoken',
+            index=models.Index(fields=['is_used'], name='accounts_ve_is_used_29534e_idx'),
+        ),
+    ]
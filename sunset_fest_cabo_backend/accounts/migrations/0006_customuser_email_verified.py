@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-18 23:42
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def mark_pending_signups(apps, schema_editor):
+    # Inactive accounts holding an unused verification link and no used one
+    # are still waiting on their verification email
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    VerificationToken = apps.get_model('accounts', 'VerificationToken')
+    CustomUser.objects.filter(is_active=False).filter(
+        Exists(VerificationToken.objects.filter(user=OuterRef('pk'), is_used=False))
+    ).exclude(
+        Exists(VerificationToken.objects.filter(user=OuterRef('pk'), is_used=True))
+    ).update(email_verified=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_token_purge_indexes'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='customuser',
+            name='accounts_cu_is_acti_243c63_idx',
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='email_verified',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(mark_pending_signups, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='customuser',
+            index=models.Index(fields=['email_verified', 'date_joined'], name='accounts_cu_email_v_2b35d3_idx'),
+        ),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.core.cache import cache
 from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
 import uuid
 
 class CustomUser(AbstractUser):
@@ -14,8 +16,91 @@ class CustomUser(AbstractUser):
         ('dark', 'Dark'),
     ]
     theme = models.CharField(max_length=100, choices=THEME_CHOICES, default='light')  # New field to save theme
+    # Embedded in issued JWTs, bumping it invalidates every outstanding token
+    token_version = models.PositiveIntegerField(default=0)
+    # False from signup until the verification link is followed; accounts
+    # created any other way (admin, social login) count as verified
+    email_verified = models.BooleanField(default=True)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
+
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Lets purge_expired_tokens find stale unverified accounts
+            models.Index(fields=['email_verified', 'date_joined']),
+        ]
+
+    # Claims copied into issued tokens, safe to trust on read-only requests
+    TOKEN_PROFILE_CLAIMS = ['username', 'email', 'first_name', 'is_subscribed', 'is_completed', 'theme']
+    # Claims permission checks read, so a user built from claims never loads
+    # them. Only tokens of non-staff users carry claims at all.
+    TOKEN_PERMISSION_CLAIMS = ['is_active', 'is_staff', 'is_superuser']
+    # Fields CachedJWTAuthentication caches, never the password hash
+    AUTH_CACHE_FIELDS = [
+        'id', 'username', 'email', 'first_name', 'last_name', 'image', 'is_subscribed',
+        'is_completed', 'theme', 'token_version', 'is_active', 'is_staff', 'is_superuser',
+    ]
+
+    @staticmethod
+    def auth_cache_key(user_id, token_version):
+        return f"accounts:auth_user:{user_id}:{token_version}"
+
+    @staticmethod
+    def auth_state_key(user_id):
+        return f"accounts:auth_state:{user_id}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        # The version a cached copy of this user is keyed by
+        user._cached_token_version = user.__dict__.get('token_version')
+        return user
+
+    @classmethod
+    def from_fields(cls, fields):
+        """
+        A user as loaded from the database with only `fields` ({attname:
+        value}), the others deferred, so saving it never overwrites them.
+        """
+        names = [field.attname for field in cls._meta.concrete_fields if field.attname in fields]
+        return cls.from_db('default', names, [fields[name] for name in names])
+
+    def drop_auth_cache(self, is_active=None):
+        """
+        Drop the copies cached by CachedJWTAuthentication and record the
+        state that tokens trusted from their claims alone are checked against.
+        """
+        versions = {self.token_version, getattr(self, '_cached_token_version', None)}
+        cache.delete_many(
+            [self.auth_cache_key(self.pk, version) for version in versions if version is not None]
+        )
+        # Kept for as long as an access token issued before it stays valid
+        cache.set(
+            self.auth_state_key(self.pk),
+            {
+                'is_active': self.is_active if is_active is None else is_active,
+                'token_version': self.token_version,
+            },
+            api_settings.ACCESS_TOKEN_LIFETIME.total_seconds(),
+        )
+        self._cached_token_version = self.token_version
+
+    def bump_token_version(self):
+        """
+        Invalidate every token issued to the user so far, on the next save.
+        Incremented in the database, so concurrent bumps are not lost.
+        """
+        self.token_version = models.F('token_version') + 1
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if hasattr(self.token_version, 'resolve_expression'):
+            self.refresh_from_db(fields=['token_version'])
+        self.drop_auth_cache()
+
+    def delete(self, *args, **kwargs):
+        self.drop_auth_cache(is_active=False)
+        return super().delete(*args, **kwargs)
     
 class VerificationToken(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='verification_tokens')
@@ -24,6 +109,12 @@ class VerificationToken(models.Model):
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['is_used']),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.expires_at:
             self.expires_at = timezone.now() + timezone.timedelta(hours=24)  # 24-hour expiration
@@ -42,6 +133,12 @@ class PasswordResetToken(models.Model):
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['is_used']),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.expires_at:
             self.expires_at = timezone.now() + timezone.timedelta(hours=1)  # 1-hour expiration
@@ -54,3 +151,39 @@ class PasswordResetToken(models.Model):
         return f"Token for {self.user.email} - {self.token}"
     
 
+
+class OutgoingEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True, null=True)
+    recipients = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['next_attempt_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.recipients)} ({self.status})"
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=20)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Revoked {self.token_type} token {self.jti}"
@@ -0,0 +1,12 @@
+# Most queries per request for each route, on the query budget fixture
+# (see core/query_budgets.py). Enforced by QueryBudgetTests in tests.py.
+QUERY_BUDGETS = {
+    ("register", "POST"): 5,
+    ("login", "POST"): 1,
+    ("token_refresh", "POST"): 2,
+    ("logout", "POST"): 10,
+    ("verify_email", "GET"): 4,
+    ("forgot_password", "POST"): 4,
+    ("reset_password", "POST"): 6,
+    ("current_user", "GET"): 2,
+}
@@ -0,0 +1,161 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over strings. `in` may return false positives at
+    roughly `error_rate`, never false negatives.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(value)
+        )
+
+
+class RevocationList:
+    """
+    Process-local view of the RevokedToken table.
+
+    Revoked JTIs are mirrored into a bloom filter that is topped up with rows
+    newer than the last one seen at most every JWT_REVOCATION_REFRESH_INTERVAL
+    seconds, so checking a token that was never revoked needs no query. A
+    filter hit is confirmed against the table. Every
+    JWT_REVOCATION_REBUILD_INTERVAL seconds the filter is rebuilt from the
+    rows that have not expired yet, so expired tokens stop taking up room;
+    purge_expired_tokens deletes the rows themselves. Queries run outside the
+    lock and their result is swapped in, so token checks never wait on the
+    database. Tokens revoked by another process are seen after the next
+    refresh.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.filter = self.new_filter()
+            self.last_id = 0
+            self.refreshed_at = None
+            self.refreshed_wall = None
+            self.rebuilt_at = time.monotonic()
+            # JTIs added to the filter while a rebuild reads the table, carried
+            # over into the rebuilt one; None when no rebuild is running
+            self.revoked_during_rebuild = None
+
+    def new_filter(self):
+        return BloomFilter(
+            settings.JWT_REVOCATION_CAPACITY, settings.JWT_REVOCATION_ERROR_RATE
+        )
+
+    def refresh(self, force=False):
+        now = time.monotonic()
+        with self.lock:
+            rebuild = (
+                self.revoked_during_rebuild is None
+                and now - self.rebuilt_at >= settings.JWT_REVOCATION_REBUILD_INTERVAL
+            )
+            if (
+                not (force or rebuild)
+                and self.refreshed_at is not None
+                and now - self.refreshed_at < settings.JWT_REVOCATION_REFRESH_INTERVAL
+            ):
+                return
+            # Claimed up front, so concurrent checks keep using the current
+            # filter instead of querying too
+            self.refreshed_at = now
+            if rebuild:
+                self.rebuilt_at = now
+                self.revoked_during_rebuild = []
+                new_rows = Q(expires_at__gt=timezone.now())
+            else:
+                # Rows committed out of id order by concurrent writers are
+                # caught by also rereading everything created around the
+                # last refresh
+                new_rows = Q(id__gt=self.last_id)
+                if self.refreshed_wall is not None:
+                    new_rows |= Q(
+                        created_at__gte=self.refreshed_wall - timedelta(minutes=1)
+                    )
+            wall = timezone.now()
+
+        try:
+            rows = list(RevokedToken.objects.filter(new_rows).values_list("id", "jti"))
+        except Exception:
+            if rebuild:
+                with self.lock:
+                    self.revoked_during_rebuild = None
+            raise
+        if rebuild:
+            bloom = self.new_filter()
+            for _, jti in rows:
+                bloom.add(jti)
+
+        with self.lock:
+            if rebuild:
+                for jti in self.revoked_during_rebuild:
+                    bloom.add(jti)
+                self.filter = bloom
+                self.revoked_during_rebuild = None
+            else:
+                for _, jti in rows:
+                    self.filter.add(jti)
+                if self.revoked_during_rebuild is not None:
+                    self.revoked_during_rebuild.extend(jti for _, jti in rows)
+            self.last_id = max([self.last_id, *(row_id for row_id, _ in rows)])
+            if self.refreshed_wall is None or wall > self.refreshed_wall:
+                self.refreshed_wall = wall
+
+    def is_revoked(self, jti):
+        self.refresh()
+        if jti not in self.filter:
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, token):
+        """
+        Revoke a simplejwt token (access or refresh) until it expires.
+        """
+        jti = token[api_settings.JTI_CLAIM]
+        RevokedToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                "token_type": token.token_type,
+                "expires_at": datetime.fromtimestamp(token["exp"], tz=dt_timezone.utc),
+            },
+        )
+        with self.lock:
+            self.filter.add(jti)
+            if self.revoked_during_rebuild is not None:
+                self.revoked_during_rebuild.append(jti)
+
+
+revocation_list = RevocationList()
@@ -1,10 +1,17 @@
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
-from django.core.mail import send_mail
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import (
+    TokenObtainPairSerializer,
+    TokenRefreshSerializer,
+)
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.conf import settings
 from django.urls import reverse
 import uuid
+from .mail import queue_email
 from .models import CustomUser, PasswordResetToken, VerificationToken
+from .revocation import revocation_list
 
 
 # Registration serializer with verification token
@@ -21,6 +28,7 @@ class UserSerializer(serializers.ModelSerializer):
             image=validated_data.get("image", None),
             first_name=validated_data.get("first_name", ""),
             is_active=False,  # User starts inactive
+            email_verified=False,
         )
         user.set_password(validated_data["password"])
         user.save()
@@ -28,26 +36,36 @@ class UserSerializer(serializers.ModelSerializer):
         # Create a verification token
         verification_token = VerificationToken.objects.create(user=user)
 
-        print(verification_token.token)
-        print(settings.FRONTEND_URL)
-
         rest_url = f"verify-email/{verification_token.token}/"
         # Send verification email
         verification_url = f"{settings.FRONTEND_URL}/{rest_url}"
-        send_mail(
+        queue_email(
             subject="Verify Your Email",
             message=f"Click the link to verify your email: {verification_url}\nThis link expires in 24 hours.",
             from_email=settings.FROM_EMAIL,
             recipient_list=[user.email],
-            fail_silently=False,
         )
         return user
 
 
 # Login serializer with email and is_active check
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["token_version"] = user.token_version
+        # Staff permissions are never trusted from a token, so staff users
+        # always go through the user lookup in CachedJWTAuthentication
+        if not user.is_staff:
+            for claim in CustomUser.TOKEN_PROFILE_CLAIMS + CustomUser.TOKEN_PERMISSION_CLAIMS:
+                token[claim] = getattr(user, claim)
+            token["image"] = user.image.name if user.image else ""
+        return token
+
     def validate(self, attrs):
-        credentials = {"email": attrs.get("email"), "password": attrs.get("password")}
+        # super() authenticates through the auth backends, which verify the
+        # password (and rehash it if the hasher settings changed) exactly
+        # once. Inactive, unverified accounts are rejected there as well.
         data = super().validate(attrs)
         user = self.user
         data["user"] = {
@@ -60,17 +78,18 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
             "is_completed": user.is_completed,
             "image": user.image.url if user.image else None,
         }
-        if not user.check_password(credentials["password"]):
-            raise serializers.ValidationError("Incorrect password.")
-        if not user:
-            raise serializers.ValidationError("No user found with this email.")
-        if not user.is_active:
-            raise serializers.ValidationError(
-                "Account not verified. Please check your email."
-            )
         return data
 
 
+# Token refresh serializer that honours logout
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        refresh = RefreshToken(attrs["refresh"])
+        if revocation_list.is_revoked(refresh[api_settings.JTI_CLAIM]):
+            raise InvalidToken("Token has been revoked")
+        return super().validate(attrs)
+
+
 # Forgot password serializer
 class ForgotPasswordSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -94,12 +113,11 @@ class ForgotPasswordSerializer(serializers.Serializer):
 
         # Send reset email
         # reset_url = f"{settings.FRONTEND_URL}{reverse('reset_password', args=[str(reset_token.token)])}"
-        send_mail(
+        queue_email(
             subject="Reset Your Password",
             message=f"Click the link to reset your password: {reset_url}\nThis link expires in 1 hour.",
             from_email="no-reply@yourdomain.com",
             recipient_list=[user.email],
-            fail_silently=False,
         )
 
 
@@ -124,6 +142,8 @@ class ResetPasswordSerializer(serializers.Serializer):
         reset_token = PasswordResetToken.objects.get(token=token)
         user = reset_token.user
         user.set_password(self.validated_data["password"])
+        # Sign out every session opened with the old password
+        user.bump_token_version()
         user.save()
 
         # Mark token as used
@@ -1,3 +1,425 @@
-from django.test import TestCase
+import itertools
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.query_budgets import QueryBudgetMixin
+
+from .mail import queue_email, send_queued_emails
+from .models import (
+    CustomUser,
+    OutgoingEmail,
+    PasswordResetToken,
+    RevokedToken,
+    VerificationToken,
+)
+from .query_budgets import QUERY_BUDGETS
+from .revocation import BloomFilter, revocation_list
+from .serializers import MyTokenObtainPairSerializer
+
+
+class EmailOutboxTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_registration_queues_email_without_sending(self):
+        response = self.client.post(
+            reverse("register"),
+            {"username": "ana", "email": "ana@example.com", "password": "s3cret-pass!"},
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.recipients, ["ana@example.com"])
+        self.assertEqual(email.status, "pending")
+
+    def test_worker_sends_batch_over_one_connection(self):
+        for i in range(3):
+            queue_email("Hi", "Body", "from@example.com", [f"user{i}@example.com"])
+
+        with mock.patch(
+            "accounts.mail.get_connection", wraps=mail.get_connection
+        ) as get_connection:
+            self.assertEqual(send_queued_emails(batch_size=10), (3, 3))
+
+        get_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(OutgoingEmail.objects.exclude(status="sent").exists())
+        self.assertEqual(send_queued_emails(batch_size=10), (0, 0))
+
+    @override_settings(EMAIL_OUTBOX_MAX_ATTEMPTS=2, EMAIL_OUTBOX_RETRY_BACKOFF=10)
+    def test_failed_send_is_retried_with_backoff(self):
+        email = queue_email("Hi", "Body", "from@example.com", ["user@example.com"])
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=OSError("connection reset"),
+        ):
+            self.assertEqual(send_queued_emails(), (1, 0))
+            email.refresh_from_db()
+            self.assertEqual(email.status, "pending")
+            self.assertEqual(email.attempts, 1)
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=5))
+
+            OutgoingEmail.objects.update(next_attempt_at=timezone.now())
+            send_queued_emails()
+            email.refresh_from_db()
+            self.assertEqual(email.status, "failed")
+            self.assertEqual(email.last_error, "connection reset")
+
+    def test_worker_keeps_draining_full_batches_of_failures(self):
+        for i in range(3):
+            queue_email("Hi", "Body", "from@example.com", [f"user{i}@example.com"])
+
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages",
+            side_effect=OSError("connection reset"),
+        ):
+            call_command("send_queued_emails", batch_size=2, once=True, stdout=StringIO())
+
+        self.assertFalse(OutgoingEmail.objects.filter(attempts=0).exists())
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            username="ana", email="ana@example.com", password="s3cret-pass!"
+        )
+        token = MyTokenObtainPairSerializer.get_token(self.user).access_token
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.url = reverse("current_user")
+
+    def test_user_is_resolved_from_cache(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["email"], "ana@example.com")
+
+    def test_save_invalidates_cached_user(self):
+        self.client.get(self.url)
+        self.user.first_name = "Ana"
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["first_name"], "Ana")
+
+    def test_bumped_token_version_rejects_old_tokens(self):
+        self.user.token_version += 1
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+    def test_password_reset_rejects_cached_tokens(self):
+        self.client.get(self.url)
+        reset_token = PasswordResetToken.objects.create(user=self.user)
+        APIClient().post(
+            reverse("reset_password", args=[reset_token.token]),
+            {"password": "n3w-s3cret-pass!"},
+            format="json",
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.token_version, 1)
+
+    def test_password_hash_is_not_cached(self):
+        self.client.get(self.url)
+
+        cached = cache.get(CustomUser.auth_cache_key(self.user.id, 0))
+        self.assertEqual(cached["email"], "ana@example.com")
+        self.assertNotIn("password", cached)
+
+    @override_settings(JWT_TRUST_USER_CLAIMS=True)
+    def test_trusted_claims_skip_user_lookup(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+            user = response.wsgi_request.user
+            # Permission checks read these, they must not be deferred
+            self.assertEqual((user.is_active, user.is_staff, user.is_superuser), (True, False, False))
+        self.assertEqual(response.data["username"], "ana")
+        self.assertEqual(response.data["id"], self.user.id)
+
+    @override_settings(JWT_TRUST_USER_CLAIMS=True)
+    def test_trusted_claims_reject_deactivated_user(self):
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(PASSWORD_HASHER_PBKDF2_ITERATIONS=1000)
+class LoginHashingTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            username="ana", email="ana@example.com", password="s3cret-pass!"
+        )
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post(
+            reverse("login"), {"email": "ana@example.com", "password": "s3cret-pass!"}
+        )
+
+    def test_login_verifies_password_once(self):
+        with mock.patch(
+            "accounts.hashers.TunedPBKDF2PasswordHasher.verify",
+            autospec=True,
+            return_value=True,
+        ) as verify:
+            response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify.call_count, 1)
+
+    def test_password_is_rehashed_when_work_factor_changes(self):
+        with override_settings(PASSWORD_HASHER_PBKDF2_ITERATIONS=2000):
+            response = self.login()
+
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith("pbkdf2_sha256$2000$"))
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revocation_list.reset()
+        self.user = CustomUser.objects.create_user(
+            username="ana", email="ana@example.com", password="s3cret-pass!"
+        )
+        self.refresh = MyTokenObtainPairSerializer.get_token(self.user)
+        self.client = APIClient()
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f"Bearer {self.refresh.access_token}"
+        )
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        response = self.client.post(reverse("logout"), {"refresh": str(self.refresh)})
+        self.assertEqual(response.status_code, 205)
+
+        self.assertEqual(self.client.get(reverse("current_user")).status_code, 401)
+        response = APIClient().post(
+            reverse("token_refresh"), {"refresh": str(self.refresh)}
+        )
+        self.assertEqual(response.status_code, 401)
+
+    def test_unrevoked_token_check_needs_no_query(self):
+        revocation_list.revoke(self.refresh)
+        revocation_list.refresh(force=True)
+
+        with self.assertNumQueries(0):
+            self.assertFalse(revocation_list.is_revoked("never-revoked"))
+        self.assertTrue(revocation_list.is_revoked(self.refresh["jti"]))
+
+    def test_tokens_revoked_elsewhere_are_picked_up_on_refresh(self):
+        RevokedToken.objects.create(
+            jti="other-process", token_type="access", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        revocation_list.refresh(force=True)
+        self.assertTrue(revocation_list.is_revoked("other-process"))
+
+    @override_settings(JWT_REVOCATION_REBUILD_INTERVAL=0)
+    def test_rebuild_drops_expired_entries(self):
+        RevokedToken.objects.create(
+            jti="expired", token_type="access", expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        RevokedToken.objects.create(
+            jti="live", token_type="access", expires_at=timezone.now() + timedelta(hours=1)
+        )
+        revocation_list.refresh()
+        self.assertNotIn("expired", revocation_list.filter)
+        self.assertIn("live", revocation_list.filter)
+
+    @override_settings(JWT_REVOCATION_REBUILD_INTERVAL=0)
+    def test_rebuild_queries_outside_the_lock(self):
+        held = []
+
+        def revoke_during_rebuild(execute, sql, params, many, context):
+            held.append(revocation_list.lock.locked())
+            if len(held) == 1:
+                # Another request revokes a token while the table is read
+                revocation_list.revoke(self.refresh)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(revoke_during_rebuild):
+            revocation_list.refresh()
+
+        self.assertFalse(any(held))
+        self.assertIn(self.refresh["jti"], revocation_list.filter)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        values = [f"jti-{i}" for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class PurgeExpiredTokensTests(TestCase):
+    def test_purges_expired_used_and_stale_rows(self):
+        old = timezone.now() - timedelta(days=30)
+        stale = CustomUser.objects.create_user(
+            username="stale",
+            email="stale@example.com",
+            password="x",
+            is_active=False,
+            email_verified=False,
+        )
+        # Verified long ago, never logged in and since deactivated
+        deactivated = CustomUser.objects.create_user(
+            username="deactivated",
+            email="deactivated@example.com",
+            password="x",
+            is_active=False,
+        )
+        CustomUser.objects.filter(pk__in=[stale.pk, deactivated.pk]).update(date_joined=old)
+        fresh = CustomUser.objects.create_user(
+            username="fresh",
+            email="fresh@example.com",
+            password="x",
+            is_active=False,
+            email_verified=False,
+        )
+        active = CustomUser.objects.create_user(
+            username="active", email="active@example.com", password="x"
+        )
+        valid = VerificationToken.objects.create(user=fresh)
+        VerificationToken.objects.create(user=fresh, expires_at=old)
+        VerificationToken.objects.create(user=fresh, is_used=True)
+        PasswordResetToken.objects.create(user=active, expires_at=old)
+        RevokedToken.objects.create(jti="expired", token_type="access", expires_at=old)
+        live = RevokedToken.objects.create(
+            jti="live", token_type="access", expires_at=timezone.now() + timedelta(hours=1)
+        )
+
+        call_command("purge_expired_tokens", batch_size=1, stdout=StringIO())
+
+        self.assertEqual(list(VerificationToken.objects.all()), [valid])
+        self.assertFalse(PasswordResetToken.objects.exists())
+        self.assertEqual(list(RevokedToken.objects.all()), [live])
+        self.assertEqual(
+            set(CustomUser.objects.values_list("username", flat=True)),
+            {"fresh", "active", "deactivated"},
+        )
+
+    def test_signups_are_unverified_until_the_link_is_followed(self):
+        response = APIClient().post(
+            reverse("register"),
+            {"username": "ana", "email": "ana@example.com", "password": "s3cret-pass!"},
+        )
+        self.assertEqual(response.status_code, 201)
+        user = CustomUser.objects.get(email="ana@example.com")
+        self.assertFalse(user.email_verified)
+
+        token = VerificationToken.objects.get(user=user)
+        APIClient().get(reverse("verify_email", args=[token.token]))
+        user.refresh_from_db()
+        self.assertTrue(user.email_verified)
+
+
+@override_settings(PASSWORD_HASHER_PBKDF2_ITERATIONS=1000)
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = "accounts.urls"
+    query_budgets = QUERY_BUDGETS
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user_ids = itertools.count()
+
+    def count_queries(self, route, prepare):
+        # Start from an empty revocation list, as a new worker would
+        revocation_list.reset()
+        return super().count_queries(route, prepare)
+
+    def new_user(self, **kwargs):
+        i = next(self.user_ids)
+        return CustomUser.objects.create_user(
+            username=f"guest{i}",
+            email=f"guest{i}@example.com",
+            password="s3cret-pass!",
+            **kwargs,
+        )
+
+    def post(self, name, data, args=(), token=None):
+        def send():
+            if token is not None:
+                self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+            try:
+                return self.client.post(reverse(name, args=args), data, format="json")
+            finally:
+                self.client.credentials()
+
+        return send
+
+    def register(self):
+        i = next(self.user_ids)
+        return self.post(
+            "register",
+            {"username": f"new{i}", "email": f"new{i}@example.com", "password": "s3cret-pass!"},
+        )
+
+    def login(self):
+        user = self.new_user()
+        return self.post("login", {"email": user.email, "password": "s3cret-pass!"})
+
+    def token_refresh(self):
+        refresh = MyTokenObtainPairSerializer.get_token(self.new_user())
+        return self.post("token_refresh", {"refresh": str(refresh)})
+
+    def logout(self):
+        refresh = MyTokenObtainPairSerializer.get_token(self.new_user())
+        return self.post("logout", {"refresh": str(refresh)}, token=refresh)
+
+    def verify_email(self):
+        token = VerificationToken.objects.create(user=self.new_user(is_active=False))
+        url = reverse("verify_email", args=[token.token])
+        return lambda: self.client.get(url)
+
+    def forgot_password(self):
+        return self.post("forgot_password", {"email": self.new_user().email})
+
+    def reset_password(self):
+        token = PasswordResetToken.objects.create(user=self.new_user())
+        return self.post("reset_password", {"password": "n3w-s3cret!"}, args=[token.token])
+
+    def current_user(self):
+        token = MyTokenObtainPairSerializer.get_token(self.new_user())
+
+        def send():
+            self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token.access_token}")
+            try:
+                return self.client.get(reverse("current_user"))
+            finally:
+                self.client.credentials()
+
+        return send
+
+    def route_requests(self):
+        return {
+            ("register", "POST"): self.register,
+            ("login", "POST"): self.login,
+            ("token_refresh", "POST"): self.token_refresh,
+            ("logout", "POST"): self.logout,
+            ("verify_email", "GET"): self.verify_email,
+            ("forgot_password", "POST"): self.forgot_password,
+            ("reset_password", "POST"): self.reset_password,
+            ("current_user", "GET"): self.current_user,
+        }
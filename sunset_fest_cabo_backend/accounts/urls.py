@@ -2,14 +2,13 @@ from django.urls import path
 from .views import (
     RegisterView, MyTokenObtainPairView, LogoutView,
     VerifyEmailView, ForgotPasswordView, ResetPasswordView,
-    CurrentUserView,
+    CurrentUserView, MyTokenRefreshView,
 )
-from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', MyTokenObtainPairView.as_view(), name='login'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('token/refresh/', MyTokenRefreshView.as_view(), name='token_refresh'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('verify-email/<str:token>/', VerifyEmailView.as_view(), name='verify_email'),
     path('forgot-password/', ForgotPasswordView.as_view(), name='forgot_password'),
@@ -3,11 +3,13 @@ from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
+from .revocation import revocation_list
 from .serializers import (
     UserSerializer,
     MyTokenObtainPairSerializer,
+    MyTokenRefreshSerializer,
     ForgotPasswordSerializer,
     ResetPasswordSerializer,
 )
@@ -26,7 +28,12 @@ class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
 
-# Logout view (unchanged)
+# Token refresh view, rejects revoked refresh tokens
+class MyTokenRefreshView(TokenRefreshView):
+    serializer_class = MyTokenRefreshSerializer
+
+
+# Logout view, revokes the refresh token and the access token in use
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -38,8 +45,9 @@ class LogoutView(APIView):
                     {"error": "Refresh token is required"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            token = RefreshToken(refresh_token)
-            token.blacklist()
+            revocation_list.revoke(RefreshToken(refresh_token))
+            if request.auth is not None:
+                revocation_list.revoke(request.auth)
             return Response(
                 {"message": "Successfully logged out"},
                 status=status.HTTP_205_RESET_CONTENT,
@@ -66,6 +74,7 @@ class VerifyEmailView(APIView):
                     {"message": "Email already verified"}, status=status.HTTP_200_OK
                 )
             user.is_active = True
+            user.email_verified = True
             user.save()
             verification_token.is_used = True  # Mark token as used
             verification_token.save()
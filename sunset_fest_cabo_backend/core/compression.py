@@ -0,0 +1,129 @@
+"""
+Negotiated gzip/brotli compression of API responses.
+
+CompressionMiddleware compresses compressible responses of at least
+COMPRESSION_MIN_SIZE bytes with the best encoding the client accepts.
+Views that cache their rendered output can compress it once with
+`precompress` and attach the result as `response.precompressed`, which is
+then served as-is instead of being compressed again.
+"""
+
+import gzip
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_TYPES = re.compile(r"^(application/(json|.*\+json)|text/(?!event-stream))")
+
+
+def encodings():
+    # Preferred first
+    return ("br", "gzip") if brotli else ("gzip",)
+
+
+def compress(data, encoding, level=None):
+    if encoding == "br":
+        return brotli.compress(data, quality=level or settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=level or settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def precompress(data, best=False):
+    """
+    Compress `data` once in every encoding, for responses whose body is
+    cached and reused. Returns {encoding: bytes}.
+
+    The levels are the middleware's, since a cache miss compresses on the
+    request path; `best` uses the highest ones, for compression done off
+    the request path, where their cost is paid by no client.
+    """
+    levels = {"br": 11, "gzip": 9} if best else {}
+    return {
+        encoding: compress(data, encoding, level=levels.get(encoding))
+        for encoding in encodings()
+    }
+
+
+def accepted_encoding(accept_encoding, available):
+    """
+    Pick the first of `available` that the Accept-Encoding header allows,
+    honouring q=0 and `*`. Returns None if none is acceptable.
+    """
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().lower().partition(";")
+        quality = 1.0
+        match = re.search(r"q=([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if coding:
+            weights[coding.strip()] = quality
+
+    ranked = [
+        (weights.get(encoding, weights.get("*", 0.0)), -index, encoding)
+        for index, encoding in enumerate(available)
+    ]
+    quality, _, encoding = max(ranked)
+    return encoding if quality > 0 else None
+
+
+class CompressionMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    def process_response(self, request, response):
+        # Streams (server-sent events included) are left alone, they have to
+        # reach the client chunk by chunk
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or not COMPRESSIBLE_TYPES.match(response.get("Content-Type", ""))
+        ):
+            return response
+
+        precompressed = getattr(response, "precompressed", None)
+        if precompressed is None and len(response.content) < settings.COMPRESSION_MIN_SIZE:
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = accepted_encoding(
+            request.headers.get("Accept-Encoding", ""),
+            [e for e in encodings() if precompressed is None or e in precompressed],
+        )
+        if encoding is None:
+            return response
+
+        if precompressed is not None:
+            response.content = precompressed[encoding]
+        else:
+            response.content = compress(response.content, encoding)
+        response["Content-Length"] = str(len(response.content))
+        response["Content-Encoding"] = encoding
+
+        # The body differs from the identity one, a strong ETag would lie
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
@@ -0,0 +1,158 @@
+"""
+Structured, non-blocking logging.
+
+Records are handed to QueueHandler, which only puts them on a queue; a
+QueueListener thread formats them as one JSON object per line and writes
+them out, so a request never waits on log I/O. RequestIdFilter tags each
+record with the id of the request it was logged for (core.middleware), and
+JSONFormatter redacts tokens, secrets and email addresses from the message,
+the `extra` fields and tracebacks before anything is written.
+
+Wired up by LOGGING in the settings.
+"""
+
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import re
+from datetime import datetime, timezone
+
+import orjson
+
+from .middleware import current_request_id
+
+REDACTED = "[redacted]"
+# Keys whose values are never logged, matched as substrings of the
+# lowercased key, plus OAuth authorization codes
+SENSITIVE_KEYS = ("password", "token", "secret", "authorization", "cookie", "api_key")
+SENSITIVE_EXACT_KEYS = {"code"}
+
+SENSITIVE_PATTERNS = [
+    # JWTs
+    (re.compile(r"\beyJ[\w-]+\.[\w-]+\.[\w-]+"), REDACTED),
+    (re.compile(r"\b(Bearer|Basic)\s+\S+", re.IGNORECASE), rf"\1 {REDACTED}"),
+    # Stripe keys and webhook secrets
+    (re.compile(r"\b(?:sk|rk|pk)_(?:live|test)_\w+|\bwhsec_\w+"), REDACTED),
+    # Credentials in query strings and form bodies
+    (
+        re.compile(
+            r"\b((?:access_|refresh_|id_)?token|code|password|client_secret|"
+            r"api_key|key)=[^&\s\"']+",
+            re.IGNORECASE,
+        ),
+        rf"\1={REDACTED}",
+    ),
+    # Email addresses keep their domain only
+    (re.compile(r"\b[\w.+-]+@([\w-]+(?:\.[\w-]+)+)\b"), r"***@\1"),
+]
+
+# Attributes every LogRecord has; anything else came in through `extra`
+RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+
+def redact(value):
+    if isinstance(value, str):
+        for pattern, replacement in SENSITIVE_PATTERNS:
+            value = pattern.sub(replacement, value)
+        return value
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if is_sensitive(key) else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item) for item in value]
+    return value
+
+
+def is_sensitive(key):
+    key = str(key).lower()
+    return key in SENSITIVE_EXACT_KEYS or any(part in key for part in SENSITIVE_KEYS)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = current_request_id.get()
+        if record.request_id is None:
+            # django.request logs responses after the middleware has returned
+            record.request_id = getattr(getattr(record, "request", None), "id", None)
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = REDACTED if is_sensitive(key) else value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = record.stack_info
+        return orjson.dumps(redact(entry), default=str).decode()
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues records for a QueueListener thread that writes them to `stream`
+    (stderr by default) with this handler's formatter.
+
+    The listener is started by the first record each process emits rather
+    than when LOGGING is configured, so workers forked from a preloaded app
+    (gunicorn --preload, the autoreloader) start their own instead of
+    queueing to a thread that only exists in the parent.
+    """
+
+    def __init__(self, stream=None):
+        super().__init__(queue.SimpleQueue())
+        self.target = logging.StreamHandler(stream)
+        self.listener = None
+        self.pid = None
+
+    def setFormatter(self, fmt):
+        # Formatting happens on the listener thread
+        self.target.setFormatter(fmt)
+
+    def emit(self, record):
+        # Runs under the handler lock, which logging resets after a fork
+        if self.pid != os.getpid():
+            self.start_listener()
+        super().emit(record)
+
+    def start_listener(self):
+        # Records queued in the parent before the fork are the parent's
+        self.queue = queue.SimpleQueue()
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        self.pid = os.getpid()
+
+    def close(self):
+        # Called by logging.shutdown at exit; writes out what is queued
+        with self.lock:
+            if self.listener is not None and self.pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self.pid = None
+        self.target.close()
+        super().close()
+
+    def prepare(self, record):
+        # Everything that depends on the caller's state is resolved here;
+        # the JSON is built by the listener
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
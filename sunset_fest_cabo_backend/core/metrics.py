@@ -0,0 +1,401 @@
+"""
+In-process metrics with Prometheus text exposition.
+
+Counters, gauges and histograms are declared at module level by the apps
+(events/metrics.py, payments/metrics.py) and updated in place. `metrics_view`
+renders every registered metric in the Prometheus text format for scrapers
+presenting METRICS_TOKEN as a bearer token, or connecting directly from one
+of METRICS_ALLOWED_IPS (empty by default). The allow-list is ignored for
+requests carrying forwarding headers: behind a reverse proxy on the same
+host every request comes from loopback.
+
+Under a multi-process server each worker only sees its own updates. With
+METRICS_DIR set, every process writes its values to
+`<METRICS_DIR>/<pid>-<random>.json` (at most every METRICS_FLUSH_INTERVAL
+seconds, at exit, and before it serves a scrape) and the scrape merges all
+files: counters and histograms are summed over every process that ever ran,
+so they survive worker restarts, while gauges are summed over live processes
+only. The name is never reused, even by a process that gets the pid of an
+exited one. Files of exited processes are folded into `archive.json` by the
+next scrape, which adds their counters and histograms to its totals, drops
+their gauges and removes them, so the directory does not grow with every
+restart. Gauges with a `function` are computed when scraped and are not
+shared.
+"""
+
+import atexit
+import fcntl
+import hmac
+import json
+import math
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.http import Http404, HttpResponse
+
+PREFIX = "sunsetfest_"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ARCHIVE = "archive.json"
+
+
+def format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\""))
+        for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes the labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def merge(self, total, value):
+        return total + value
+
+    def samples(self, values):
+        """[(suffix, ((label, value), ...), sample value)] for exposition."""
+        return [
+            ("", tuple(zip(self.labelnames, key)), value)
+            for key, value in sorted(values.items())
+        ]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, function=None):
+        # `function()` returns the value, or {label values tuple: value}
+        self.function = function
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+        self.registry.changed()
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        self.registry.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self):
+        if self.function is None:
+            return None
+        value = self.function()
+        return value if isinstance(value, dict) else {(): value}
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            # [count per bucket..., sum]
+            state = self.values.setdefault(key, [0] * len(self.buckets) + [0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-1] += value
+        self.registry.changed()
+
+    @contextmanager
+    def timer(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def time(self, **labels):
+        """Decorator observing the duration of each call, sync or async."""
+
+        def decorator(function):
+            if iscoroutinefunction(function):
+
+                @wraps(function)
+                async def wrapper(*args, **kwargs):
+                    with self.timer(**labels):
+                        return await function(*args, **kwargs)
+
+            else:
+
+                @wraps(function)
+                def wrapper(*args, **kwargs):
+                    with self.timer(**labels):
+                        return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def merge(self, total, value):
+        return [a + b for a, b in zip(total, value)]
+
+    def samples(self, values):
+        samples = []
+        for key, state in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                samples.append(("_bucket", labels + (("le", format_value(bound)),), cumulative))
+            samples.append(("_sum", labels, state[-1]))
+            samples.append(("_count", labels, cumulative))
+        return samples
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(temp_path, path)
+
+
+def process_files(directory):
+    """{file name: pid} of the per-process files in `directory`."""
+    return {
+        filename: int(filename.split("-", 1)[0].removesuffix(".json"))
+        for filename in os.listdir(directory)
+        if filename.endswith(".json") and filename != ARCHIVE
+    }
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.flushed_at = 0.0
+        self.pid = None
+        self.filename = None
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def changed(self):
+        if (
+            settings.METRICS_DIR
+            and time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL
+        ):
+            self.flush()
+
+    def after_fork(self):
+        # The parent's values are in the parent's file
+        self.lock = threading.Lock()
+        self.flushed_at = 0.0
+        for metric in self.metrics.values():
+            metric.lock = threading.Lock()
+            metric.values = {}
+
+    def state(self):
+        state = {}
+        for metric in self.metrics.values():
+            with metric.lock:
+                values = [
+                    [list(key), list(value) if isinstance(value, list) else value]
+                    for key, value in metric.values.items()
+                ]
+            if values:
+                state[metric.name] = values
+        return state
+
+    def add(self, totals, name, values):
+        """Add a file's `values` of metric `name` to `totals`."""
+        metric = self.metrics.get(name)
+        if metric is None:
+            return
+        totals = totals.setdefault(name, {})
+        for key, value in values:
+            key = tuple(key)
+            totals[key] = metric.merge(totals[key], value) if key in totals else value
+
+    def flush(self):
+        """Write this process's values to METRICS_DIR."""
+        directory = settings.METRICS_DIR
+        if not directory:
+            return
+        with self.lock:
+            self.flushed_at = time.monotonic()
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.filename = f"{self.pid}-{uuid.uuid4().hex[:12]}.json"
+            os.makedirs(directory, exist_ok=True)
+            write_json(os.path.join(directory, self.filename), self.state())
+
+    def archive(self, directory):
+        """
+        Fold the files of exited processes into ARCHIVE and remove them. The
+        archive lists the files it already holds, so a file whose removal
+        was interrupted is not added twice.
+        """
+        with open(os.path.join(directory, f"{ARCHIVE}.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = [
+                filename
+                for filename, pid in process_files(directory).items()
+                if not pid_alive(pid)
+            ]
+            if not dead:
+                return
+            path = os.path.join(directory, ARCHIVE)
+            archive = read_json(path) or {"files": [], "metrics": {}}
+            totals = {}
+            for name, values in archive["metrics"].items():
+                self.add(totals, name, values)
+            for filename in set(dead) - set(archive["files"]):
+                state = read_json(os.path.join(directory, filename)) or {}
+                for name, values in state.items():
+                    if not isinstance(self.metrics.get(name), Gauge):
+                        self.add(totals, name, values)
+            write_json(
+                path,
+                {
+                    "files": dead,
+                    "metrics": {
+                        name: [[list(key), value] for key, value in values.items()]
+                        for name, values in totals.items()
+                    },
+                },
+            )
+            for filename in dead:
+                try:
+                    os.remove(os.path.join(directory, filename))
+                except FileNotFoundError:
+                    pass
+
+    def collect(self):
+        """{metric name: {label values: value}}, over every process."""
+        if not settings.METRICS_DIR:
+            return {
+                name: dict(metric.values) for name, metric in self.metrics.items()
+            }
+
+        self.flush()
+        directory = settings.METRICS_DIR
+        self.archive(directory)
+        merged = {}
+        archive = read_json(os.path.join(directory, ARCHIVE)) or {"files": [], "metrics": {}}
+        for name, values in archive["metrics"].items():
+            self.add(merged, name, values)
+        for filename, pid in process_files(directory).items():
+            if filename in archive["files"]:
+                continue
+            state = read_json(os.path.join(directory, filename))
+            if state is None:
+                continue
+            alive = pid_alive(pid)
+            for name, values in state.items():
+                if alive or not isinstance(self.metrics.get(name), Gauge):
+                    self.add(merged, name, values)
+        return merged
+
+    def exposition(self):
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            values = collected.get(name, {})
+            if isinstance(metric, Gauge) and metric.function is not None:
+                values = metric.collect()
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type}")
+            for suffix, labels, value in metric.samples(values):
+                lines.append(f"{name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+os.register_at_fork(after_in_child=REGISTRY.after_fork)
+
+
+# Set by reverse proxies; REMOTE_ADDR is then the proxy's, not the client's
+FORWARDED_HEADERS = ("HTTP_X_FORWARDED_FOR", "HTTP_FORWARDED", "HTTP_X_REAL_IP")
+
+
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    forwarded = any(header in request.META for header in FORWARDED_HEADERS)
+    allowed_ip = (
+        not forwarded and request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+    )
+    authorized = allowed_ip or (
+        token
+        and hmac.compare_digest(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+    )
+    if not authorized:
+        # Not advertised to the outside
+        raise Http404
+    return HttpResponse(REGISTRY.exposition(), content_type=CONTENT_TYPE)
@@ -0,0 +1,112 @@
+import re
+import uuid
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .routers import replica_reads
+
+PIN_COOKIE = "pin_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+REQUEST_ID_HEADER = "X-Request-ID"
+# Ids from upstream proxies are used in file names, accept only plain ones
+VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+current_request_id = ContextVar("current_request_id", default=None)
+
+
+class RequestIdMiddleware:
+    """
+    Gives every request an id, `request.id`, taken from an upstream
+    X-Request-ID header when it has a usable one. The id is echoed in the
+    response and available to code without the request through
+    `current_request_id`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_request_id.set(self.assign(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request.id
+        return response
+
+    async def __acall__(self, request):
+        token = current_request_id.set(self.assign(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_id.reset(token)
+        response[REQUEST_ID_HEADER] = request.id
+        return response
+
+    def assign(self, request):
+        request_id = request.headers.get(REQUEST_ID_HEADER, "")
+        if not VALID_REQUEST_ID.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.id = request_id
+        return request_id
+
+
+class ReplicaPinningMiddleware:
+    """
+    Lets read-only requests use the catalog replica (core.routers), with
+    read-your-writes: a request that writes, and any request from the same
+    client within REPLICA_PIN_SECONDS after it, reads from the primary only.
+
+    Works natively in both sync and async stacks, so async views are not
+    pushed onto a thread by it.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = replica_reads.set(self.use_replica(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        token = replica_reads.set(self.use_replica(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            replica_reads.reset(token)
+        return self.pin(request, response)
+
+    def use_replica(self, request):
+        return request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and settings.REPLICA_DATABASE_ALIAS:
+            response.set_cookie(
+                PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
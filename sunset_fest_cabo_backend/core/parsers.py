@@ -0,0 +1,15 @@
+import orjson
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+
+class ORJSONParser(parsers.JSONParser):
+    """
+    JSONParser on orjson. Like the stock parser it rejects NaN and Infinity.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
@@ -0,0 +1,159 @@
+"""
+Per-route query budgets.
+
+Each app declares the most queries every one of its routes may run in one
+request, in `<app>/query_budgets.py`:
+
+    QUERY_BUDGETS = {
+        # (url name, method): max queries
+        ("event-list", "GET"): 9,
+    }
+
+Budgets hold on the BUDGET_CATALOG fixture. QueryBudgetMixin, mixed into a
+TestCase in the app's tests, sends a request to every budgeted route and
+fails with the captured SQL when one goes over budget. It then adds bookings
+and holds (events.seed.seed_traffic), and a second catalog as large as the
+first, and fails if any route's query count changed, so an N+1 shows up even
+while it still fits the budget. Every named route of the app's urlconf must
+have a budget.
+"""
+
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver
+from django.utils.module_loading import import_module
+
+# Catalog the budgets are measured on, see events.seed.seed_catalog
+BUDGET_CATALOG = {
+    "events": 2,
+    "dates": 2,
+    "plans": 2,
+    "accommodations": 2,
+    "rooms": 2,
+    "add_ons": 2,
+    "time_slots": 3,
+}
+
+
+def route_names(urlconf):
+    """(namespaced) names of every route in the urlconf module."""
+
+    def walk(patterns, namespace):
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                nested = namespace
+                if pattern.namespace:
+                    nested = f"{namespace}{pattern.namespace}:"
+                yield from walk(pattern.url_patterns, nested)
+            elif isinstance(pattern, URLPattern) and pattern.name:
+                yield namespace + pattern.name
+
+    module = import_module(urlconf)
+    namespace = f"{module.app_name}:" if getattr(module, "app_name", None) else ""
+    return set(walk(module.urlpatterns, namespace))
+
+
+def format_queries(queries):
+    return "\n".join(
+        f"{i}. {query['sql']}" for i, query in enumerate(queries, start=1)
+    )
+
+
+class QueryBudgetMixin:
+    """
+    Mix into a TestCase with `urlconf` and `query_budgets` set, and implement
+    `route_requests`.
+    """
+
+    urlconf = None
+    query_budgets = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        from events.seed import seed_catalog
+
+        seed_catalog(**BUDGET_CATALOG)
+
+    def setUp(self):
+        super().setUp()
+        # Reads on the primary, which is the only one seeing the fixture, and
+        # writes inline so they are counted
+        self.enterContext(
+            override_settings(REPLICA_DATABASE_ALIAS=None, SQLITE_WRITE_QUEUE=False)
+        )
+
+    def route_requests(self):
+        """
+        {(url name, method): prepare}. `prepare()` sets up whatever its
+        request needs and returns a callable that sends it and returns the
+        response; only that call is counted. `prepare` may be called more
+        than once.
+        """
+        raise NotImplementedError
+
+    def add_traffic(self):
+        from events.seed import seed_traffic
+
+        seed_traffic()
+
+    def add_catalog(self):
+        from events.seed import seed_catalog, seed_traffic
+
+        seed_catalog(**BUDGET_CATALOG)
+        seed_traffic()
+
+    def count_queries(self, route, prepare):
+        send = prepare()
+        # Cold caches and a new visitor, the budget is for a request that
+        # does all of its work
+        cache.clear()
+        self.client.cookies.clear()
+        self.async_client.cookies.clear()
+        with CaptureQueriesContext(connection) as captured:
+            response = send()
+        self.assertLess(
+            response.status_code,
+            400,
+            f"{route} returned {response.status_code}: "
+            f"{getattr(response, 'content', b'')[:300]!r}",
+        )
+        return captured.captured_queries
+
+    def test_every_route_has_a_budget(self):
+        routes = route_names(self.urlconf)
+        budgeted = {name for name, _ in self.query_budgets}
+        self.assertEqual(routes - budgeted, set(), "Routes without a query budget")
+        self.assertEqual(budgeted - routes, set(), "Budgets for unknown routes")
+
+    def test_routes_stay_within_budget(self):
+        requests = self.route_requests()
+        self.assertEqual(set(requests), set(self.query_budgets))
+
+        counts = {}
+        for route, budget in self.query_budgets.items():
+            with self.subTest(route=route):
+                queries = self.count_queries(route, requests[route])
+                counts[route] = len(queries)
+                self.assertLessEqual(
+                    len(queries),
+                    budget,
+                    f"{route} ran {len(queries)} queries, its budget is {budget}:\n"
+                    + format_queries(queries),
+                )
+
+        for grow, grown in (
+            (self.add_traffic, "with more bookings and holds"),
+            (self.add_catalog, "on a catalog twice as large"),
+        ):
+            grow()
+            for route, count in counts.items():
+                with self.subTest(route=route, grown=grown):
+                    queries = self.count_queries(route, requests[route])
+                    self.assertEqual(
+                        len(queries),
+                        count,
+                        f"{route} ran {len(queries)} queries {grown}, {count} "
+                        f"before:\n" + format_queries(queries),
+                    )
@@ -0,0 +1,85 @@
+"""
+orjson and MessagePack renderers.
+
+Both produce the same representation as DRF's JSONRenderer: UUIDs and
+datetimes (with a Z suffix for UTC) as strings, and Decimals that reach the
+renderer as numbers (serializer DecimalFields have already turned theirs
+into strings). orjson encodes UUIDs, datetimes and the serializers'
+dict/list subclasses natively; the rest goes through `default`.
+"""
+
+import datetime
+import decimal
+import uuid
+
+import orjson
+from django.db.models.query import QuerySet
+from django.utils.functional import Promise
+from rest_framework import renderers
+
+try:
+    import msgpack
+except ImportError:  # MessagePack is optional, see REST_FRAMEWORK in settings
+    msgpack = None
+
+
+def default(obj):
+    """
+    Encode what orjson and msgpack cannot, as DRF's JSONEncoder does.
+    """
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, datetime.timedelta):
+        return str(obj.total_seconds())
+    if isinstance(obj, QuerySet):
+        return list(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    if hasattr(obj, "__getitem__") and not isinstance(obj, str):
+        try:
+            return dict(obj)
+        except (TypeError, ValueError):
+            pass
+    if hasattr(obj, "__iter__"):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not serializable")
+
+
+def default_msgpack(obj):
+    # msgpack has no UUID or datetime types, send them as JSON would
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, datetime.datetime):
+        representation = obj.isoformat()
+        if representation.endswith("+00:00"):
+            representation = representation[:-6] + "Z"
+        return representation
+    if isinstance(obj, (datetime.date, datetime.time)):
+        return obj.isoformat()
+    return default(obj)
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        option = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=default, option=option)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(data, default=default_msgpack, use_bin_type=True)
@@ -0,0 +1,58 @@
+"""
+Database router sending catalog reads to a read replica.
+
+Catalog models are reference data that only change through the admin, so
+they can be read from the replica. Everything else, in particular holds,
+bookings and the availability computed from them, always uses the primary;
+catalog querysets annotated with availability (`with_availability()` in
+events.models) pin themselves to the primary for that reason.
+
+The replica is only used while `replica_reads` is set. ReplicaPinningMiddleware
+sets it for read-only requests, except for a short window after the same
+client wrote something. Writes, management commands and background threads
+read from the primary.
+"""
+
+from contextvars import ContextVar
+
+from django.conf import settings
+
+CATALOG_MODELS = {
+    "events.event",
+    "events.eventdate",
+    "events.feature",
+    "events.pricingplan",
+    "events.pricingplan_feature",
+    "events.groupsize",
+    "events.accommodation",
+    "events.accommodationimage",
+    "events.room",
+    "events.roomimage",
+    "events.addon",
+    "events.addontimeslot",
+}
+
+replica_reads = ContextVar("replica_reads", default=False)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replica = settings.REPLICA_DATABASE_ALIAS
+        if (
+            replica
+            and replica_reads.get()
+            and model._meta.label_lower in CATALOG_MODELS
+        ):
+            return replica
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is populated by replication, never migrated directly
+        return db == "default"
@@ -0,0 +1,119 @@
+"""
+Read-only serializers over `.values()` rows.
+
+A ValuesSerializer mirrors an existing ModelSerializer (`serializer_class`)
+for immutable reference data. It reads only the columns that serializer
+outputs, as plain dicts, and converts them with a field map built once per
+class from the serializer's own fields. Model instances are never built,
+and the output is identical to the serializer it mirrors.
+
+Only flat fields are supported. Nested lists are assembled by
+ValuesListField, which renders a related manager through a ValuesSerializer,
+from the prefetched instances when the relation was prefetched.
+"""
+
+from django.db.models.fields.files import FieldFile
+from rest_framework import serializers
+
+
+def file_url(storage, name, context):
+    # Same as serializers.FileField with use_url
+    if not name:
+        return None
+    url = storage.url(name)
+    request = context.get("request")
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+class ValuesSerializer:
+    serializer_class = None
+
+    _field_maps = {}
+
+    @classmethod
+    def field_map(cls):
+        """
+        [(output name, values() lookup, convert(value, context))], in the
+        serializer's field order.
+        """
+        if cls not in cls._field_maps:
+            model = cls.serializer_class.Meta.model
+            field_map = []
+            for name, field in cls.serializer_class().fields.items():
+                lookup = field.source.replace(".", "__")
+                if hasattr(field, "values_representation"):
+                    convert = field.values_representation
+                elif isinstance(field, serializers.FileField):
+                    storage = model._meta.get_field(lookup).storage
+
+                    def convert(value, context, storage=storage):
+                        return file_url(storage, value, context)
+
+                elif isinstance(
+                    field,
+                    (serializers.BaseSerializer, serializers.SerializerMethodField),
+                ):
+                    raise TypeError(
+                        f"{cls.__name__} cannot mirror the nested or computed field {name}"
+                    )
+                else:
+
+                    def convert(value, context, to_representation=field.to_representation):
+                        return to_representation(value)
+
+                field_map.append((name, lookup, convert))
+            cls._field_maps[cls] = field_map
+        return cls._field_maps[cls]
+
+    @classmethod
+    def serialize(cls, queryset, context=None):
+        rows = queryset.values(*(lookup for _, lookup, _ in cls.field_map()))
+        return cls.serialize_rows(rows, context)
+
+    @classmethod
+    def serialize_instances(cls, instances, context=None):
+        """Serialize model instances that are already loaded, e.g. prefetched."""
+        return cls.serialize_rows([cls.row(instance) for instance in instances], context)
+
+    @classmethod
+    def serialize_rows(cls, rows, context=None):
+        context = context or {}
+        field_map = cls.field_map()
+        return [
+            {
+                name: None if row[lookup] is None else convert(row[lookup], context)
+                for name, lookup, convert in field_map
+            }
+            for row in rows
+        ]
+
+    @classmethod
+    def row(cls, instance):
+        """The values() row of a model instance."""
+        row = {}
+        for _, lookup, _ in cls.field_map():
+            value = instance
+            for attname in lookup.split("__"):
+                value = getattr(value, attname)
+            # values() gives the stored name of a file
+            row[lookup] = value.name if isinstance(value, FieldFile) else value
+        return row
+
+
+class ValuesListField(serializers.Field):
+    """
+    Read-only nested list of a related manager, rendered by a
+    ValuesSerializer instead of a nested ModelSerializer.
+    """
+
+    def __init__(self, values_serializer, **kwargs):
+        self.values_serializer = values_serializer
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, manager):
+        queryset = manager.all()
+        if queryset._result_cache is not None:
+            # Prefetched, the manager hands back the cached queryset
+            return self.values_serializer.serialize_instances(queryset, self.context)
+        return self.values_serializer.serialize(queryset, self.context)
@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from dotenv import load_dotenv
+import importlib.util
 import os
 from datetime import timedelta
 
@@ -50,7 +51,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.RequestIdMiddleware",
+    "core.timing.RequestTimingMiddleware",
+    "core.slow_queries.SlowQueryMiddleware",
+    "core.tracing.TracingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "core.compression.CompressionMiddleware",
+    "core.middleware.ReplicaPinningMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -58,6 +65,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.profiling.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -88,6 +96,20 @@ LOGIN_FIELD = "email"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Uploads are stored under a hash of their content (core.storage)
+STORAGES = {
+    "default": {"BACKEND": "core.storage.ContentAddressedStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+SERVE_MEDIA = os.getenv("SERVE_MEDIA", str(DEBUG)) == "True"
+MEDIA_CACHE_MAX_AGE = 365 * 24 * 60 * 60  # seconds, for content-addressed files
+
+# Responsive variants of catalog images (generate_image_variants worker)
+IMAGE_VARIANT_WIDTHS = [320, 640, 1024, 1600]
+IMAGE_VARIANT_FORMATS = ["webp", "jpeg"]
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", os.cpu_count() or 1))
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
@@ -113,13 +135,80 @@ CORS_ALLOW_HEADERS = [
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
         "rest_framework.authentication.SessionAuthentication",  # Optional for browsable API
     ],
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        "core.renderers.ORJSONRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.ORJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
     ],
 }
+# MessagePack for clients sending "Accept: application/msgpack", if installed
+if importlib.util.find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append("core.renderers.MessagePackRenderer")
+# Compression of API responses (core.compression)
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))  # bytes
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_BROTLI_QUALITY = 5
+# Seconds a cached catalog list response (events.snapshots) is served for
+CATALOG_SNAPSHOT_TIMEOUT = int(os.getenv("CATALOG_SNAPSHOT_TIMEOUT", 30))
+# Server-Timing headers and timing logs (core.timing) for a share of requests
+REQUEST_TIMING = os.getenv("REQUEST_TIMING", "False") == "True"
+REQUEST_TIMING_SAMPLE_RATE = float(os.getenv("REQUEST_TIMING_SAMPLE_RATE", 0.1))
+# Prometheus metrics (core.metrics), scraped from /metrics/ by METRICS_ALLOWED_IPS
+# or with "Authorization: Bearer <METRICS_TOKEN>". Multi-process servers
+# share their values through files in METRICS_DIR.
+METRICS_DIR = os.getenv("METRICS_DIR") or None
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))
+# Only for scrapers connecting directly, never through the reverse proxy
+METRICS_ALLOWED_IPS = [ip for ip in os.getenv("METRICS_ALLOWED_IPS", "").split(",") if ip]
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+# Log queries slower than this with their plan (core.slow_queries)
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "False") == "True"
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv("SLOW_QUERY_THRESHOLD_MS", 100))
+# Fingerprints kept per process, and labelled in the slow-query metrics
+SLOW_QUERY_MAX_FINGERPRINTS = int(os.getenv("SLOW_QUERY_MAX_FINGERPRINTS", 500))
+SLOW_QUERY_METRIC_FINGERPRINTS = int(os.getenv("SLOW_QUERY_METRIC_FINGERPRINTS", 50))
+# Staff may profile a request with ?profile=1 (core.profiling)
+PROFILING = os.getenv("PROFILING", "False") == "True"
+PROFILING_INTERVAL = float(os.getenv("PROFILING_INTERVAL", 0.005))  # seconds
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(BASE_DIR, "profiles"))
+# Per-request spans (core.tracing), exported as a waterfall on the console or
+# to a trace file for Perfetto
+TRACING = os.getenv("TRACING", "False") == "True"
+TRACING_SAMPLE_RATE = float(os.getenv("TRACING_SAMPLE_RATE", 1.0))
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "console")  # console or file
+TRACING_FILE = os.getenv("TRACING_FILE", os.path.join(BASE_DIR, "traces.json"))
+# Traces waiting for the exporter before new ones are dropped
+TRACING_EXPORT_QUEUE_SIZE = int(os.getenv("TRACING_EXPORT_QUEUE_SIZE", 1000))
+
+# All logging goes out as JSON lines on stderr, written by a background
+# thread (core.log), tagged with the request id and with credentials and
+# email addresses redacted
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "filters": {"request_id": {"()": "core.log.RequestIdFilter"}},
+    "formatters": {"json": {"()": "core.log.JSONFormatter"}},
+    "handlers": {
+        "queue": {
+            "class": "core.log.QueueHandler",
+            "filters": ["request_id"],
+            "formatter": "json",
+        },
+    },
+    "root": {"handlers": ["queue"], "level": os.getenv("LOG_LEVEL", "INFO")},
+    "loggers": {
+        # Through the root handler instead of Django's own console handlers
+        "django": {"handlers": [], "level": "INFO"},
+        "django.server": {"handlers": ["queue"], "level": "INFO", "propagate": False},
+    },
+}
+
 # Optional: Customize JWT settings (defaults: access token 5 mins, refresh token 1 day)
 
 SIMPLE_JWT = {
@@ -127,6 +216,17 @@ SIMPLE_JWT = {
     "REFRESH_TOKEN_LIFETIME": timedelta(days=7),
 }
 
+# Seconds a resolved user stays cached by CachedJWTAuthentication
+JWT_USER_CACHE_TIMEOUT = int(os.getenv("JWT_USER_CACHE_TIMEOUT", 60))
+# Revoked JTIs are mirrored into a per-process bloom filter (accounts.revocation)
+JWT_REVOCATION_CAPACITY = 100_000
+JWT_REVOCATION_ERROR_RATE = 0.001
+JWT_REVOCATION_REFRESH_INTERVAL = 5  # seconds
+JWT_REVOCATION_REBUILD_INTERVAL = 60 * 60  # seconds
+# Serve read-only requests from the profile claims embedded in the token,
+# without any user lookup. Claims may be stale for the token's lifetime.
+JWT_TRUST_USER_CLAIMS = os.getenv("JWT_TRUST_USER_CLAIMS", "False") == "True"
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -146,6 +246,84 @@ else:
         }
     }
 
+# Tests run against an on-disk database so concurrency tests see real SQLite
+# locking rather than the table locks of a shared in-memory database
+DATABASES["default"]["TEST"] = {"NAME": BASE_DIR / "test_db.sqlite3"}
+
+# PostgreSQL profile (DATABASE_ENGINE=postgresql). Connections come from
+# psycopg's pool instead of being opened per request; needs psycopg[pool].
+DATABASE_ENGINE = os.getenv("DATABASE_ENGINE", "sqlite")
+if DATABASE_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.getenv("POSTGRES_DB", "sunset_fest"),
+            "USER": os.getenv("POSTGRES_USER", "postgres"),
+            "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+            "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+            "PORT": os.getenv("POSTGRES_PORT", "5432"),
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.getenv("POSTGRES_POOL_MIN_SIZE", 2)),
+                    "max_size": int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10)),
+                    "timeout": int(os.getenv("POSTGRES_POOL_TIMEOUT", 10)),
+                },
+            },
+        }
+    }
+
+# Read replica for catalog reads (core.routers). Set DATABASE_REPLICA_NAME to
+# a second SQLite file, or POSTGRES_REPLICA_HOST for a PostgreSQL standby.
+REPLICA_DATABASE_ALIAS = None
+if os.getenv("DATABASE_REPLICA_NAME") or os.getenv("POSTGRES_REPLICA_HOST"):
+    REPLICA_DATABASE_ALIAS = "replica"
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "TEST": {"MIRROR": "default"},
+    }
+    if os.getenv("DATABASE_REPLICA_NAME"):
+        DATABASES["replica"]["NAME"] = os.getenv("DATABASE_REPLICA_NAME")
+    if os.getenv("POSTGRES_REPLICA_HOST"):
+        DATABASES["replica"]["HOST"] = os.getenv("POSTGRES_REPLICA_HOST")
+DATABASE_ROUTERS = ["core.routers.PrimaryReplicaRouter"]
+# Seconds a client's reads stay on the primary after it wrote something
+REPLICA_PIN_SECONDS = int(os.getenv("REPLICA_PIN_SECONDS", 5))
+
+# Production SQLite: WAL so readers never block the writer, a busy timeout so
+# concurrent writers wait for the lock instead of failing with "database is
+# locked", and IMMEDIATE transactions so a read lock is never upgraded
+# mid-transaction (an upgrade that loses the race fails without waiting).
+SQLITE_PRODUCTION_MODE = os.getenv("SQLITE_PRODUCTION_MODE", str(not DEBUG)) == "True"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # milliseconds
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # bytes
+
+if SQLITE_PRODUCTION_MODE and DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    DATABASES["default"]["OPTIONS"] = {
+        "timeout": SQLITE_BUSY_TIMEOUT / 1000,
+        "transaction_mode": "IMMEDIATE",
+        "init_command": (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT};"
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE};"
+        ),
+    }
+
+# Funnel hold and booking writes through one writer thread per process that
+# commits them in groups (core.write_queue). Only used on SQLite.
+SQLITE_WRITE_QUEUE = os.getenv("SQLITE_WRITE_QUEUE", "False") == "True"
+SQLITE_WRITE_QUEUE_BATCH_SIZE = 64
+SQLITE_WRITE_QUEUE_WINDOW = 0.002  # seconds to wait for more writes to group
+SQLITE_WRITE_QUEUE_TIMEOUT = 10  # seconds a request waits for its write
+
+# Live availability stream (api/events/availability/stream/)
+EVENTS_STREAM_MAX_KEYS = 50  # entities one stream may watch
+EVENTS_STREAM_HEARTBEAT = 15  # seconds between keep-alive comments
+# Seconds between re-checks of watched entities, for expired holds and
+# writes from other processes (0 disables)
+EVENTS_STREAM_REFRESH_INTERVAL = int(os.getenv("EVENTS_STREAM_REFRESH_INTERVAL", 30))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -166,6 +344,31 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing. PASSWORD_HASHER picks the hasher new hashes are made with
+# (pbkdf2, argon2 or bcrypt); the others stay listed so existing hashes still
+# verify and are upgraded on login. argon2 needs argon2-cffi, bcrypt needs bcrypt.
+_PASSWORD_HASHER_CLASSES = {
+    "pbkdf2": "accounts.hashers.TunedPBKDF2PasswordHasher",
+    "argon2": "accounts.hashers.TunedArgon2PasswordHasher",
+    "bcrypt": "accounts.hashers.TunedBCryptSHA256PasswordHasher",
+}
+PASSWORD_HASHER = os.getenv("PASSWORD_HASHER", "pbkdf2")
+PASSWORD_HASHERS = [_PASSWORD_HASHER_CLASSES[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHER_CLASSES.items() if name != PASSWORD_HASHER
+]
+PASSWORD_HASHER_PBKDF2_ITERATIONS = int(
+    os.getenv("PASSWORD_HASHER_PBKDF2_ITERATIONS", 1_000_000)
+)
+PASSWORD_HASHER_ARGON2_TIME_COST = int(os.getenv("PASSWORD_HASHER_ARGON2_TIME_COST", 2))
+PASSWORD_HASHER_ARGON2_MEMORY_COST = int(
+    os.getenv("PASSWORD_HASHER_ARGON2_MEMORY_COST", 102400)  # KiB
+)
+PASSWORD_HASHER_ARGON2_PARALLELISM = int(
+    os.getenv("PASSWORD_HASHER_ARGON2_PARALLELISM", 8)
+)
+PASSWORD_HASHER_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_HASHER_BCRYPT_ROUNDS", 12))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -192,11 +395,18 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # For production (e.g., Gmail):
 EMAIL_BACKEND = os.getenv("EMAIL_BACKEND")
 EMAIL_HOST = os.getenv("SMTP_SERVER")
-EMAIL_PORT = int(os.getenv("SMTP_PORT"))
+EMAIL_PORT = int(os.getenv("SMTP_PORT", 587))
 EMAIL_USE_TLS = True  # Assuming TLS is always used as per the provided context
 EMAIL_HOST_USER = os.getenv("SMTP_USER")
 EMAIL_HOST_PASSWORD = os.getenv("SMTP_PASSWORD")
 FROM_EMAIL = os.getenv("FROM_EMAIL")
+# Outbox worker (python manage.py send_queued_emails)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", 50))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", 5))
+EMAIL_OUTBOX_RETRY_BACKOFF = int(os.getenv("EMAIL_OUTBOX_RETRY_BACKOFF", 30))  # seconds
+EMAIL_OUTBOX_LEASE = int(os.getenv("EMAIL_OUTBOX_LEASE", 300))  # seconds
+# Unverified accounts older than this are removed by purge_expired_tokens
+ACCOUNT_UNVERIFIED_RETENTION_DAYS = int(os.getenv("ACCOUNT_UNVERIFIED_RETENTION_DAYS", 7))
 # Base URL for verification/reset links
 FRONTEND_URL = os.getenv("FRONTEND_URL", "http://localhost:3000")
 
@@ -216,3 +426,12 @@ BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
 # Facebook OAuth2 settings
 FACEBOOK_OAUTH2_CLIENT_ID = os.getenv("FACEBOOK_OAUTH2_CLIENT_ID")
 FACEBOOK_OAUTH2_CLIENT_SECRET = os.getenv("FACEBOOK_OAUTH2_CLIENT_SECRET")
+
+# Outbound HTTP to OAuth providers
+SOCIAL_HTTP_CONNECT_TIMEOUT = float(os.getenv("SOCIAL_HTTP_CONNECT_TIMEOUT", 3.05))
+SOCIAL_HTTP_READ_TIMEOUT = float(os.getenv("SOCIAL_HTTP_READ_TIMEOUT", 5))
+SOCIAL_HTTP_RETRIES = int(os.getenv("SOCIAL_HTTP_RETRIES", 2))
+SOCIAL_HTTP_POOL_SIZE = int(os.getenv("SOCIAL_HTTP_POOL_SIZE", 10))
+SOCIAL_DISCOVERY_CACHE_TIMEOUT = 60 * 60  # seconds
+SOCIAL_DISCOVERY_FAILURE_CACHE_TIMEOUT = 60  # seconds, built-in endpoints are used meanwhile
+SOCIAL_PROFILE_CACHE_TIMEOUT = 60  # seconds
@@ -0,0 +1,240 @@
+"""
+Slow-query log.
+
+With SLOW_QUERY_LOG on, every query taking longer than
+SLOW_QUERY_THRESHOLD_MS is logged on `core.slow_queries` with the view it ran
+for and the database's plan for it (EXPLAIN QUERY PLAN on SQLite, EXPLAIN on
+PostgreSQL).
+
+Queries are grouped by fingerprint, their SQL with literals and parameters
+replaced by `?` and IN lists collapsed, so the same query with other values
+is one entry. The plan is captured the first time a fingerprint is slow in a
+process; later records carry the fingerprint's running count and total time.
+A process keeps SLOW_QUERY_MAX_FINGERPRINTS entries: a new fingerprint
+replaces the one with the least total time, which starts over (and is
+explained again) if it comes back.
+
+`slow_queries_total` and `slow_query_seconds_total` (core.metrics) aggregate
+them across processes by fingerprint. Only the first
+SLOW_QUERY_METRIC_FINGERPRINTS fingerprints a process sees get a label of
+their own, later ones are counted under `other`, so the number of series
+stays bounded.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, connections, transaction
+from django.db.backends.signals import connection_created
+
+from .metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+# {"view": ...} of the request being served, filled in once it is resolved
+current_origin = ContextVar("slow_query_origin", default=None)
+# Set while a plan is being captured, so EXPLAIN itself is not logged
+explaining = ContextVar("slow_query_explaining", default=False)
+
+EXPLAINABLE = ("select", "with", "update", "delete")
+
+slow_queries = Counter(
+    "slow_queries_total", "Queries over SLOW_QUERY_THRESHOLD_MS", ["fingerprint"]
+)
+slow_query_seconds = Counter(
+    "slow_query_seconds_total", "Time spent in slow queries", ["fingerprint"]
+)
+
+STRINGS = re.compile(r"'(?:[^']|'')*'")
+NUMBERS = re.compile(r"\b\d+(?:\.\d+)?\b")
+PLACEHOLDERS = re.compile(r"%s|\?")
+IN_LISTS = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(sql):
+    sql = STRINGS.sub("?", sql)
+    sql = NUMBERS.sub("?", sql)
+    sql = PLACEHOLDERS.sub("?", sql)
+    sql = IN_LISTS.sub("IN (...)", sql)
+    return WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(normalize(sql).encode()).hexdigest()[:12]
+
+
+class SlowQueryStats:
+    """Slow queries seen by this process, by fingerprint."""
+
+    def __init__(self):
+        self.entries = {}
+        self.labels = set()
+        self.lock = threading.Lock()
+
+    def record(self, key, sql, seconds, origin):
+        """Add a slow run, returns (its entry, whether it is the first)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            first = entry is None
+            if first:
+                if len(self.entries) >= settings.SLOW_QUERY_MAX_FINGERPRINTS:
+                    cheapest = min(self.entries, key=lambda k: self.entries[k]["total"])
+                    del self.entries[cheapest]
+                entry = self.entries[key] = {
+                    "sql": normalize(sql),
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "views": set(),
+                    "plan": None,
+                }
+            entry["count"] += 1
+            entry["total"] += seconds
+            entry["max"] = max(entry["max"], seconds)
+            entry["views"].add(origin)
+        return entry, first
+
+    def label(self, key):
+        """The metric label to count `key` under."""
+        with self.lock:
+            if key in self.labels:
+                return key
+            if len(self.labels) < settings.SLOW_QUERY_METRIC_FINGERPRINTS:
+                self.labels.add(key)
+                return key
+        return "other"
+
+    def summary(self):
+        """Entries, the most total time first."""
+        with self.lock:
+            entries = [dict(entry, fingerprint=key) for key, entry in self.entries.items()]
+        return sorted(entries, key=lambda entry: entry["total"], reverse=True)
+
+
+stats = SlowQueryStats()
+
+
+def explain(connection, sql, params):
+    if not sql.lstrip().lower().startswith(EXPLAINABLE):
+        return None
+    token = explaining.set(True)
+    try:
+        # A failing EXPLAIN must not break the caller's transaction
+        savepoint = (
+            transaction.atomic(using=connection.alias)
+            if connection.in_atomic_block
+            else nullcontext()
+        )
+        with savepoint, connection.cursor() as cursor:
+            cursor.execute(f"{connection.ops.explain_query_prefix()} {sql}", params)
+            # The detail is the last column on SQLite, the only one on PostgreSQL
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+    except DatabaseError as e:
+        return f"EXPLAIN failed: {e}"
+    finally:
+        explaining.reset(token)
+
+
+def log_slow_query(execute, sql, params, many, context):
+    if explaining.get() or not settings.SLOW_QUERY_LOG:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    seconds = time.perf_counter() - start
+    if seconds * 1000 < settings.SLOW_QUERY_THRESHOLD_MS:
+        return result
+
+    origin = current_origin.get()
+    view = origin["view"] if origin else None
+    key = fingerprint(sql)
+    entry, first = stats.record(key, sql, seconds, view)
+    if first and not many:
+        entry["plan"] = explain(context["connection"], sql, params)
+    label = stats.label(key)
+    slow_queries.inc(fingerprint=label)
+    slow_query_seconds.inc(seconds, fingerprint=label)
+
+    logger.warning(
+        "Slow query %s (%.1f ms) in %s: %s",
+        key,
+        seconds * 1000,
+        view or "no request",
+        entry["sql"],
+        extra={
+            "fingerprint": key,
+            "duration_ms": round(seconds * 1000, 3),
+            "view": view,
+            "sql": sql,
+            "plan": entry["plan"] if first else None,
+            "count": entry["count"],
+            "total_ms": round(entry["total"] * 1000, 3),
+        },
+    )
+    return result
+
+
+def wrap_connection(connection, **kwargs):
+    if log_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(log_slow_query)
+
+
+_installed = False
+
+
+def install():
+    """
+    Hook the slow-query log in. Called once, when the middleware is loaded
+    with SLOW_QUERY_LOG on.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+    connection_created.connect(wrap_connection, weak=False)
+    for connection in connections.all(initialized_only=True):
+        wrap_connection(connection)
+
+
+class SlowQueryMiddleware:
+    """Records which view the queries of each request ran for."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_LOG:
+            raise MiddlewareNotUsed
+        install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_origin.set({"view": f"{request.method} {request.path}"})
+        try:
+            return self.get_response(request)
+        finally:
+            current_origin.reset(token)
+
+    async def __acall__(self, request):
+        token = current_origin.set({"view": f"{request.method} {request.path}"})
+        try:
+            return await self.get_response(request)
+        finally:
+            current_origin.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        origin = current_origin.get()
+        if origin is not None and request.resolver_match.view_name:
+            origin["view"] = f"{request.method} {request.resolver_match.view_name}"
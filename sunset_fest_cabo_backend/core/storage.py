@@ -0,0 +1,98 @@
+"""
+Content-addressed media storage and serving.
+
+Uploads are stored as `<upload_to>/<hash><ext>`, where the hash is taken
+over the file's bytes, so uploading the same file twice stores it once and a
+stored name never changes content. That makes media safe to cache forever:
+`serve_media` sends content-addressed files with an immutable Cache-Control
+and their hash as ETag.
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+HASH_LENGTH = 32
+HASHED_NAME = re.compile(rf"^[0-9a-f]{{{HASH_LENGTH}}}$")
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def is_content_addressed(name):
+    return bool(HASHED_NAME.match(os.path.splitext(os.path.basename(name))[0]))
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def content_name(self, name, content):
+        directory, filename = os.path.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return os.path.join(directory, content_hash(content) + extension)
+
+    def get_available_name(self, name, max_length=None):
+        # Names are made unique by _save, reusing a name is deduplication
+        return name
+
+    def _save(self, name, content):
+        name = self.content_name(name, content)
+        path = self.path(name)
+        if os.path.exists(path):
+            return name
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        if self.directory_permissions_mode is not None:
+            os.chmod(directory, self.directory_permissions_mode)
+
+        # Write next to the target and rename into place, so readers never
+        # see a partial file and concurrent uploads of the same bytes are
+        # harmless
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".upload")
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                for chunk in content.chunks():
+                    temp_file.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name
+
+
+def serve_media(request, path):
+    """
+    Serve MEDIA_ROOT. Content-addressed files are immutable and cached for
+    MEDIA_CACHE_MAX_AGE; files stored before content addressing keep being
+    revalidated through Last-Modified.
+    """
+    immutable = is_content_addressed(path)
+    etag = f'"{os.path.splitext(os.path.basename(path))[0]}"' if immutable else None
+    if etag and etag in request.headers.get("If-None-Match", ""):
+        response = HttpResponseNotModified()
+    else:
+        response = serve(request, path, document_root=settings.MEDIA_ROOT)
+
+    if etag:
+        response["ETag"] = etag
+        patch_cache_control(
+            response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE, immutable=True
+        )
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
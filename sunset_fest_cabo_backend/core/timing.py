@@ -0,0 +1,232 @@
+"""
+Per-request timing.
+
+RequestTimingMiddleware measures a sample of requests (REQUEST_TIMING_SAMPLE_RATE)
+and reports, as Server-Timing headers and as one `core.timing` log record
+per request:
+
+    total       time spent below the middleware
+    view        time in the view, up to the response it returns
+    render      rendering a DRF response
+    sql         time in queries, with the query count
+    serializer  time producing serializer `.data`, and ValuesSerializer output
+
+Measurements go to the RequestTimings of the current request, found through
+a ContextVar, so queries run from async views on sync_to_async threads are
+counted as well. The hooks, including a wrapper around DRF's Serializer.data,
+are installed by the middleware and described there. With REQUEST_TIMING off
+the middleware removes itself and installs none of them.
+"""
+
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+current_timings = ContextVar("current_timings", default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.durations = {}
+        self.queries = 0
+        self.depth = {}
+
+    def add(self, metric, seconds):
+        self.durations[metric] = self.durations.get(metric, 0.0) + seconds
+
+    def ms(self, metric):
+        return round(self.durations.get(metric, 0.0) * 1000, 3)
+
+    def server_timing(self):
+        parts = []
+        for metric in self.durations:
+            part = f"{metric};dur={self.ms(metric)}"
+            if metric == "sql":
+                part += f';desc="{self.queries} queries"'
+            parts.append(part)
+        return ", ".join(parts)
+
+
+@contextmanager
+def timed(metric):
+    """
+    Add the time spent in the block to `metric` of the current request, if
+    it is being timed. Nested blocks of the same metric count once.
+    """
+    timings = current_timings.get()
+    if timings is None or timings.depth.get(metric):
+        yield
+        return
+    timings.depth[metric] = 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.depth[metric] = 0
+        timings.add(metric, time.perf_counter() - start)
+
+
+def time_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add("sql", time.perf_counter() - start)
+
+
+def wrap_connection(connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+def timed_property(prop, metric):
+    def fget(self):
+        with timed(metric):
+            return prop.fget(self)
+
+    return property(fget, doc=prop.__doc__)
+
+
+class RequestTimingMiddleware:
+    """
+    Time a sample of requests.
+
+    Loading the middleware with REQUEST_TIMING on installs, once per process:
+
+    - an execute wrapper on every database connection, for `sql`;
+    - a wrapper around the `data` property of DRF's Serializer and
+      ListSerializer, and around ValuesSerializer.serialize, for
+      `serializer`.
+
+    The serializer wrappers replace class attributes of DRF, so they apply
+    to every serializer in the process. Outside a sampled request they only
+    read a ContextVar and call through. They are never removed.
+    """
+
+    sync_capable = True
+    async_capable = True
+    installed = False
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.install()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - start)
+
+    @classmethod
+    def install(cls):
+        if cls.installed:
+            return
+        cls.installed = True
+
+        from rest_framework import serializers
+
+        from .serializers import ValuesSerializer
+
+        # Connections are per thread and created lazily, wrap every new one as
+        # well as those this thread already has
+        connection_created.connect(wrap_connection, weak=False)
+        for connection in connections.all(initialized_only=True):
+            wrap_connection(connection)
+
+        for serializer_class in (serializers.Serializer, serializers.ListSerializer):
+            serializer_class.data = timed_property(serializer_class.data, "serializer")
+
+        serialize = ValuesSerializer.serialize.__func__
+
+        def timed_serialize(serializer_class, queryset, context=None):
+            with timed("serializer"):
+                return serialize(serializer_class, queryset, context)
+
+        ValuesSerializer.serialize = classmethod(timed_serialize)
+
+    def sampled(self):
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing_view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # DRF responses get here between the view and rendering
+        timings = current_timings.get()
+        if timings is not None:
+            self.end_view(request, timings)
+            start = time.perf_counter()
+            response.add_post_render_callback(
+                lambda r: timings.add("render", time.perf_counter() - start)
+            )
+        return response
+
+    def end_view(self, request, timings):
+        start = getattr(request, "_timing_view_start", None)
+        if start is not None:
+            timings.add("view", time.perf_counter() - start)
+            request._timing_view_start = None
+
+    def report(self, request, response, timings, total):
+        # Views returning plain responses end here
+        self.end_view(request, timings)
+        timings.durations = {"total": total, **timings.durations}
+        response["Server-Timing"] = timings.server_timing()
+
+        match = getattr(request, "resolver_match", None)
+        logger.info(
+            "%s %s %s in %.1f ms, %d queries",
+            request.method,
+            request.path,
+            response.status_code,
+            total * 1000,
+            timings.queries,
+            extra={
+                "method": request.method,
+                "path": request.path,
+                "route": match.view_name if match else None,
+                "status": response.status_code,
+                "queries": timings.queries,
+                **{f"{metric}_ms": timings.ms(metric) for metric in timings.durations},
+            },
+        )
+        return response
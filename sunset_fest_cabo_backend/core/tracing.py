@@ -0,0 +1,392 @@
+"""
+Lightweight request tracing.
+
+With TRACING on, TracingMiddleware opens a root span for a share of requests
+(TRACING_SAMPLE_RATE) and everything run for the request can add child
+spans:
+
+    with span("stripe.checkout.Session.create"):
+        ...
+
+    @traced()
+    def get_available_tickets(self):
+        ...
+
+The current span lives in a ContextVar, so spans nest across function calls
+and follow the request onto sync_to_async and write-queue threads. Outside
+a traced request `span` does nothing. Every query (`db SELECT`, ...) and
+every outbound HTTP call made with requests (`HTTP GET`, ...) gets a span
+of its own.
+
+When the middleware returns the response the trace is closed and queued
+for the TRACING_EXPORTER, which runs on a background thread so the response
+never waits on its I/O:
+
+    console  a waterfall per request on stderr
+    file     Trace Event Format appended to TRACING_FILE, which Perfetto
+             (ui.perfetto.dev) and chrome://tracing open as a timeline
+
+Spans finishing after that are dropped: the body of a streaming response
+(the availability event stream, for one) and write-queue work that
+outlives the request are not traced. At most TRACING_EXPORT_QUEUE_SIZE
+traces wait for the exporter; when it falls behind, further traces are
+dropped and a warning is logged.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+import orjson
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+current_span = ContextVar("current_span", default=None)
+
+# Statements are cut to this many characters in span attributes
+MAX_STATEMENT = 500
+
+
+class Trace:
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.spans = []
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            if not self.closed:
+                self.spans.append(span)
+
+    def close(self):
+        """Stop taking spans, the trace is about to be exported."""
+        with self.lock:
+            self.closed = True
+
+    @property
+    def root(self):
+        return next(span for span in self.spans if span.parent is None)
+
+
+class Span:
+    def __init__(self, name, trace, parent=None, attributes=None):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.attributes = attributes or {}
+        self.span_id = uuid.uuid4().hex[:16]
+        self.thread_id = threading.get_ident()
+        self.error = None
+        self.start_time = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+        self.trace.add(self)
+
+    @property
+    def depth(self):
+        depth, parent = 0, self.parent
+        while parent is not None:
+            depth, parent = depth + 1, parent.parent
+        return depth
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current one; yields None outside a trace."""
+    parent = current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace, parent, attributes)
+    token = current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = type(e).__name__
+        raise
+    finally:
+        current_span.reset(token)
+        child.finish()
+
+
+def traced(name=None):
+    """Decorator running each call in a span, named after the function by default."""
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+        if iscoroutinefunction(function):
+
+            @wraps(function)
+            async def wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await function(*args, **kwargs)
+
+        else:
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with span(span_name):
+                    return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def trace_query(execute, sql, params, many, context):
+    if current_span.get() is None:
+        return execute(sql, params, many, context)
+    operation = sql.split(None, 1)[0].upper() if sql.strip() else "QUERY"
+    with span(
+        f"db {operation}",
+        statement=sql[:MAX_STATEMENT],
+        database=context["connection"].alias,
+        many=many,
+    ):
+        return execute(sql, params, many, context)
+
+
+def wrap_connection(connection, **kwargs):
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+def traced_http(request):
+    @wraps(request)
+    def wrapper(session, method, url, *args, **kwargs):
+        # No query string, it may carry credentials
+        with span(f"HTTP {method.upper()}", url=str(url).split("?", 1)[0]) as current:
+            response = request(session, method, url, *args, **kwargs)
+            if current is not None:
+                current.set(status=response.status_code)
+            return response
+
+    return wrapper
+
+
+class ConsoleExporter:
+    """Prints each trace as a waterfall."""
+
+    width = 40
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def export(self, trace):
+        root = trace.root
+        total = root.duration or 1e-9
+        lines = [f"trace {trace.trace_id} {root.name} {root.duration * 1000:.1f} ms"]
+        for current in sorted(trace.spans, key=lambda s: s.start):
+            offset = current.start - root.start
+            begin = min(int(offset / total * self.width), self.width - 1)
+            length = max(1, round(current.duration / total * self.width))
+            bar = (" " * begin + "█" * length)[: self.width]
+            name = "  " * current.depth + current.name
+            if current.error:
+                name += f" ! {current.error}"
+            lines.append(
+                f"{offset * 1000:9.1f} ms |{bar:<{self.width}}| "
+                f"{current.duration * 1000:8.1f} ms  {name}"
+            )
+        (self.stream or sys.stderr).write("\n".join(lines) + "\n")
+
+
+class FileExporter:
+    """
+    Appends spans to a JSON array of Trace Event Format complete events. The
+    format allows the closing bracket to be left out, so the file stays
+    loadable while it grows.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or settings.TRACING_FILE
+        self.lock = threading.Lock()
+
+    def export(self, trace):
+        pid = os.getpid()
+        lines = []
+        for current in trace.spans:
+            args = {"trace_id": trace.trace_id, **current.attributes}
+            if current.error:
+                args["error"] = current.error
+            event = {
+                "name": current.name,
+                "cat": current.name.split(None, 1)[0] if " " in current.name else "app",
+                "ph": "X",
+                "ts": round(current.start_time * 1_000_000),
+                "dur": round(current.duration * 1_000_000),
+                "pid": pid,
+                "tid": current.thread_id,
+                "args": args,
+            }
+            lines.append(orjson.dumps(event, default=str) + b",\n")
+        with self.lock, open(self.path, "ab") as f:
+            if f.tell() == 0:
+                f.write(b"[\n")
+            f.write(b"".join(lines))
+
+
+EXPORTERS = {"console": ConsoleExporter, "file": FileExporter}
+
+
+class ExportQueue:
+    """
+    Runs exporters on a background thread. The thread is started by the
+    first trace a process exports, so every worker forked from a preloaded
+    app gets one of its own.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pid = None
+        self.queue = None
+        self.dropped = 0
+
+    def put(self, exporter, trace):
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait((exporter, trace))
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(
+                "Trace export queue is full, dropped trace %s (%d so far)",
+                trace.trace_id,
+                self.dropped,
+            )
+
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue = queue.Queue(maxsize=settings.TRACING_EXPORT_QUEUE_SIZE)
+            threading.Thread(
+                target=self.run, args=(self.queue,), name="trace-export", daemon=True
+            ).start()
+            self.pid = os.getpid()
+
+    def run(self, traces):
+        while True:
+            exporter, trace = traces.get()
+            try:
+                exporter.export(trace)
+            except Exception:
+                logger.exception("Exporting trace %s failed", trace.trace_id)
+            finally:
+                traces.task_done()
+
+    def flush(self):
+        """Wait until everything queued so far is exported."""
+        if self.pid == os.getpid():
+            self.queue.join()
+
+
+export_queue = ExportQueue()
+atexit.register(export_queue.flush)
+
+_installed = False
+
+
+def install():
+    """
+    Hook query and outbound HTTP spans in. Called once, when the middleware
+    is loaded with TRACING on.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    import requests
+
+    connection_created.connect(wrap_connection, weak=False)
+    for connection in connections.all(initialized_only=True):
+        wrap_connection(connection)
+    requests.Session.request = traced_http(requests.Session.request)
+
+
+class TracingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRACING:
+            raise MiddlewareNotUsed
+        install()
+        self.exporter = EXPORTERS[settings.TRACING_EXPORTER]()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        root = self.start(request)
+        token = current_span.set(root)
+        try:
+            response = self.get_response(request)
+            root.set(status=response.status_code)
+            return response
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            self.finish(root)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        root = self.start(request)
+        token = current_span.set(root)
+        try:
+            response = await self.get_response(request)
+            root.set(status=response.status_code)
+            return response
+        except BaseException as e:
+            root.error = type(e).__name__
+            raise
+        finally:
+            current_span.reset(token)
+            self.finish(root)
+
+    def sampled(self):
+        rate = settings.TRACING_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
+
+    def start(self, request):
+        trace_id = getattr(request, "id", None) or uuid.uuid4().hex
+        return Span(f"{request.method} {request.path}", Trace(trace_id))
+
+    def finish(self, root):
+        root.finish()
+        root.trace.close()
+        export_queue.put(self.exporter, root.trace)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        root = current_span.get()
+        if root is not None and request.resolver_match.view_name:
+            root.name = f"{request.method} {request.resolver_match.view_name}"
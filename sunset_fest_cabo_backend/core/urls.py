@@ -16,9 +16,10 @@ Including another URLconf
 """
 
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from core.metrics import metrics_view
+from core.storage import serve_media
 
 urlpatterns = [
     path("admin/", admin.site.urls),
@@ -26,7 +27,10 @@ urlpatterns = [
     path("api/events/", include("events.urls")),
     path("api/social/", include("social.urls")),
     path("api/payments/", include("payments.urls")),
+    path("metrics/", metrics_view, name="metrics"),
 ]
-# Serve media files during development
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Serve media files, with immutable caching for content-addressed uploads
+if settings.SERVE_MEDIA:
+    urlpatterns += [
+        re_path(rf"^{settings.MEDIA_URL.lstrip('/')}(?P<path>.*)$", serve_media),
+    ]
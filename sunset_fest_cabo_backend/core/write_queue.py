@@ -0,0 +1,119 @@
+"""
+In-process write queue for the SQLite backend.
+
+SQLite allows a single writer at a time. Instead of letting every request
+thread race for the lock, writes submitted through `run_write` are executed
+by one writer thread that groups whatever is queued into a single
+transaction (group commit), with a savepoint per write so one failing write
+does not roll back the others. Callers block until their write is committed
+and get its return value or exception back, or for up to
+SQLITE_WRITE_QUEUE_TIMEOUT seconds, after which a write that has not started
+is dropped. Writes run in the context of
+the thread that submitted them, so per-request context variables (timings,
+the slow-query log's view) follow them onto the writer thread.
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+
+class WriteQueue:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def start(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(
+                    target=self.run, name="sqlite-writer", daemon=True
+                )
+                self.thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        if threading.current_thread() is self.thread:
+            # A write issued from inside another write joins its transaction
+            return fn(*args, **kwargs)
+        self.start()
+        future = Future()
+        timeout = settings.SQLITE_WRITE_QUEUE_TIMEOUT
+        deadline = None if timeout is None else time.monotonic() + timeout
+        self.jobs.put(
+            (future, deadline, contextvars.copy_context().run, (fn, *args), kwargs)
+        )
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            # The caller has given up, so the write must not run later on
+            future.cancel()
+            raise
+
+    def next_batch(self):
+        batch = [self.jobs.get()]
+        while len(batch) < settings.SQLITE_WRITE_QUEUE_BATCH_SIZE:
+            try:
+                batch.append(
+                    self.jobs.get(timeout=settings.SQLITE_WRITE_QUEUE_WINDOW)
+                )
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            close_old_connections()
+            # Take the write lock when each group starts; a deferred
+            # transaction that reads first can be refused the lock upgrade
+            # without waiting. Set after connecting, which resets the mode
+            # from OPTIONS.
+            connection.ensure_connection()
+            connection.transaction_mode = "IMMEDIATE"
+            results = []
+            try:
+                with transaction.atomic():
+                    for future, deadline, fn, args, kwargs in batch:
+                        if deadline is not None and time.monotonic() > deadline:
+                            future.cancel()
+                        if not future.set_running_or_notify_cancel():
+                            continue
+                        try:
+                            with transaction.atomic():
+                                results.append((future, fn(*args, **kwargs), None))
+                        except Exception as e:
+                            results.append((future, None, e))
+            except Exception as e:
+                # The commit itself failed, none of the writes persisted
+                for future, *_ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            # Only report back once the group is durable
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+write_queue = WriteQueue()
+
+
+def run_write(fn, *args, **kwargs):
+    """
+    Run `fn(*args, **kwargs)` as a write. Goes through the writer thread when
+    SQLITE_WRITE_QUEUE is enabled on SQLite, otherwise runs it inline in its
+    own transaction.
+    """
+    if settings.SQLITE_WRITE_QUEUE and connection.vendor == "sqlite":
+        return write_queue.submit(fn, *args, **kwargs)
+    with transaction.atomic():
+        return fn(*args, **kwargs)
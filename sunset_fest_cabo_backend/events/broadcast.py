@@ -0,0 +1,250 @@
+"""
+In-process fan-out of availability changes to server-sent event streams.
+
+Streams subscribe to pricing plans, rooms and time slots. Model hooks (see
+signals.py) report what a committed write touched; publishing only queues
+that and wakes the streams, so the writing thread does no queries. The
+first stream to wake works out which watched entities are affected,
+recomputes each once and pushes the new figure to every subscription,
+skipping unchanged values; the others pick the figures up from there. A
+refresh thread marks every watched entity changed each
+EVENTS_STREAM_REFRESH_INTERVAL seconds to pick up holds that simply expired
+and writes made by other processes.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+
+from .models import AddOnTimeSlot, BookingAddOn, BookingRoom, PricingPlan, Room
+
+logger = logging.getLogger(__name__)
+
+KINDS = {
+    "pricing_plan": (PricingPlan, "get_available_tickets"),
+    "room": (Room, "get_available_rooms"),
+    "time_slot": (AddOnTimeSlot, "get_available_capacity"),
+}
+
+
+def format_event(key, value):
+    kind, id = key
+    data = json.dumps({"type": kind, "id": id, "available": value})
+    return f"event: availability\ndata: {data}\n\n"
+
+
+class Subscription:
+    """
+    One stream's view of the broadcaster. Changes are coalesced per entity,
+    so a slow client only ever has the latest figure for each one pending.
+    """
+
+    def __init__(self, broadcaster, keys):
+        self.broadcaster = broadcaster
+        self.keys = keys
+        self.loop = asyncio.get_running_loop()
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, key, value):
+        self.pending[key] = value
+        self.ready.set()
+
+    async def changes(self, timeout):
+        """
+        Wait up to `timeout` seconds for changes and return them as
+        {key: available}, empty if nothing changed.
+        """
+        try:
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return {}
+        self.ready.clear()
+        try:
+            await sync_to_async(self.broadcaster.update)()
+        except Exception:
+            logger.exception("Updating watched availability failed")
+        changes, self.pending = self.pending, {}
+        return changes
+
+
+class AvailabilityBroadcaster:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # kind -> entity id -> subscriptions watching it
+        self.subscriptions = {kind: {} for kind in KINDS}
+        self.last = {}
+        # publish() calls not yet handled by update()
+        self.changed = []
+        self.refresher = None
+
+    def subscribe(self, keys):
+        subscription = Subscription(self, keys)
+        with self.lock:
+            for kind, id in keys:
+                self.subscriptions[kind].setdefault(id, set()).add(subscription)
+        self.start_refresher()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for kind, id in subscription.keys:
+                watchers = self.subscriptions[kind].get(id)
+                if watchers is None:
+                    continue
+                watchers.discard(subscription)
+                if not watchers:
+                    del self.subscriptions[kind][id]
+                    self.last.pop((kind, id), None)
+
+    def watched(self, kind):
+        with self.lock:
+            return set(self.subscriptions[kind])
+
+    def compute(self, key):
+        kind, id = key
+        model, method = KINDS[kind]
+        try:
+            return getattr(model.objects.get(id=id), method)()
+        except model.DoesNotExist:
+            return None
+
+    def snapshot(self, keys):
+        """
+        Current availability of `keys`, reusing the last published figures.
+        """
+        with self.lock:
+            known = {key: self.last[key] for key in keys if key in self.last}
+        return {key: known[key] if key in known else self.compute(key) for key in keys}
+
+    def notify(self, **changes):
+        """
+        Called by the model hooks: publish `changes` once the current
+        transaction commits, if anything is being watched.
+        """
+        with self.lock:
+            if not any(self.subscriptions.values()):
+                return
+        transaction.on_commit(lambda: self.publish(**changes), robust=True)
+
+    def publish(self, **changes):
+        """
+        Queue `changes` and wake every stream; the figures are recomputed by
+        the first one to run update().
+        """
+        with self.lock:
+            subscriptions = {
+                subscription
+                for watchers in self.subscriptions.values()
+                for subscribed in watchers.values()
+                for subscription in subscribed
+            }
+            if not subscriptions:
+                return
+            self.changed.append(changes)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.ready.set)
+            except RuntimeError:
+                # The stream's event loop has shut down
+                self.unsubscribe(subscription)
+
+    def update(self):
+        """
+        Recompute the watched entities affected by the queued changes and
+        push the figures that moved. Bookings and holds are expanded to the
+        entities they count against: a booking's rooms and time slots, and
+        for ticket holds every pricing plan and time slot of the event, since
+        holds are counted per event.
+        """
+        with self.lock:
+            changed, self.changed = self.changed, []
+        changes = {}
+        for change in changed:
+            for name, values in change.items():
+                changes.setdefault(name, set()).update(values)
+        pricing_plans = changes.get("pricing_plans", ())
+        rooms = changes.get("rooms", ())
+        time_slots = changes.get("time_slots", ())
+        bookings = changes.get("bookings", ())
+        hold_plans = changes.get("hold_plans", ())
+
+        watched = {kind: self.watched(kind) for kind in KINDS}
+        ids = {
+            "pricing_plan": {str(id) for id in pricing_plans},
+            "room": {str(id) for id in rooms},
+            "time_slot": {str(id) for id in time_slots if id is not None},
+        }
+
+        if bookings and watched["room"]:
+            ids["room"].update(
+                str(id)
+                for id in BookingRoom.objects.filter(
+                    booking_id__in=bookings, room_id__in=watched["room"]
+                ).values_list("room_id", flat=True)
+            )
+        if bookings and watched["time_slot"]:
+            ids["time_slot"].update(
+                str(id)
+                for id in BookingAddOn.objects.filter(
+                    booking_id__in=bookings, time_slot_id__in=watched["time_slot"]
+                ).values_list("time_slot_id", flat=True)
+            )
+        if hold_plans and (watched["pricing_plan"] or watched["time_slot"]):
+            events = PricingPlan.objects.filter(id__in=hold_plans).values(
+                "event_date__event_id"
+            )
+            ids["pricing_plan"].update(
+                str(id)
+                for id in PricingPlan.objects.filter(
+                    event_date__event_id__in=events, id__in=watched["pricing_plan"]
+                ).values_list("id", flat=True)
+            )
+            ids["time_slot"].update(
+                str(id)
+                for id in AddOnTimeSlot.objects.filter(
+                    add_on__event_id__in=events, id__in=watched["time_slot"]
+                ).values_list("id", flat=True)
+            )
+
+        for kind, kind_ids in ids.items():
+            for id in kind_ids & watched[kind]:
+                self.push((kind, id), self.compute((kind, id)))
+
+    def push(self, key, value):
+        kind, id = key
+        with self.lock:
+            if key in self.last and self.last[key] == value:
+                return
+            self.last[key] = value
+            subscriptions = list(self.subscriptions[kind].get(id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.push, key, value)
+            except RuntimeError:
+                # The stream's event loop has shut down
+                self.unsubscribe(subscription)
+
+    def start_refresher(self):
+        interval = settings.EVENTS_STREAM_REFRESH_INTERVAL
+        with self.lock:
+            if not interval or (self.refresher and self.refresher.is_alive()):
+                return
+            self.refresher = threading.Thread(
+                target=self.refresh, args=(interval,), name="availability-refresh", daemon=True
+            )
+            self.refresher.start()
+
+    def refresh(self, interval):
+        while True:
+            time.sleep(interval)
+            self.publish(**{f"{kind}s": self.watched(kind) for kind in KINDS})
+
+
+broadcaster = AvailabilityBroadcaster()
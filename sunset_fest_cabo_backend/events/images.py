@@ -0,0 +1,161 @@
+"""
+Responsive variants of catalog images.
+
+Uploads are stored untouched. The generate_image_variants worker renders
+each one at IMAGE_VARIANT_WIDTHS in IMAGE_VARIANT_FORMATS (never upscaling)
+on a process pool and records the result, with the original dimensions, in
+the model's `<field>_variants` JSON field, which serializers expose through
+ImageVariantsField. Replacing an image clears that field (see signals.py),
+which queues the new file for the worker. The worker records variants with
+an update(), which sends no signals, so it drops the catalog snapshots
+itself.
+"""
+
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from .models import AccommodationImage, AddOn, Event, PricingPlan, RoomImage
+from .snapshots import invalidate_catalog_snapshots
+
+logger = logging.getLogger(__name__)
+
+# Model -> image field that gets variants
+IMAGE_FIELDS = {
+    Event: "image",
+    PricingPlan: "banner_image",
+    AccommodationImage: "image",
+    RoomImage: "image",
+    AddOn: "image",
+}
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def variants_field(field_name):
+    return f"{field_name}_variants"
+
+
+def has_alpha(image):
+    return image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+
+
+def prepare(image, fmt):
+    if not has_alpha(image):
+        return image.convert("RGB")
+    image = image.convert("RGBA")
+    if fmt == "webp":
+        return image
+    # JPEG has no alpha channel, flatten onto white
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def render_variants(data, widths, formats, quality):
+    """
+    Render the image in `data` at each of `widths` in each of `formats`.
+    Returns (width, height, [(format, width, height, bytes), ...]). Runs in
+    the worker's process pool, so it only deals in plain data.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        width, height = image.size
+        rendered = []
+        for target in sorted({min(w, width) for w in widths}):
+            resized = image
+            if target != width:
+                resized = image.resize(
+                    (target, max(1, round(height * target / width))),
+                    Image.Resampling.LANCZOS,
+                )
+            for fmt in formats:
+                output = io.BytesIO()
+                prepare(resized, fmt).save(
+                    output, format=fmt.upper(), quality=quality, optimize=True
+                )
+                rendered.append((fmt, target, resized.height, output.getvalue()))
+    return width, height, rendered
+
+
+def pending(model, field_name):
+    return (
+        model.objects.exclude(**{field_name: ""})
+        .exclude(**{f"{field_name}__isnull": True})
+        .filter(**{variants_field(field_name): {}})
+    )
+
+
+def variant_name(source, width, fmt):
+    directory, filename = os.path.split(source)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, "variants", f"{stem}-{width}.{EXTENSIONS[fmt]}")
+
+
+def store_variants(field_file, result):
+    width, height, rendered = result
+    variants = {}
+    for fmt, variant_width, variant_height, data in rendered:
+        name = field_file.storage.save(
+            variant_name(field_file.name, variant_width, fmt), ContentFile(data)
+        )
+        variants.setdefault(fmt, {})[str(variant_width)] = {
+            "name": name,
+            "width": variant_width,
+            "height": variant_height,
+        }
+    return {"source": field_file.name, "width": width, "height": height, "variants": variants}
+
+
+def generate_image_variants(executor, batch_size):
+    """
+    Render variants for up to `batch_size` pending images of each model on
+    `executor` (a process pool) and record them. Returns how many images were
+    processed. Images that cannot be read or decoded are recorded with an
+    error so they are not retried until replaced.
+    """
+    jobs = []
+    for model, field_name in IMAGE_FIELDS.items():
+        for instance in pending(model, field_name)[:batch_size]:
+            field_file = getattr(instance, field_name)
+            try:
+                with field_file.open("rb"):
+                    data = field_file.read()
+            except OSError as e:
+                jobs.append((model, instance.pk, field_name, field_file, None, e))
+                continue
+            future = executor.submit(
+                render_variants,
+                data,
+                settings.IMAGE_VARIANT_WIDTHS,
+                settings.IMAGE_VARIANT_FORMATS,
+                settings.IMAGE_VARIANT_QUALITY,
+            )
+            jobs.append((model, instance.pk, field_name, field_file, future, None))
+
+    updated = 0
+    for model, pk, field_name, field_file, future, error in jobs:
+        if error is None:
+            try:
+                variants = store_variants(field_file, future.result())
+            except Exception as e:
+                error = e
+        if error is not None:
+            logger.warning(
+                "Could not render variants of %s: %s", field_file.name, error
+            )
+            variants = {"source": field_file.name, "error": str(error)}
+        # Skip the row if its image was replaced while rendering
+        updated += model.objects.filter(pk=pk, **{field_name: field_file.name}).update(
+            **{variants_field(field_name): variants}
+        )
+    if updated:
+        # Cached catalog responses still list these images without variants
+        invalidate_catalog_snapshots()
+    return len(jobs)
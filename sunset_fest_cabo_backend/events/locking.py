@@ -0,0 +1,51 @@
+from django.db import connection
+from django.utils import timezone
+
+from .models import AddOn, Event, Room, RoomHold, TicketHold
+
+
+def lock_inventory(pricing_plan_id=None, room_ids=(), add_on_ids=()):
+    """
+    Take row locks (SELECT ... FOR UPDATE) on what a hold or booking is about
+    to check and consume, so concurrent requests for the same inventory queue
+    up instead of overselling it: the event of the pricing plan, since ticket
+    holds count against every plan and add-on of the event, then the rooms
+    and add-ons. Rows are always locked in that order, and in primary key
+    order within a model, so two requests can never deadlock.
+
+    Must be called inside a transaction. On SQLite, which has no row locks,
+    this is a no-op and writes are serialized by the database lock instead.
+    """
+    if pricing_plan_id is not None:
+        list(
+            Event.objects.select_for_update(of=("self",))
+            .filter(dates__pricing_plans=pricing_plan_id)
+            .values_list("id", flat=True)
+        )
+    if room_ids:
+        list(
+            Room.objects.select_for_update()
+            .filter(id__in=room_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+    if add_on_ids:
+        list(
+            AddOn.objects.select_for_update()
+            .filter(id__in=add_on_ids)
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+
+
+def claim_expired_holds(model, batch_size):
+    """
+    Return ids of up to `batch_size` expired holds of `model` (TicketHold or
+    RoomHold), locked for deletion. Rows another transaction is holding, such
+    as a hold being extended, are skipped (SKIP LOCKED) rather than waited on.
+    """
+    assert model in (TicketHold, RoomHold)
+    queryset = model.objects.filter(expires_at__lte=timezone.now())
+    if connection.features.has_select_for_update_skip_locked:
+        queryset = queryset.select_for_update(skip_locked=True)
+    return list(queryset.order_by("expires_at").values_list("id", flat=True)[:batch_size])
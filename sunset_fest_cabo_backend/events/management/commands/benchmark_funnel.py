@@ -0,0 +1,295 @@
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import statistics
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from events.models import AddOn, Booking, GroupSize, PricingPlan, Room
+from events.seed import seed_catalog
+from events.snapshots import invalidate_catalog_snapshots
+from payments.models import Payment
+
+WEBHOOK_SECRET = "whsec_benchmark"
+PERCENTILES = (50, 90, 95, 99)
+
+
+class Rollback(Exception):
+    pass
+
+
+class FakeStripeSessions:
+    """
+    Stand-in for stripe.checkout.Session that answers instantly, so the
+    checkout scenario measures our side of the call only.
+    """
+
+    def __init__(self):
+        self.ids = itertools.count()
+
+    def create(self, **kwargs):
+        return SimpleNamespace(
+            id=f"cs_benchmark_{next(self.ids)}",
+            url="https://checkout.stripe.test/pay",
+            expires_at=int(time.time()) + 24 * 60 * 60,
+        )
+
+    def expire(self, session_id):
+        pass
+
+
+def percentile(values, p):
+    # Nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def stripe_signature(payload):
+    timestamp = int(time.time())
+    signature = hmac.new(
+        WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256
+    ).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the booking funnel end to end on a seeded festival and report "
+        "latency percentiles and query counts per scenario"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument(
+            "--events", type=int, default=3, help="Events in the seeded catalog"
+        )
+        parser.add_argument(
+            "--output",
+            default="benchmark-results.json",
+            help="File the results are written to as JSON",
+        )
+        parser.add_argument(
+            "--compare", help="Earlier results file to print the difference against"
+        )
+
+    def handle(self, *args, **options):
+        self.client = Client()
+        self.stripe = FakeStripeSessions()
+        results = {}
+
+        # Everything runs in one transaction that is rolled back, with reads
+        # on the primary (a replica would not see the seeded rows) and
+        # writes inline rather than through the SQLite write queue
+        with override_settings(
+            REPLICA_DATABASE_ALIAS=None,
+            SQLITE_WRITE_QUEUE=False,
+            STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET,
+        ), mock.patch("payments.views.stripe.checkout.Session", self.stripe):
+            try:
+                with transaction.atomic():
+                    self.seed(options["events"])
+                    for name, scenario in self.scenarios():
+                        results[name] = self.measure(
+                            name, scenario, options["iterations"], options["warmup"]
+                        )
+                    raise Rollback
+            except Rollback:
+                pass
+
+        report = {
+            "created_at": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "iterations": options["iterations"],
+            "catalog_events": options["events"],
+            "scenarios": results,
+        }
+        with open(options["output"], "w") as f:
+            json.dump(report, f, indent=2)
+
+        baseline = None
+        if options["compare"]:
+            with open(options["compare"]) as f:
+                baseline = json.load(f)["scenarios"]
+        self.print_report(results, baseline)
+        self.stdout.write(f"Results written to {options['output']}")
+
+    def seed(self, events):
+        seed_catalog(events=events)
+        self.pricing_plan = PricingPlan.objects.select_related("event_date__event").first()
+        self.event = self.pricing_plan.event_date.event
+        self.group_size = GroupSize.objects.filter(pricing_plan=self.pricing_plan).first()
+        self.add_on = AddOn.objects.filter(event=self.event).first()
+        self.date = self.add_on.time_slots.first().start_time.date().isoformat()
+        self.rooms = list(Room.objects.values_list("id", flat=True))
+
+    def scenarios(self):
+        """
+        (name, generator of request thunks). Each generator prepares what
+        its next request needs before yielding, so that work is not timed.
+        The list routes are served from cached snapshots (events.snapshots),
+        so they are timed both rendering every request and from the cache.
+        """
+        return [
+            ("catalog_list_cold", self.cold(self.catalog_list())),
+            ("catalog_list_warm", self.warm(self.catalog_list())),
+            ("addon_grid_cold", self.cold(self.addon_grid())),
+            ("addon_grid_warm", self.warm(self.addon_grid())),
+            ("availability_poll", self.availability_poll()),
+            ("combined_hold", self.combined_hold()),
+            ("booking_create", self.booking_create()),
+            ("checkout_session", self.checkout_session()),
+            ("stripe_webhook", self.stripe_webhook()),
+        ]
+
+    def cold(self, requests):
+        for send in requests:
+            invalidate_catalog_snapshots()
+            yield send
+
+    def warm(self, requests):
+        # Renders the snapshot the timed requests are served from
+        next(requests)()
+        yield from requests
+
+    def catalog_list(self):
+        url = reverse("event-list")
+        while True:
+            yield lambda: self.client.get(url)
+
+    def addon_grid(self):
+        url = reverse("addon-list")
+        params = {"event_id": str(self.event.id), "date": self.date}
+        while True:
+            yield lambda: self.client.get(url, params)
+
+    def availability_poll(self):
+        url = reverse("addon-availability", args=[self.add_on.id])
+        while True:
+            yield lambda: self.client.get(url, {"date": self.date})
+
+    def combined_hold(self):
+        rooms = itertools.cycle(self.rooms)
+        while True:
+            data = {
+                "pricing_plan_id": str(self.pricing_plan.id),
+                "number_of_tickets": 1,
+                "room_holds": [{"room_id": str(next(rooms)), "quantity": "1"}],
+            }
+            yield lambda: self.client.post(
+                reverse("combined-hold"), data, content_type="application/json"
+            )
+
+    def booking_payload(self, room_id):
+        return {
+            "event_date": str(self.pricing_plan.event_date_id),
+            "pricing_plan": str(self.pricing_plan.id),
+            "group_size": str(self.group_size.id),
+            "user_email": "benchmark@example.com",
+            "rooms": [{"room_id": str(room_id), "quantity": 1}],
+        }
+
+    def booking_create(self):
+        rooms = itertools.cycle(self.rooms)
+        while True:
+            data = self.booking_payload(next(rooms))
+            yield lambda: self.client.post(
+                reverse("booking-list"), data, content_type="application/json"
+            )
+
+    def new_booking(self):
+        return Booking.objects.create(
+            event_date_id=self.pricing_plan.event_date_id,
+            pricing_plan=self.pricing_plan,
+            group_size=self.group_size,
+            user_email="benchmark@example.com",
+            total_price=0,
+        )
+
+    def checkout_session(self):
+        while True:
+            url = reverse("payments:create-checkout-session", args=[self.new_booking().id])
+            yield lambda: self.client.post(url)
+
+    def stripe_webhook(self):
+        sessions = itertools.count()
+        while True:
+            session_id = f"cs_webhook_{next(sessions)}"
+            Payment.objects.create(
+                booking=self.new_booking(),
+                amount=0,
+                currency="USD",
+                stripe_session_id=session_id,
+                session_expires_at=timezone.now() + timedelta(hours=24),
+            )
+            payload = json.dumps(
+                {
+                    "id": f"evt_{session_id}",
+                    "object": "event",
+                    "type": "checkout.session.completed",
+                    "data": {"object": {"id": session_id, "object": "checkout.session"}},
+                }
+            )
+            signature = stripe_signature(payload)
+            yield lambda: self.client.post(
+                reverse("payments:stripe-webhook"),
+                payload,
+                content_type="application/json",
+                HTTP_STRIPE_SIGNATURE=signature,
+            )
+
+    def measure(self, name, scenario, iterations, warmup):
+        timings, queries = [], []
+        for i in range(warmup + iterations):
+            send = next(scenario)
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = send()
+                elapsed = (time.perf_counter() - start) * 1000
+            if response.status_code >= 400:
+                raise CommandError(
+                    f"{name} returned {response.status_code}: {response.content[:300]!r}"
+                )
+            if i >= warmup:
+                timings.append(elapsed)
+                queries.append(len(captured))
+
+        return {
+            "requests": len(timings),
+            **{f"p{p}_ms": round(percentile(timings, p), 3) for p in PERCENTILES},
+            "max_ms": round(max(timings), 3),
+            "mean_ms": round(statistics.mean(timings), 3),
+            "queries_median": statistics.median(queries),
+            "queries_max": max(queries),
+        }
+
+    def print_report(self, results, baseline=None):
+        self.stdout.write(
+            f"{'scenario':<20}{'p50 ms':>10}{'p90 ms':>10}{'p95 ms':>10}"
+            f"{'p99 ms':>10}{'queries':>10}"
+        )
+        for name, result in results.items():
+            line = (
+                f"{name:<20}{result['p50_ms']:>10.2f}{result['p90_ms']:>10.2f}"
+                f"{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['queries_median']:>10g}"
+            )
+            if baseline and name in baseline:
+                before = baseline[name]
+                change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100
+                line += (
+                    f"   p50 {change:+.1f}%, queries "
+                    f"{result['queries_median'] - before['queries_median']:+g}"
+                )
+            self.stdout.write(line)
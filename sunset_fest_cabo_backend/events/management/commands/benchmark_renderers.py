@@ -0,0 +1,75 @@
+import gzip
+import io
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from core.parsers import ORJSONParser
+from core.renderers import MessagePackRenderer, ORJSONRenderer, msgpack
+from events.models import AddOn, Event, Room
+from events.seed import seed_catalog
+from events.serializers import AddOnSerializer, EventSerializer, RoomSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = "Compare encode time and payload size of the API renderers on a seeded catalog"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--events", type=int, default=3)
+        parser.add_argument("--iterations", type=int, default=50)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                seed_catalog(events=options["events"])
+                data = {
+                    "events": EventSerializer(Event.objects.all(), many=True).data,
+                    "rooms": RoomSerializer(Room.objects.all(), many=True).data,
+                    "add_ons": AddOnSerializer(AddOn.objects.all(), many=True).data,
+                }
+                raise Rollback
+        except Rollback:
+            pass
+
+        renderers = [JSONRenderer(), ORJSONRenderer()]
+        if msgpack is not None:
+            renderers.append(MessagePackRenderer())
+        else:
+            self.stdout.write("msgpack is not installed, skipping MessagePackRenderer")
+
+        iterations = options["iterations"]
+        for renderer in renderers:
+            body = renderer.render(data)
+            timings = self.time(lambda: renderer.render(data), iterations)
+            self.stdout.write(
+                f"{type(renderer).__name__:<22} "
+                f"median {statistics.median(timings):7.2f} ms, "
+                f"min {min(timings):7.2f} ms, "
+                f"{len(body):>8} bytes, "
+                f"{len(gzip.compress(body)):>7} bytes gzipped"
+            )
+
+        body = JSONRenderer().render(data)
+        for parser in (JSONParser(), ORJSONParser()):
+            timings = self.time(lambda: parser.parse(io.BytesIO(body)), iterations)
+            self.stdout.write(
+                f"{type(parser).__name__:<22} "
+                f"median {statistics.median(timings):7.2f} ms, "
+                f"min {min(timings):7.2f} ms"
+            )
+
+    def time(self, fn, iterations):
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            fn()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,60 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import models
+
+from core.storage import is_content_addressed
+
+
+class Command(BaseCommand):
+    help = (
+        "Move files uploaded before content-addressed storage to their hashed "
+        "names, merging duplicates, and point every file field at them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--delete-originals",
+            action="store_true",
+            help="Delete the old files once no row refers to them",
+        )
+
+    def handle(self, *args, **options):
+        # (storage, old name) -> new name
+        moved = {}
+        for model in apps.get_models():
+            for field in model._meta.get_fields():
+                if isinstance(field, models.FileField):
+                    self.migrate_field(model, field, moved)
+
+        stored = set(moved.values())
+        self.stdout.write(f"Moved {len(moved)} file(s) to {len(stored)} stored file(s)")
+
+        if options["delete_originals"]:
+            for storage, old_name in moved:
+                if storage.exists(old_name):
+                    storage.delete(old_name)
+            self.stdout.write(f"Deleted {len(moved)} original file(s)")
+
+    def migrate_field(self, model, field, moved):
+        storage = field.storage
+        variants_attr = f"{field.name}_variants"
+        rows = model.objects.exclude(**{field.name: ""}).exclude(
+            **{f"{field.name}__isnull": True}
+        )
+        for row in rows.iterator():
+            old_name = getattr(row, field.attname).name
+            if is_content_addressed(old_name):
+                continue
+            key = (storage, old_name)
+            if key not in moved:
+                if not storage.exists(old_name):
+                    self.stderr.write(f"Missing file {old_name}, skipped")
+                    continue
+                with storage.open(old_name, "rb") as content:
+                    moved[key] = storage.save(old_name, content)
+
+            changes = {field.name: moved[key]}
+            variants = getattr(row, variants_attr, None)
+            if variants and variants.get("source") == old_name:
+                changes[variants_attr] = {**variants, "source": moved[key]}
+            model.objects.filter(pk=row.pk).update(**changes)
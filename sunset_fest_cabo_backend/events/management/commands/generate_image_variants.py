@@ -0,0 +1,47 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from events.images import generate_image_variants
+
+
+class Command(BaseCommand):
+    help = "Render resized WebP/JPEG variants of uploaded catalog images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Maximum number of images per model taken per round",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMAGE_VARIANT_WORKERS,
+            help="Size of the rendering process pool",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=10.0,
+            help="Seconds to sleep when no image is pending",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Process pending images once and exit instead of running as a worker",
+        )
+
+    def handle(self, *args, **options):
+        with ProcessPoolExecutor(max_workers=options["workers"]) as executor:
+            while True:
+                processed = generate_image_variants(executor, options["batch_size"])
+                if processed:
+                    self.stdout.write(f"Processed {processed} image(s)")
+                    continue
+                if options["once"]:
+                    break
+                time.sleep(options["interval"])
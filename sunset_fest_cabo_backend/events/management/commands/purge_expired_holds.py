@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from events.locking import claim_expired_holds
+from events.models import RoomHold, TicketHold
+
+
+class Command(BaseCommand):
+    help = "Delete expired ticket and room holds without blocking hold creation"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model in (TicketHold, RoomHold):
+            deleted = 0
+            while True:
+                with transaction.atomic():
+                    ids = claim_expired_holds(model, options["batch_size"])
+                    if ids:
+                        model.objects.filter(id__in=ids).delete()
+                deleted += len(ids)
+                if len(ids) < options["batch_size"]:
+                    break
+            self.stdout.write(f"Deleted {deleted} expired {model._meta.verbose_name}s")
@@ -0,0 +1,45 @@
+from django.utils import timezone
+
+from core.metrics import Counter, Gauge, Histogram
+
+AVAILABILITY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def active_holds():
+    from .models import RoomHold, TicketHold
+
+    now = timezone.now()
+    return {
+        ("ticket",): TicketHold.objects.filter(expires_at__gt=now).count(),
+        ("room",): RoomHold.objects.filter(expires_at__gt=now).count(),
+    }
+
+
+holds_created = Counter(
+    "holds_created_total", "Combined ticket and room holds created"
+)
+hold_tickets = Counter("hold_tickets_total", "Tickets placed on hold")
+# reason is "invalid" (including sold out) or "lost_race"
+holds_rejected = Counter(
+    "holds_rejected_total", "Combined hold requests turned down", ["reason"]
+)
+hold_seconds = Histogram(
+    "hold_request_seconds", "Time to serve a combined hold request"
+)
+# Conversion is bookings_created_total{from_hold="true"} / holds_created_total
+bookings_created = Counter("bookings_created_total", "Bookings created", ["from_hold"])
+booking_seconds = Histogram(
+    "booking_create_seconds", "Time to serve a booking creation request"
+)
+availability_seconds = Histogram(
+    "availability_seconds",
+    "Time to compute the availability of one item",
+    ["kind"],
+    buckets=AVAILABILITY_BUCKETS,
+)
+stream_subscribers = Gauge(
+    "availability_stream_subscribers", "Open availability streams"
+)
+holds_active = Gauge(
+    "holds_active", "Unexpired holds", ["type"], function=active_holds
+)
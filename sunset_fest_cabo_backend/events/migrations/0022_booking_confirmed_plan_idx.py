@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 22:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0021_booking_is_paid'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(condition=models.Q(('status', 'CONFIRMED')), fields=['pricing_plan'], name='booking_confirmed_plan_idx'),
+        ),
+    ]
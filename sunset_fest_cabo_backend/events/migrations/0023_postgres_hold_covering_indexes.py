@@ -0,0 +1,39 @@
+from django.db import migrations
+
+# Covering indexes let PostgreSQL sum active holds with an index-only scan.
+# SQLite has no INCLUDE support and keeps the plain (x, expires_at) indexes.
+INDEXES = [
+    (
+        "tickethold_active_covering_idx",
+        "events_tickethold (pricing_plan_id, expires_at) INCLUDE (number_of_tickets)",
+    ),
+    (
+        "roomhold_active_covering_idx",
+        "events_roomhold (room_id, expires_at) INCLUDE (quantity)",
+    ),
+]
+
+
+def create_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, definition in INDEXES:
+        schema_editor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0022_booking_confirmed_plan_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
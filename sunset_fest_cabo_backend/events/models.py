@@ -1,10 +1,39 @@
+import asyncio
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 import uuid
 from django.contrib.auth import get_user_model
 from datetime import timedelta
 
+from core.tracing import traced
+
+from .metrics import availability_seconds
+
+
+def sum_of(queryset, field):
+    """
+    Correlated subquery summing `field` over `queryset`, 0 when it is empty.
+    SUM as a plain function keeps the subquery ungrouped.
+    """
+    total = queryset.order_by().annotate(
+        total=models.Func(models.F(field), function="SUM")
+    )
+    return Coalesce(models.Subquery(total.values("total")), 0)
+
+
+# Availability is computed from holds and bookings, which only the primary
+# has up to date, so annotated catalog querysets never go to the replica
+AVAILABILITY_DATABASE = "default"
+
+
+def active_ticket_holds(event_id):
+    # Ticket holds are counted against every plan, add-on and slot of the event
+    return TicketHold.objects.filter(
+        pricing_plan__event_date__event_id=event_id, expires_at__gt=timezone.now()
+    )
+
 
 class Event(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -12,6 +41,7 @@ class Event(models.Model):
     description = models.TextField()
     event_type = models.CharField(max_length=100)
     image = models.ImageField(upload_to="events/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ["title"]
@@ -44,6 +74,30 @@ class Feature(models.Model):
         return self.name
 
 
+class PricingPlanQuerySet(models.QuerySet):
+    def with_availability(self):
+        """
+        Annotate `available_tickets`, what get_available_tickets() returns,
+        so a list costs no query per plan.
+        """
+        return self.using(AVAILABILITY_DATABASE).annotate(
+            available_tickets=models.ExpressionWrapper(
+                models.F("total_tickets")
+                - sum_of(
+                    Booking.objects.filter(
+                        pricing_plan=models.OuterRef("pk"), status="CONFIRMED"
+                    ),
+                    "group_size__number_of_persons",
+                )
+                - sum_of(
+                    active_ticket_holds(models.OuterRef("event_date__event_id")),
+                    "number_of_tickets",
+                ),
+                output_field=models.IntegerField(),
+            )
+        )
+
+
 class PricingPlan(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     event_date = models.ForeignKey(
@@ -55,27 +109,34 @@ class PricingPlan(models.Model):
     banner_image = models.ImageField(
         upload_to="pricing_banners/", null=True, blank=True
     )
+    banner_image_variants = models.JSONField(default=dict, blank=True, editable=False)
     feature = models.ManyToManyField(Feature, related_name="features")
     total_tickets = models.PositiveIntegerField(default=0)
 
+    objects = PricingPlanQuerySet.as_manager()
+
     def clean(self):
         pass  # Removed available_tickets validation as it's now dynamic
 
+    @availability_seconds.time(kind="pricing_plan")
+    @traced()
     def get_available_tickets(self):
         # Calculate tickets used by confirmed bookings
-        confirmed_bookings = Booking.objects.filter(
-            pricing_plan=self, status="CONFIRMED"
-        )
-        tickets_used = sum(
-            booking.group_size.number_of_persons for booking in confirmed_bookings
+        tickets_used = (
+            Booking.objects.filter(pricing_plan=self, status="CONFIRMED").aggregate(
+                total=models.Sum("group_size__number_of_persons")
+            )["total"]
+            or 0
         )
 
         # Calculate tickets currently held
-        active_holds = TicketHold.objects.filter(
-            pricing_plan__event_date__event=self.event_date.event,
-            expires_at__gt=timezone.now(),
+        held_tickets = (
+            TicketHold.objects.filter(
+                pricing_plan__event_date__event__dates=self.event_date_id,
+                expires_at__gt=timezone.now(),
+            ).aggregate(total=models.Sum("number_of_tickets"))["total"]
+            or 0
         )
-        held_tickets = sum(hold.number_of_tickets for hold in active_holds)
 
         return self.total_tickets - tickets_used - held_tickets
 
@@ -128,11 +189,36 @@ class AccommodationImage(models.Model):
         Accommodation, on_delete=models.CASCADE, related_name="images"
     )
     image = models.ImageField(upload_to="accommodation_images/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Image for {self.accommodation.title}"
 
 
+class RoomQuerySet(models.QuerySet):
+    def with_availability(self):
+        """Annotate `available_rooms`, what get_available_rooms() returns."""
+        return self.using(AVAILABILITY_DATABASE).annotate(
+            available_rooms=Greatest(
+                models.F("total_rooms")
+                - sum_of(
+                    BookingRoom.objects.filter(
+                        room=models.OuterRef("pk"), booking__status="CONFIRMED"
+                    ),
+                    "quantity",
+                )
+                - sum_of(
+                    RoomHold.objects.filter(
+                        room=models.OuterRef("pk"), expires_at__gt=timezone.now()
+                    ),
+                    "quantity",
+                ),
+                0,
+                output_field=models.IntegerField(),
+            )
+        )
+
+
 class Room(models.Model):
     BED_TYPE_CHOICES = [
         ("single", "Single Bed"),
@@ -158,6 +244,8 @@ class Room(models.Model):
         default=0, help_text="Total number of rooms available"
     )
 
+    objects = RoomQuerySet.as_manager()
+
     def clean(self):
         if self.total_rooms < 0:
             raise ValidationError("Total rooms cannot be negative")
@@ -172,6 +260,8 @@ class Room(models.Model):
             return 2  # or 4 if it's a king suite
         return 2  # default
 
+    @availability_seconds.time(kind="room")
+    @traced()
     def get_available_rooms(self):
         # Get all confirmed bookings for this room type through BookingRoom
         confirmed_bookings = (
@@ -248,11 +338,32 @@ class RoomImage(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to="room_images/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
 
     def __str__(self):
         return f"Image for {self.room.title}"
 
 
+class AddOnQuerySet(models.QuerySet):
+    def with_availability(self):
+        """Annotate `available_tickets`, what get_available_tickets() returns."""
+        return self.using(AVAILABILITY_DATABASE).annotate(
+            available_tickets=models.ExpressionWrapper(
+                models.F("total_tickets")
+                - sum_of(
+                    Booking.objects.filter(
+                        add_ons=models.OuterRef("pk"), status="CONFIRMED"
+                    ),
+                    "group_size__number_of_persons",
+                )
+                - sum_of(
+                    active_ticket_holds(models.OuterRef("event_id")), "number_of_tickets"
+                ),
+                output_field=models.IntegerField(),
+            )
+        )
+
+
 class AddOn(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     event = models.ForeignKey(
@@ -262,29 +373,84 @@ class AddOn(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image = models.ImageField(upload_to="addon_images/", null=True, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     total_tickets = models.PositiveIntegerField(default=0)
     min_persons = models.PositiveIntegerField(default=1)
     has_time_slots = models.BooleanField(default=False)
 
+    objects = AddOnQuerySet.as_manager()
+
+    @availability_seconds.time(kind="add_on")
     def get_available_tickets(self):
         # Calculate tickets used by confirmed bookings
-        confirmed_bookings = Booking.objects.filter(add_ons=self, status="CONFIRMED")
-        tickets_used = sum(
-            booking.group_size.number_of_persons for booking in confirmed_bookings
+        tickets_used = (
+            Booking.objects.filter(add_ons=self, status="CONFIRMED").aggregate(
+                total=models.Sum("group_size__number_of_persons")
+            )["total"]
+            or 0
         )
 
         # Calculate tickets currently held
-        active_holds = TicketHold.objects.filter(
-            pricing_plan__event_date__event=self.event, expires_at__gt=timezone.now()
+        held_tickets = (
+            TicketHold.objects.filter(
+                pricing_plan__event_date__event_id=self.event_id,
+                expires_at__gt=timezone.now(),
+            ).aggregate(total=models.Sum("number_of_tickets"))["total"]
+            or 0
         )
-        held_tickets = sum(hold.number_of_tickets for hold in active_holds)
 
         return self.total_tickets - tickets_used - held_tickets
 
+    @availability_seconds.time(kind="add_on")
+    async def aget_available_tickets(self, held_tickets=None):
+        # Async get_available_tickets. `held_tickets` may be passed in when it
+        # is already known for the event
+        tickets_used = Booking.objects.filter(
+            add_ons=self, status="CONFIRMED"
+        ).aaggregate(total=models.Sum("group_size__number_of_persons"))
+        if held_tickets is None:
+            tickets_used, held_tickets = await asyncio.gather(
+                tickets_used, AddOn.aheld_tickets(self.event_id)
+            )
+        else:
+            tickets_used = await tickets_used
+        return self.total_tickets - (tickets_used["total"] or 0) - held_tickets
+
+    @staticmethod
+    async def aheld_tickets(event_id):
+        # Tickets currently held for the event, shared by its add-ons and slots
+        held = await TicketHold.objects.filter(
+            pricing_plan__event_date__event_id=event_id, expires_at__gt=timezone.now()
+        ).aaggregate(total=models.Sum("number_of_tickets"))
+        return held["total"] or 0
+
     def __str__(self):
         return self.title
 
 
+class AddOnTimeSlotQuerySet(models.QuerySet):
+    def with_availability(self):
+        """
+        Annotate `available_capacity`, what get_available_capacity() returns.
+        """
+        return self.using(AVAILABILITY_DATABASE).annotate(
+            available_capacity=models.ExpressionWrapper(
+                models.F("total_capacity")
+                - sum_of(
+                    BookingAddOn.objects.filter(
+                        time_slot=models.OuterRef("pk"), booking__status="CONFIRMED"
+                    ),
+                    "quantity",
+                )
+                - sum_of(
+                    active_ticket_holds(models.OuterRef("add_on__event_id")),
+                    "number_of_tickets",
+                ),
+                output_field=models.IntegerField(),
+            )
+        )
+
+
 class AddOnTimeSlot(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     add_on = models.ForeignKey(
@@ -297,6 +463,8 @@ class AddOnTimeSlot(models.Model):
         max_digits=10, decimal_places=2, null=True, blank=True
     )
 
+    objects = AddOnTimeSlotQuerySet.as_manager()
+
     class Meta:
         ordering = ["start_time"]
 
@@ -304,22 +472,53 @@ class AddOnTimeSlot(models.Model):
         if self.end_time and self.start_time > self.end_time:
             raise ValidationError("End time must be after start time")
 
+    @availability_seconds.time(kind="time_slot")
     def get_available_capacity(self):
         # Calculate capacity used by confirmed bookings
-        confirmed_bookings = BookingAddOn.objects.filter(
-            time_slot=self, booking__status="CONFIRMED"
+        capacity_used = (
+            BookingAddOn.objects.filter(
+                time_slot=self, booking__status="CONFIRMED"
+            ).aggregate(total=models.Sum("quantity"))["total"]
+            or 0
         )
-        capacity_used = sum(booking.quantity for booking in confirmed_bookings)
 
         # Calculate capacity currently held
-        active_holds = TicketHold.objects.filter(
-            pricing_plan__event_date__event=self.add_on.event,
-            expires_at__gt=timezone.now(),
+        held_capacity = (
+            TicketHold.objects.filter(
+                pricing_plan__event_date__event__AddOn=self.add_on_id,
+                expires_at__gt=timezone.now(),
+            ).aggregate(total=models.Sum("number_of_tickets"))["total"]
+            or 0
         )
-        held_capacity = sum(hold.number_of_tickets for hold in active_holds)
 
         return self.total_capacity - capacity_used - held_capacity
 
+    @staticmethod
+    async def acapacity_used(time_slot_ids):
+        # Capacity taken by confirmed bookings, {slot id: quantity} for the
+        # slots that have any, in one grouped query
+        rows = (
+            BookingAddOn.objects.filter(
+                time_slot_id__in=time_slot_ids, booking__status="CONFIRMED"
+            )
+            .order_by()
+            .values("time_slot_id")
+            .annotate(total=models.Sum("quantity"))
+        )
+        return {row["time_slot_id"]: row["total"] async for row in rows}
+
+    @availability_seconds.time(kind="time_slot")
+    async def aget_available_capacity(self, held_capacity=None):
+        # Async get_available_capacity. `held_capacity` may be passed in when
+        # it is already known for the add-on's event, e.g. for a list of slots
+        capacity_used = await BookingAddOn.objects.filter(
+            time_slot=self, booking__status="CONFIRMED"
+        ).aaggregate(total=models.Sum("quantity"))
+        if held_capacity is None:
+            add_on = await AddOn.objects.only("event_id").aget(id=self.add_on_id)
+            held_capacity = await AddOn.aheld_tickets(add_on.event_id)
+        return self.total_capacity - (capacity_used["total"] or 0) - held_capacity
+
     def __str__(self):
         return f"{self.add_on.title} - {self.start_time.strftime('%Y-%m-%d %H:%M')}"
 
@@ -453,6 +652,16 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Availability only ever counts confirmed bookings
+            models.Index(
+                fields=["pricing_plan"],
+                condition=models.Q(status="CONFIRMED"),
+                name="booking_confirmed_plan_idx",
+            ),
+        ]
+
     def validate_tickets(self):
         tickets_needed = self.group_size.number_of_persons
 
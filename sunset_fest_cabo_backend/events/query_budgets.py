@@ -0,0 +1,30 @@
+# Most queries per request for each route, on the query budget fixture
+# (see core/query_budgets.py). Enforced by QueryBudgetTests in tests.py.
+QUERY_BUDGETS = {
+    ("api-root", "GET"): 0,
+    ("event-list", "GET"): 4,
+    ("event-detail", "GET"): 4,
+    ("eventdate-list", "GET"): 3,
+    ("eventdate-detail", "GET"): 3,
+    ("pricingplan-list", "GET"): 2,
+    ("pricingplan-detail", "GET"): 2,
+    ("groupsize-list", "GET"): 1,
+    ("groupsize-detail", "GET"): 1,
+    ("accommodation-list", "GET"): 2,
+    ("accommodation-detail", "GET"): 2,
+    ("room-list", "GET"): 3,
+    ("room-detail", "GET"): 3,
+    ("addon-list", "GET"): 2,
+    ("addon-detail", "GET"): 2,
+    ("addontimeslot-list", "GET"): 1,
+    ("addontimeslot-detail", "GET"): 1,
+    ("booking-list", "GET"): 7,
+    ("booking-list", "POST"): 18,
+    ("booking-detail", "GET"): 7,
+    ("booking-detail", "PATCH"): 16,
+    ("addon-availability", "GET"): 5,
+    ("addon-time-slot-availability", "GET"): 3,
+    ("time-slot-availability", "GET"): 3,
+    ("availability-stream", "GET"): 6,
+    ("combined-hold", "POST"): 24,
+}
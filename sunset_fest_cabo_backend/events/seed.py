@@ -0,0 +1,199 @@
+"""
+Synthetic festival catalog for benchmarks and query budgets, shaped like the
+production one: several events with dated pricing plans, features, group
+sizes, hotels with rooms and images, and add-ons with time slots, plus the
+bookings and holds made against it.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .models import (
+    Accommodation,
+    AccommodationImage,
+    AddOn,
+    AddOnTimeSlot,
+    Booking,
+    BookingAddOn,
+    BookingRoom,
+    Event,
+    EventDate,
+    Feature,
+    GroupSize,
+    PricingPlan,
+    Room,
+    RoomHold,
+    RoomImage,
+    TicketHold,
+)
+
+DESCRIPTION = (
+    "Three days of music on the beach in Cabo San Lucas, with sunset sets, "
+    "pool parties and late night shows across four stages."
+)
+
+
+def seed_catalog(events=3, dates=3, plans=3, accommodations=2, rooms=3, add_ons=4, time_slots=6):
+    """
+    Create the catalog and return the events. Meant to be run inside a
+    transaction that is rolled back afterwards.
+    """
+    now = timezone.now()
+    features = [Feature.objects.create(name=f"Feature {i}") for i in range(8)]
+    created = []
+    for e in range(events):
+        event = Event.objects.create(
+            title=f"Sunset Fest {e}",
+            description=DESCRIPTION,
+            event_type="festival",
+            image=f"events/event-{e}.jpg",
+        )
+        created.append(event)
+        for d in range(dates):
+            event_date = EventDate.objects.create(
+                event=event,
+                date=now + timedelta(days=30 + d),
+                city="Cabo San Lucas",
+                title=f"Day {d + 1}",
+                description=DESCRIPTION,
+            )
+            for p in range(plans):
+                pricing_plan = PricingPlan.objects.create(
+                    event_date=event_date,
+                    title=f"Tier {p + 1}",
+                    description=DESCRIPTION,
+                    price=Decimal("149.99") + 50 * p,
+                    banner_image=f"pricing_banners/banner-{p}.jpg",
+                    total_tickets=500,
+                )
+                pricing_plan.feature.set(features[: 3 + p])
+                for persons in (1, 2, 4):
+                    GroupSize.objects.create(
+                        pricing_plan=pricing_plan,
+                        number_of_persons=persons,
+                        base_price=Decimal("25.50") * persons,
+                    )
+                for a in range(accommodations):
+                    accommodation = Accommodation.objects.create(
+                        pricing_plan=pricing_plan,
+                        title=f"Hotel {a + 1}",
+                        description=DESCRIPTION,
+                        rating=4.5,
+                        price=Decimal("210.00"),
+                        total_tickets=100,
+                    )
+                    AccommodationImage.objects.create(
+                        accommodation=accommodation, image="accommodation_images/hotel.jpg"
+                    )
+                    for r in range(rooms):
+                        room = Room.objects.create(
+                            accommodation=accommodation,
+                            title=f"Room type {r + 1}",
+                            description=DESCRIPTION,
+                            price=Decimal("180.00") + 40 * r,
+                            total_rooms=20,
+                        )
+                        RoomImage.objects.create(room=room, image="room_images/room.jpg")
+        for a in range(add_ons):
+            add_on = AddOn.objects.create(
+                event=event,
+                title=f"Add-on {a + 1}",
+                description=DESCRIPTION,
+                price=Decimal("45.00"),
+                image="addon_images/addon.jpg",
+                total_tickets=200,
+                has_time_slots=True,
+            )
+            for s in range(time_slots):
+                start = now.replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(
+                    days=30, hours=2 * s
+                )
+                AddOnTimeSlot.objects.create(
+                    add_on=add_on,
+                    start_time=start,
+                    end_time=start + timedelta(hours=2),
+                    total_capacity=40,
+                )
+    return created
+
+
+def seed_traffic(bookings=2, holds=2):
+    """
+    Add confirmed bookings (with rooms and add-on slots) and active holds to
+    every pricing plan of the catalog, the data that keeps growing in
+    production while the catalog stays put.
+    """
+    created = []
+    booking_rooms, booking_add_ons, room_holds, ticket_holds = [], [], [], []
+    plans = PricingPlan.objects.select_related("event_date").prefetch_related(
+        "group_sizes", "event__rooms"
+    )
+    for pricing_plan in plans:
+        group_size = pricing_plan.group_sizes.all()[0]
+        rooms = [
+            room
+            for accommodation in pricing_plan.event.all()  # accommodations
+            for room in accommodation.rooms.all()
+        ]
+        time_slots = list(
+            AddOnTimeSlot.objects.filter(add_on__event_id=pricing_plan.event_date.event_id)
+        )
+        for i in range(bookings):
+            booking = Booking(
+                event_date=pricing_plan.event_date,
+                pricing_plan=pricing_plan,
+                group_size=group_size,
+                user_email=f"guest{i}@example.com",
+                total_price=pricing_plan.price,
+                status="CONFIRMED",
+                is_paid=True,
+            )
+            created.append(booking)
+            if rooms:
+                room = rooms[i % len(rooms)]
+                booking_rooms.append(
+                    BookingRoom(booking=booking, room=room, quantity=1, price=room.price)
+                )
+            if time_slots:
+                time_slot = time_slots[i % len(time_slots)]
+                booking_add_ons.append(
+                    BookingAddOn(
+                        booking=booking,
+                        add_on_id=time_slot.add_on_id,
+                        time_slot=time_slot,
+                        quantity=1,
+                        price=Decimal("45.00"),
+                    )
+                )
+        for i in range(holds):
+            ticket_holds.append(
+                TicketHold(
+                    pricing_plan=pricing_plan,
+                    number_of_tickets=1,
+                    session_id=f"session-{i}",
+                    expires_at=timezone.now() + timedelta(minutes=10),
+                )
+            )
+            if rooms:
+                room_holds.append(
+                    RoomHold(
+                        room=rooms[i % len(rooms)],
+                        quantity=1,
+                        session_id=f"session-{i}",
+                        expires_at=timezone.now() + timedelta(minutes=10),
+                    )
+                )
+
+    # bulk_create skips Booking.save, which would re-validate every booking
+    Booking.objects.bulk_create(created)
+    BookingRoom.objects.bulk_create(booking_rooms)
+    BookingAddOn.objects.bulk_create(booking_add_ons)
+    Booking.add_ons.through.objects.bulk_create(
+        Booking.add_ons.through(booking_id=b.booking_id, addon_id=b.add_on_id)
+        for b in booking_add_ons
+    )
+    TicketHold.objects.bulk_create(ticket_holds)
+    RoomHold.objects.bulk_create(room_holds)
+    return created
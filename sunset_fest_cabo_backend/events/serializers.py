@@ -18,19 +18,54 @@ from .models import (
     RoomHold,
     BookingRoom,
 )
+from django.core.files.storage import default_storage
+from core.serializers import ValuesListField, ValuesSerializer, file_url
+from core.tracing import traced
 from django.utils import timezone
 from datetime import timedelta
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """
+    srcset-style map of an image's generated variants (events/images.py):
+    {"width": .., "height": .., "webp": {"320": url, ..}, "jpeg": {..}}, or
+    None until the variants have been rendered.
+    """
+
+    def to_representation(self, value):
+        return self.values_representation(value, self.context)
+
+    @staticmethod
+    def values_representation(value, context):
+        if not value or "variants" not in value:
+            return None
+        return {
+            "width": value["width"],
+            "height": value["height"],
+            **{
+                fmt: {
+                    width: file_url(default_storage, variant["name"], context)
+                    for width, variant in sizes.items()
+                }
+                for fmt, sizes in value["variants"].items()
+            },
+        }
+
+
 class FeatureSerializer(serializers.ModelSerializer):
     class Meta:
         model = Feature
         fields = ["id", "name"]
 
 
+class FeatureValuesSerializer(ValuesSerializer):
+    serializer_class = FeatureSerializer
+
+
 class PricingPlanSerializer(serializers.ModelSerializer):
-    feature = FeatureSerializer(many=True, read_only=True)
+    feature = ValuesListField(FeatureValuesSerializer)
     available_tickets = serializers.SerializerMethodField()
+    banner_image_variants = ImageVariantsField()
 
     class Meta:
         model = PricingPlan
@@ -40,12 +75,16 @@ class PricingPlanSerializer(serializers.ModelSerializer):
             "description",
             "price",
             "banner_image",
+            "banner_image_variants",
             "feature",
             "total_tickets",
             "available_tickets",
         ]
 
     def get_available_tickets(self, obj):
+        # Annotated on lists, see PricingPlanQuerySet.with_availability
+        if hasattr(obj, "available_tickets"):
+            return obj.available_tickets
         return obj.get_available_tickets()
 
 
@@ -55,6 +94,10 @@ class GroupSizeSerializer(serializers.ModelSerializer):
         fields = ["id", "number_of_persons", "base_price"]
 
 
+class GroupSizeValuesSerializer(ValuesSerializer):
+    serializer_class = GroupSizeSerializer
+
+
 class EventDateSerializer(serializers.ModelSerializer):
     pricing_plans = PricingPlanSerializer(many=True, read_only=True)
 
@@ -65,20 +108,35 @@ class EventDateSerializer(serializers.ModelSerializer):
 
 class EventSerializer(serializers.ModelSerializer):
     dates = EventDateSerializer(many=True, read_only=True)
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = Event
-        fields = ["id", "title", "description", "event_type", "dates", "image"]
+        fields = [
+            "id",
+            "title",
+            "description",
+            "event_type",
+            "dates",
+            "image",
+            "image_variants",
+        ]
 
 
 class AccommodationImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = AccommodationImage
-        fields = ["id", "image"]
+        fields = ["id", "image", "image_variants"]
+
+
+class AccommodationImageValuesSerializer(ValuesSerializer):
+    serializer_class = AccommodationImageSerializer
 
 
 class AccommodationSerializer(serializers.ModelSerializer):
-    images = AccommodationImageSerializer(many=True, read_only=True)
+    images = ValuesListField(AccommodationImageValuesSerializer)
 
     class Meta:
         model = Accommodation
@@ -95,13 +153,19 @@ class AccommodationSerializer(serializers.ModelSerializer):
 
 
 class RoomImageSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = RoomImage
-        fields = ["id", "image"]
+        fields = ["id", "image", "image_variants"]
+
+
+class RoomImageValuesSerializer(ValuesSerializer):
+    serializer_class = RoomImageSerializer
 
 
 class RoomSerializer(serializers.ModelSerializer):
-    images = RoomImageSerializer(many=True, read_only=True)
+    images = ValuesListField(RoomImageValuesSerializer)
     accommodation = AccommodationSerializer(read_only=True)
     available_rooms = serializers.SerializerMethodField()
 
@@ -122,6 +186,8 @@ class RoomSerializer(serializers.ModelSerializer):
         read_only_fields = ["capacity", "available_rooms"]
 
     def get_available_rooms(self, obj):
+        if hasattr(obj, "available_rooms"):
+            return obj.available_rooms
         return obj.get_available_rooms()
 
 
@@ -140,12 +206,19 @@ class AddOnTimeSlotSerializer(serializers.ModelSerializer):
         ]
 
     def get_available_capacity(self, obj):
+        # Async views pass capacities they already computed in the context
+        capacities = self.context.get("available_capacity")
+        if capacities is not None:
+            return capacities[obj.id]
+        if hasattr(obj, "available_capacity"):
+            return obj.available_capacity
         return obj.get_available_capacity()
 
 
 class AddOnSerializer(serializers.ModelSerializer):
     time_slots = AddOnTimeSlotSerializer(many=True, read_only=True)
     available_tickets = serializers.SerializerMethodField()
+    image_variants = ImageVariantsField()
 
     class Meta:
         model = AddOn
@@ -155,6 +228,7 @@ class AddOnSerializer(serializers.ModelSerializer):
             "description",
             "price",
             "image",
+            "image_variants",
             "total_tickets",
             "available_tickets",
             "event",
@@ -164,6 +238,8 @@ class AddOnSerializer(serializers.ModelSerializer):
         ]
 
     def get_available_tickets(self, obj):
+        if hasattr(obj, "available_tickets"):
+            return obj.available_tickets
         return obj.get_available_tickets()
 
 
@@ -309,6 +385,26 @@ class BookingCreateSerializer(serializers.ModelSerializer):
         return booking
 
 
+class RoomHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RoomHold
+        fields = ["id", "room", "quantity", "session_id", "created_at", "expires_at"]
+
+
+class TicketHoldSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TicketHold
+        fields = [
+            "id",
+            "pricing_plan",
+            "number_of_tickets",
+            "room_holds",
+            "session_id",
+            "created_at",
+            "expires_at",
+        ]
+
+
 class CombinedHoldSerializer(serializers.Serializer):
     pricing_plan_id = serializers.PrimaryKeyRelatedField(
         queryset=PricingPlan.objects.all(), source="pricing_plan"
@@ -319,6 +415,7 @@ class CombinedHoldSerializer(serializers.Serializer):
         required=False,
     )
 
+    @traced()
     def validate(self, data):
         pricing_plan = data["pricing_plan"]
         number_of_tickets = data["number_of_tickets"]
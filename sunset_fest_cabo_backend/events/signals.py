@@ -0,0 +1,75 @@
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.routers import CATALOG_MODELS
+from .broadcast import broadcaster
+from .images import IMAGE_FIELDS, variants_field
+from .models import Booking, BookingAddOn, BookingRoom, RoomHold, TicketHold
+from .snapshots import invalidate_catalog_snapshots
+
+
+# Hooks on every write that changes availability, feeding the stream
+# broadcaster and dropping the catalog snapshots, which carry availability
+# figures. They only record what changed; the streams recompute watched
+# entities after commit.
+
+
+def drop_catalog_snapshots():
+    # Once the write is committed: a catalog read between an earlier bump
+    # and the commit would cache the old figures under the new version
+    transaction.on_commit(invalidate_catalog_snapshots, robust=True)
+
+
+@receiver([post_save, post_delete], sender=TicketHold)
+def ticket_hold_changed(sender, instance, **kwargs):
+    broadcaster.notify(hold_plans=[instance.pricing_plan_id])
+    drop_catalog_snapshots()
+
+
+@receiver([post_save, post_delete], sender=RoomHold)
+def room_hold_changed(sender, instance, **kwargs):
+    broadcaster.notify(rooms=[instance.room_id])
+    drop_catalog_snapshots()
+
+
+@receiver([post_save, post_delete], sender=Booking)
+def booking_changed(sender, instance, **kwargs):
+    broadcaster.notify(pricing_plans=[instance.pricing_plan_id], bookings=[instance.id])
+    drop_catalog_snapshots()
+
+
+@receiver([post_save, post_delete], sender=BookingRoom)
+def booking_room_changed(sender, instance, **kwargs):
+    broadcaster.notify(rooms=[instance.room_id])
+    drop_catalog_snapshots()
+
+
+@receiver([post_save, post_delete], sender=BookingAddOn)
+def booking_addon_changed(sender, instance, **kwargs):
+    broadcaster.notify(time_slots=[instance.time_slot_id])
+    drop_catalog_snapshots()
+
+
+def reset_image_variants(sender, instance, **kwargs):
+    # A new upload invalidates the variants of the previous image and queues
+    # it for the generate_image_variants worker
+    field_name = IMAGE_FIELDS[sender]
+    variants = getattr(instance, variants_field(field_name))
+    if variants and variants.get("source") != getattr(instance, field_name).name:
+        setattr(instance, variants_field(field_name), {})
+
+
+for model in IMAGE_FIELDS:
+    pre_save.connect(reset_image_variants, sender=model)
+
+
+def catalog_changed(sender, **kwargs):
+    drop_catalog_snapshots()
+
+
+# m2m_changed is sent by the through models, which are catalog models too
+for label in CATALOG_MODELS:
+    for signal in (post_save, post_delete, m2m_changed):
+        signal.connect(catalog_changed, sender=apps.get_model(label))
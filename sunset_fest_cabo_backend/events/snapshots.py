@@ -0,0 +1,75 @@
+"""
+Cached snapshots of catalog list responses.
+
+A snapshot holds the rendered body of a list response, for one URL (scheme,
+host, path and query string, since image URLs in the body are absolute) and
+output format, together with its gzip/brotli compressions, so
+CompressionMiddleware serves the stored bytes instead of serializing and
+compressing per request. Snapshots are dropped once a write to a catalog
+model commits and once a hold or booking changing the availability figures
+inside them does (see signals.py), and otherwise live
+CATALOG_SNAPSHOT_TIMEOUT seconds.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from core.compression import precompress
+
+VERSION_KEY = "events:catalog_version"
+
+
+def catalog_version():
+    return cache.get_or_set(VERSION_KEY, 1, None)
+
+
+def invalidate_catalog_snapshots():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, 1, None)
+
+
+def snapshot_key(request):
+    url = hashlib.sha256(request.build_absolute_uri().encode()).hexdigest()
+    return f"events:catalog:{catalog_version()}:{request.accepted_renderer.format}:{url}"
+
+
+class CatalogSnapshotMixin:
+    """
+    Serve `list` from a cached, pre-compressed snapshot.
+    """
+
+    def list(self, request, *args, **kwargs):
+        key = snapshot_key(request)
+        snapshot = cache.get(key)
+        if snapshot is None:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            snapshot = self.take_snapshot(request, response.data)
+            cache.set(key, snapshot, settings.CATALOG_SNAPSHOT_TIMEOUT)
+
+        response = HttpResponse(snapshot["body"], content_type=snapshot["content_type"])
+        response.precompressed = snapshot["precompressed"]
+        return response
+
+    def take_snapshot(self, request, data):
+        renderer = request.accepted_renderer
+        body = renderer.render(
+            data, request.accepted_media_type, self.get_renderer_context()
+        )
+        content_type = request.accepted_media_type
+        if renderer.charset:
+            content_type = f"{content_type}; charset={renderer.charset}"
+        return {
+            "body": body,
+            "content_type": content_type,
+            # Too small to be worth compressing, the middleware would skip it
+            "precompressed": (
+                precompress(body) if len(body) >= settings.COMPRESSION_MIN_SIZE else None
+            ),
+        }
@@ -0,0 +1,35 @@
+"""
+Test fixtures shared by the apps' tests.
+"""
+
+from django.utils import timezone
+
+from .models import Accommodation, Event, EventDate, GroupSize, PricingPlan, Room
+
+
+def create_festival(total_tickets=50, total_rooms=10):
+    event = Event.objects.create(
+        title="Sunset Fest", description="", event_type="festival", image="events/x.jpg"
+    )
+    event_date = EventDate.objects.create(
+        event=event, date=timezone.now(), city="Cabo", title="Day 1", description=""
+    )
+    pricing_plan = PricingPlan.objects.create(
+        event_date=event_date,
+        title="GA",
+        description="",
+        price=100,
+        total_tickets=total_tickets,
+    )
+    GroupSize.objects.create(pricing_plan=pricing_plan, number_of_persons=2, base_price=20)
+    accommodation = Accommodation.objects.create(
+        pricing_plan=pricing_plan, title="Hotel", description="", rating=4.5, price=50
+    )
+    room = Room.objects.create(
+        accommodation=accommodation,
+        title="Double",
+        description="",
+        price=80,
+        total_rooms=total_rooms,
+    )
+    return pricing_plan, room
@@ -1,3 +1,532 @@
-from django.test import TestCase
+import io
+import json
+import os
+import tempfile
+import threading
+import uuid
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+from rest_framework.test import APIClient
+
+from core.query_budgets import QueryBudgetMixin
+from .broadcast import broadcaster
+from .query_budgets import QUERY_BUDGETS
+from .seed import seed_catalog, seed_traffic
+from .testing import create_festival
+from .serializers import EventSerializer
+from .snapshots import catalog_version
+from .models import (
+    AddOn,
+    AddOnTimeSlot,
+    Booking,
+    BookingAddOn,
+    Event,
+    PricingPlan,
+    Room,
+    RoomHold,
+    TicketHold,
+)
+
+
+class CombinedHoldTests(TestCase):
+    def test_creates_ticket_and_room_holds(self):
+        pricing_plan, room = create_festival()
+
+        response = APIClient().post(
+            reverse("combined-hold"),
+            {
+                "pricing_plan_id": str(pricing_plan.id),
+                "number_of_tickets": 2,
+                "room_holds": [{"room_id": str(room.id), "quantity": "1"}],
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(TicketHold.objects.get().number_of_tickets, 2)
+        self.assertEqual(response.data["room_holds"][0]["quantity"], 1)
+
+
+@override_settings(SQLITE_WRITE_QUEUE=True)
+class HoldContentionTests(TransactionTestCase):
+    """
+    Runs unchanged on SQLite (writes serialized by the write queue) and on
+    PostgreSQL (DATABASE_ENGINE=postgresql, rows locked with FOR UPDATE).
+    """
+
+    def test_concurrent_holds_never_oversell(self):
+        pricing_plan, room = create_festival(total_tickets=10, total_rooms=3)
+        user = get_user_model().objects.create_user(
+            username="ana", email="ana@example.com", password="x"
+        )
+        statuses = []
+
+        def hold():
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.post(
+                reverse("combined-hold"),
+                {
+                    "pricing_plan_id": str(pricing_plan.id),
+                    "number_of_tickets": 2,
+                    "room_holds": [{"room_id": str(room.id), "quantity": "1"}],
+                },
+                format="json",
+            )
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=hold) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(201), 3)
+        self.assertEqual(RoomHold.objects.count(), 3)
+        self.assertEqual(TicketHold.objects.count(), 3)
+        self.assertEqual(room.get_available_rooms(), 0)
+
+    def test_concurrent_holds_on_sibling_plans_never_oversell(self):
+        pricing_plan, room = create_festival(total_tickets=10)
+        sibling = PricingPlan.objects.create(
+            event_date_id=pricing_plan.event_date_id,
+            title="VIP",
+            description="",
+            price=300,
+            total_tickets=10,
+        )
+        user = get_user_model().objects.create_user(
+            username="ana", email="ana@example.com", password="x"
+        )
+        statuses = []
+
+        def hold(plan):
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.post(
+                reverse("combined-hold"),
+                {"pricing_plan_id": str(plan.id), "number_of_tickets": 4},
+                format="json",
+            )
+            statuses.append(response.status_code)
+
+        # Ticket holds count against every plan of the event
+        threads = [
+            threading.Thread(target=hold, args=(plan,))
+            for plan in [pricing_plan, sibling] * 4
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(201), 2)
+        self.assertEqual(TicketHold.objects.count(), 2)
+        self.assertEqual(pricing_plan.get_available_tickets(), 2)
+        self.assertEqual(sibling.get_available_tickets(), 2)
+
+    def test_concurrent_bookings_never_oversell(self):
+        pricing_plan, room = create_festival(total_tickets=10, total_rooms=3)
+        user = get_user_model().objects.create_user(
+            username="ana", email="ana@example.com", password="x"
+        )
+        group_size = pricing_plan.group_sizes.get()
+        statuses = []
+
+        def book():
+            client = APIClient()
+            client.force_authenticate(user)
+            response = client.post(
+                reverse("booking-list"),
+                {
+                    "event_date": str(pricing_plan.event_date_id),
+                    "pricing_plan": str(pricing_plan.id),
+                    "group_size": str(group_size.id),
+                    "rooms": [{"room_id": str(room.id), "quantity": 1}],
+                },
+                format="json",
+            )
+            statuses.append(response.status_code)
+
+        threads = [threading.Thread(target=book) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(statuses.count(201), 3)
+        self.assertEqual(statuses.count(400), 5)
+        self.assertEqual(Booking.objects.count(), 3)
+        self.assertEqual(room.get_available_rooms(), 0)
+
+
+# The replica would not see rows written inside the test transaction
+@override_settings(REPLICA_DATABASE_ALIAS=None)
+class AsyncAvailabilityTests(TestCase):
+    def setUp(self):
+        pricing_plan, _ = create_festival()
+        self.event = pricing_plan.event_date.event
+        self.addon = AddOn.objects.create(
+            event=self.event, title="Boat", description="", price=30, total_tickets=40
+        )
+        self.time_slot = AddOnTimeSlot.objects.create(
+            add_on=self.addon,
+            start_time=timezone.now().replace(hour=12, minute=0, second=0, microsecond=0),
+            total_capacity=12,
+        )
+        TicketHold.objects.create(pricing_plan=pricing_plan, number_of_tickets=3)
+
+    def test_addon_availability_includes_time_slots(self):
+        later = AddOnTimeSlot.objects.create(
+            add_on=self.addon,
+            start_time=self.time_slot.start_time + timedelta(hours=2),
+            total_capacity=12,
+        )
+        pricing_plan = PricingPlan.objects.get()
+        booking = Booking.objects.create(
+            event_date=pricing_plan.event_date,
+            pricing_plan=pricing_plan,
+            group_size=pricing_plan.group_sizes.get(),
+            total_price=0,
+            status="CONFIRMED",
+        )
+        BookingAddOn.objects.create(
+            booking=booking, add_on=self.addon, time_slot=later, quantity=4, price=30
+        )
+
+        with self.assertNumQueries(5):
+            response = self.client.get(
+                reverse("addon-availability", args=[self.addon.id]),
+                {"date": self.time_slot.start_time.strftime("%Y-%m-%d")},
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["available_tickets"], 37)
+        self.assertEqual(
+            [slot["available_capacity"] for slot in response.json()["time_slots"]],
+            [self.time_slot.get_available_capacity(), later.get_available_capacity()],
+        )
+        self.assertEqual(later.get_available_capacity(), 5)
+
+    def test_addon_availability_requires_date(self):
+        response = self.client.get(reverse("addon-availability", args=[self.addon.id]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_time_slot_availability(self):
+        response = self.client.get(
+            reverse("addon-time-slot-availability", args=[self.time_slot.id])
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["available_capacity"], 9)
+        self.assertEqual(response.json()["total_capacity"], 12)
+
+        response = self.client.get(
+            reverse("time-slot-availability", args=[self.addon.id, self.time_slot.id]),
+            {"event_id": str(self.event.id)},
+        )
+        self.assertEqual(response.json(), {"available_capacity": 9})
+
+    def test_unknown_time_slot(self):
+        response = self.client.get(
+            reverse("addon-time-slot-availability", args=[uuid.uuid4()])
+        )
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(EVENTS_STREAM_REFRESH_INTERVAL=0, REPLICA_DATABASE_ALIAS=None)
+class AvailabilityStreamTests(TestCase):
+    def setUp(self):
+        self.pricing_plan, self.room = create_festival(total_tickets=50, total_rooms=10)
+
+    async def test_hold_changes_are_pushed_to_watchers(self):
+        keys = {("pricing_plan", str(self.pricing_plan.id)), ("room", str(self.room.id))}
+        watchers = [broadcaster.subscribe(keys) for _ in range(3)]
+
+        def hold():
+            # Only the hold itself, nothing is recomputed on commit
+            with self.assertNumQueries(1), self.captureOnCommitCallbacks(execute=True):
+                RoomHold.objects.create(room=self.room, quantity=2)
+
+        try:
+            with patch.object(broadcaster, "compute", wraps=broadcaster.compute) as compute:
+                await sync_to_async(hold)()
+                changes = [await watcher.changes(1) for watcher in watchers]
+        finally:
+            for watcher in watchers:
+                broadcaster.unsubscribe(watcher)
+
+        self.assertEqual(compute.call_count, 1)
+        self.assertEqual(changes, [{("room", str(self.room.id)): 8}] * 3)
+
+    async def test_ticket_holds_update_every_plan_of_the_event(self):
+        other_plan = await PricingPlan.objects.acreate(
+            event_date_id=self.pricing_plan.event_date_id,
+            title="VIP",
+            description="",
+            price=300,
+            total_tickets=20,
+        )
+        watcher = broadcaster.subscribe({("pricing_plan", str(other_plan.id))})
+
+        def hold():
+            with self.captureOnCommitCallbacks(execute=True):
+                TicketHold.objects.create(pricing_plan=self.pricing_plan, number_of_tickets=4)
+
+        try:
+            await sync_to_async(hold)()
+            changes = await watcher.changes(1)
+        finally:
+            broadcaster.unsubscribe(watcher)
+
+        self.assertEqual(changes, {("pricing_plan", str(other_plan.id)): 16})
+
+    async def test_stream_starts_with_snapshot(self):
+        response = await self.async_client.get(
+            reverse("availability-stream"), {"rooms": str(self.room.id)}
+        )
+        first = await anext(response.streaming_content)
+        await response.streaming_content.aclose()
+
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertIn(b'"available": 10', first)
+
+    def test_invalid_subscription(self):
+        response = self.client.get(reverse("availability-stream"), {"rooms": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def upload(self, size=(800, 400), mode="RGBA"):
+        data = io.BytesIO()
+        PILImage.new(mode, size, (200, 80, 20, 128)).save(data, format="PNG")
+        return SimpleUploadedFile("poster.png", data.getvalue(), content_type="image/png")
+
+    def test_worker_renders_variants_without_upscaling(self):
+        event = Event.objects.create(
+            title="Sunset Fest", description="", event_type="festival", image=self.upload()
+        )
+
+        call_command("generate_image_variants", "--once", "--workers=1", stdout=io.StringIO())
+
+        event.refresh_from_db()
+        variants = event.image_variants
+        self.assertEqual((variants["width"], variants["height"]), (800, 400))
+        self.assertEqual(sorted(variants["variants"]["webp"], key=int), ["320", "640", "800"])
+        self.assertEqual(variants["variants"]["jpeg"]["320"]["height"], 160)
+        with PILImage.open(event.image.storage.open(variants["variants"]["jpeg"]["640"]["name"])) as jpeg:
+            self.assertEqual((jpeg.format, jpeg.size), ("JPEG", (640, 320)))
+
+        data = EventSerializer(event).data["image_variants"]
+        self.assertEqual(set(data), {"width", "height", "webp", "jpeg"})
+        self.assertIn("/media/events/variants/", data["webp"]["320"])
+        self.assertTrue(data["webp"]["320"].endswith(".webp"))
+
+    def test_worker_drops_catalog_snapshots(self):
+        Event.objects.create(
+            title="Sunset Fest", description="", event_type="festival", image=self.upload()
+        )
+        version = catalog_version()
+
+        call_command("generate_image_variants", "--once", "--workers=1", stdout=io.StringIO())
+
+        self.assertNotEqual(catalog_version(), version)
+
+    def test_replacing_the_image_requeues_it(self):
+        event = Event.objects.create(
+            title="Sunset Fest", description="", event_type="festival", image=self.upload()
+        )
+        call_command("generate_image_variants", "--once", "--workers=1", stdout=io.StringIO())
+        event.refresh_from_db()
+
+        event.title = "Renamed"
+        event.save()
+        self.assertTrue(event.image_variants)
+
+        event.image = self.upload(size=(300, 300), mode="RGB")
+        event.save()
+        self.assertEqual(event.image_variants, {})
+        self.assertIsNone(EventSerializer(event).data["image_variants"])
+
+
+class BenchmarkFunnelTests(TestCase):
+    def test_reports_every_scenario_and_rolls_back(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.json")
+            call_command(
+                "benchmark_funnel",
+                "--events=1",
+                "--iterations=2",
+                "--warmup=0",
+                f"--output={output}",
+                stdout=io.StringIO(),
+            )
+            with open(output) as f:
+                scenarios = json.load(f)["scenarios"]
+
+        self.assertEqual(
+            list(scenarios),
+            [
+                "catalog_list_cold",
+                "catalog_list_warm",
+                "addon_grid_cold",
+                "addon_grid_warm",
+                "availability_poll",
+                "combined_hold",
+                "booking_create",
+                "checkout_session",
+                "stripe_webhook",
+            ],
+        )
+        self.assertGreater(scenarios["combined_hold"]["queries_median"], 0)
+        self.assertGreater(scenarios["catalog_list_cold"]["queries_median"], 0)
+        self.assertEqual(scenarios["catalog_list_warm"]["queries_median"], 0)
+        self.assertFalse(Event.objects.exists())
+
+
+class AvailabilityAnnotationTests(TestCase):
+    def test_annotations_match_per_object_availability(self):
+        seed_catalog(events=2, dates=1, plans=2, accommodations=1, rooms=2, add_ons=2, time_slots=2)
+        seed_traffic()
+        # Oversold, clamped to 0 like get_available_rooms
+        RoomHold.objects.create(room=Room.objects.first(), quantity=100)
+
+        cases = [
+            (PricingPlan, "available_tickets", "get_available_tickets"),
+            (Room, "available_rooms", "get_available_rooms"),
+            (AddOn, "available_tickets", "get_available_tickets"),
+            (AddOnTimeSlot, "available_capacity", "get_available_capacity"),
+        ]
+        for model, annotation, method in cases:
+            for obj in model.objects.with_availability():
+                with self.subTest(model=model.__name__, id=obj.id):
+                    self.assertEqual(
+                        getattr(obj, annotation), getattr(model.objects.get(id=obj.id), method)()
+                    )
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = "events.urls"
+    query_budgets = QUERY_BUDGETS
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.pricing_plan = PricingPlan.objects.select_related("event_date").first()
+        self.event = self.pricing_plan.event_date.event
+        self.group_size = self.pricing_plan.group_sizes.first()
+        self.room = Room.objects.filter(accommodation__pricing_plan=self.pricing_plan).first()
+        self.add_on = AddOn.objects.filter(event=self.event).first()
+        self.time_slot = self.add_on.time_slots.first()
+        self.booking = Booking.objects.create(
+            event_date=self.pricing_plan.event_date,
+            pricing_plan=self.pricing_plan,
+            group_size=self.group_size,
+            user_email="guest@example.com",
+            total_price=0,
+            status="CONFIRMED",
+        )
+        # So every relation the booking routes nest is there to be loaded
+        self.booking.add_ons.add(self.add_on)
+
+    def get(self, name, args=(), params=None):
+        url = reverse(name, args=args)
+        return lambda: lambda: self.client.get(url, params)
+
+    def stream(self):
+        async def first_event():
+            response = await self.async_client.get(
+                reverse("availability-stream"),
+                {"pricing_plans": str(self.pricing_plan.id), "rooms": str(self.room.id)},
+            )
+            await anext(response.streaming_content)
+            await response.streaming_content.aclose()
+            return response
+
+        return lambda: async_to_sync(first_event)()
+
+    def combined_hold(self):
+        data = {
+            "pricing_plan_id": str(self.pricing_plan.id),
+            "number_of_tickets": 1,
+            "room_holds": [{"room_id": str(self.room.id), "quantity": "1"}],
+        }
+        return lambda: self.client.post(reverse("combined-hold"), data, format="json")
+
+    def create_booking(self):
+        data = {
+            "event_date": str(self.pricing_plan.event_date_id),
+            "pricing_plan": str(self.pricing_plan.id),
+            "group_size": str(self.group_size.id),
+            "user_email": "guest@example.com",
+            "rooms": [{"room_id": str(self.room.id), "quantity": 1}],
+        }
+        return lambda: self.client.post(reverse("booking-list"), data, format="json")
+
+    def update_booking(self):
+        url = reverse("booking-detail", args=[self.booking.id])
+        return lambda: self.client.patch(url, {"user_email": "other@example.com"}, format="json")
+
+    def route_requests(self):
+        date = self.time_slot.start_time.date().isoformat()
+        return {
+            ("api-root", "GET"): self.get("api-root"),
+            ("event-list", "GET"): self.get("event-list"),
+            ("event-detail", "GET"): self.get("event-detail", [self.event.id]),
+            ("eventdate-list", "GET"): self.get("eventdate-list"),
+            ("eventdate-detail", "GET"): self.get(
+                "eventdate-detail", [self.pricing_plan.event_date_id]
+            ),
+            ("pricingplan-list", "GET"): self.get("pricingplan-list"),
+            ("pricingplan-detail", "GET"): self.get(
+                "pricingplan-detail", [self.pricing_plan.id]
+            ),
+            ("groupsize-list", "GET"): self.get("groupsize-list"),
+            ("groupsize-detail", "GET"): self.get("groupsize-detail", [self.group_size.id]),
+            ("accommodation-list", "GET"): self.get("accommodation-list"),
+            ("accommodation-detail", "GET"): self.get(
+                "accommodation-detail", [self.room.accommodation_id]
+            ),
+            ("room-list", "GET"): self.get("room-list"),
+            ("room-detail", "GET"): self.get("room-detail", [self.room.id]),
+            ("addon-list", "GET"): self.get(
+                "addon-list", params={"event_id": str(self.event.id), "date": date}
+            ),
+            ("addon-detail", "GET"): self.get("addon-detail", [self.add_on.id]),
+            ("addontimeslot-list", "GET"): self.get("addontimeslot-list"),
+            ("addontimeslot-detail", "GET"): self.get(
+                "addontimeslot-detail", [self.time_slot.id]
+            ),
+            ("booking-list", "GET"): self.get("booking-list"),
+            ("booking-list", "POST"): self.create_booking,
+            ("booking-detail", "GET"): self.get("booking-detail", [self.booking.id]),
+            ("booking-detail", "PATCH"): self.update_booking,
+            ("addon-availability", "GET"): self.get(
+                "addon-availability", [self.add_on.id], {"date": date}
+            ),
+            ("addon-time-slot-availability", "GET"): self.get(
+                "addon-time-slot-availability", [self.time_slot.id]
+            ),
+            ("time-slot-availability", "GET"): self.get(
+                "time-slot-availability",
+                [self.add_on.id, self.time_slot.id],
+                {"event_id": str(self.event.id)},
+            ),
+            ("availability-stream", "GET"): self.stream,
+            ("combined-hold", "POST"): self.combined_hold,
+        }
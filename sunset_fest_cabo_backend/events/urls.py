@@ -14,6 +14,8 @@ from .views import (
     CombinedHoldView,
     get_addon_availability,
     get_time_slot_availability,
+    time_slot_availability,
+    availability_stream,
 )
 
 router = DefaultRouter()
@@ -28,12 +30,19 @@ router.register(r"add-on-time-slots", AddOnTimeSlotViewSet)
 router.register(r"bookings", BookingViewSet)
 
 urlpatterns = [
-    path("", include(router.urls)),
+    # Async availability views, ahead of the router so they take these paths
     path(
         "add-ons/<uuid:addon_id>/availability/",
         get_addon_availability,
         name="addon-availability",
     ),
+    path(
+        "add-on-time-slots/<uuid:pk>/availability/",
+        time_slot_availability,
+        name="addon-time-slot-availability",
+    ),
+    path("availability/stream/", availability_stream, name="availability-stream"),
+    path("", include(router.urls)),
     path(
         "add-ons/<uuid:addon_id>/time-slots/<uuid:time_slot_id>/availability/",
         get_time_slot_availability,
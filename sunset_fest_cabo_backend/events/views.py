@@ -1,8 +1,12 @@
 from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import ValidationError
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import models
+from django.http import HttpResponse, StreamingHttpResponse
+from django.conf import settings
+from asgiref.sync import sync_to_async
 from .models import (
     Event,
     EventDate,
@@ -24,6 +28,7 @@ from .serializers import (
     PricingPlanSerializer,
     FeatureSerializer,
     GroupSizeSerializer,
+    GroupSizeValuesSerializer,
     AccommodationSerializer,
     RoomSerializer,
     AddOnSerializer,
@@ -32,82 +37,141 @@ from .serializers import (
     BookingCreateSerializer,
     AddOnTimeSlotSerializer,
     CombinedHoldSerializer,
+    TicketHoldSerializer,
+    RoomHoldSerializer,
 )
 from django.utils import timezone
+import asyncio
 import uuid
 from datetime import timedelta
 from rest_framework.views import APIView
+from core.renderers import ORJSONRenderer
+from core.write_queue import run_write
+from .locking import lock_inventory
+from .broadcast import broadcaster, format_event
+from .metrics import (
+    booking_seconds,
+    bookings_created,
+    hold_seconds,
+    hold_tickets,
+    holds_created,
+    holds_rejected,
+    stream_subscribers,
+)
+from .snapshots import CatalogSnapshotMixin
+
+
+class ValuesListMixin:
+    """
+    `list` straight from values() rows through `values_serializer_class`
+    (core.serializers), for reference data.
+    """
+
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        return Response(
+            self.values_serializer_class.serialize(
+                queryset, self.get_serializer_context()
+            )
+        )
+
+
+def pricing_plans_with_availability():
+    return PricingPlan.objects.with_availability().prefetch_related("feature")
+
 
+def add_ons_with_availability():
+    return AddOn.objects.with_availability().prefetch_related(
+        models.Prefetch("time_slots", queryset=AddOnTimeSlot.objects.with_availability())
+    )
 
-class EventViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Event.objects.all()
+
+# Catalog lists annotate availability and prefetch what their serializers
+# nest, so they run the same queries however many rows they return.
+
+
+class EventViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Event.objects.prefetch_related(
+        models.Prefetch("dates__pricing_plans", queryset=pricing_plans_with_availability())
+    )
     serializer_class = EventSerializer
 
 
-class EventDateViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = EventDate.objects.all()
+class EventDateViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = EventDate.objects.prefetch_related(
+        models.Prefetch("pricing_plans", queryset=pricing_plans_with_availability())
+    )
     serializer_class = EventDateSerializer
 
     def get_queryset(self):
         event_id = self.request.query_params.get("event_id")
         if event_id:
-            return self.queryset.filter(event_id=event_id)
-        return self.queryset
+            return super().get_queryset().filter(event_id=event_id)
+        return super().get_queryset()
 
 
-class PricingPlanViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = PricingPlan.objects.all()
+class PricingPlanViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = pricing_plans_with_availability()
     serializer_class = PricingPlanSerializer
 
     def get_queryset(self):
         event_date_id = self.request.query_params.get("event_date_id")
         if event_date_id:
-            return self.queryset.filter(event_date_id=event_date_id)
-        return self.queryset
+            return super().get_queryset().filter(event_date_id=event_date_id)
+        return super().get_queryset()
 
 
-class GroupSizeViewSet(viewsets.ReadOnlyModelViewSet):
+class GroupSizeViewSet(
+    CatalogSnapshotMixin, ValuesListMixin, viewsets.ReadOnlyModelViewSet
+):
     queryset = GroupSize.objects.all()
     serializer_class = GroupSizeSerializer
+    values_serializer_class = GroupSizeValuesSerializer
 
     def get_queryset(self):
         pricing_plan_id = self.request.query_params.get("pricing_plan_id")
         if pricing_plan_id:
-            return self.queryset.filter(pricing_plan_id=pricing_plan_id)
-        return self.queryset
+            return super().get_queryset().filter(pricing_plan_id=pricing_plan_id)
+        return super().get_queryset()
 
 
-class AccommodationViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Accommodation.objects.all()
+class AccommodationViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = Accommodation.objects.prefetch_related("images")
     serializer_class = AccommodationSerializer
 
     def get_queryset(self):
         pricing_plan_id = self.request.query_params.get("pricing_plan_id")
         if pricing_plan_id:
-            return self.queryset.filter(pricing_plan_id=pricing_plan_id)
-        return self.queryset
+            return super().get_queryset().filter(pricing_plan_id=pricing_plan_id)
+        return super().get_queryset()
 
 
-class RoomViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = Room.objects.all()
+class RoomViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = (
+        Room.objects.with_availability()
+        .select_related("accommodation")
+        .prefetch_related("images", "accommodation__images")
+    )
     serializer_class = RoomSerializer
 
     def get_queryset(self):
         accommodation_id = self.request.query_params.get("accommodation_id")
         if accommodation_id:
-            return self.queryset.filter(accommodation_id=accommodation_id)
-        return self.queryset
+            return super().get_queryset().filter(accommodation_id=accommodation_id)
+        return super().get_queryset()
 
 
-class AddOnViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = AddOn.objects.all()
+class AddOnViewSet(CatalogSnapshotMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = AddOn.objects.with_availability()
     serializer_class = AddOnSerializer
 
     def get_queryset(self):
         event_id = self.request.query_params.get("event_id")
         date = self.request.query_params.get("date")
 
-        queryset = self.queryset
+        queryset = super().get_queryset()
 
         if event_id:
             queryset = queryset.filter(event_id=event_id)
@@ -118,68 +182,30 @@ class AddOnViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.prefetch_related(
                 models.Prefetch(
                     "time_slots",
-                    queryset=AddOnTimeSlot.objects.filter(
-                        start_time__date=date_obj
-                    ).order_by("start_time"),
+                    queryset=AddOnTimeSlot.objects.with_availability()
+                    .filter(start_time__date=date_obj)
+                    .order_by("start_time"),
                 )
             )
         else:
-            queryset = queryset.prefetch_related("time_slots")
-
-        return queryset
-
-    @action(detail=True, methods=["get"])
-    def availability(self, request, pk=None):
-        addon = self.get_object()
-        date = request.query_params.get("date")
-
-        if not date:
-            return Response(
-                {"error": "Date parameter is required"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-
-        try:
-            date_obj = timezone.datetime.strptime(date, "%Y-%m-%d").date()
-            time_slots = addon.time_slots.filter(start_time__date=date_obj).order_by(
-                "start_time"
+            queryset = queryset.prefetch_related(
+                models.Prefetch(
+                    "time_slots", queryset=AddOnTimeSlot.objects.with_availability()
+                )
             )
 
-            return Response(
-                {
-                    "available_tickets": addon.get_available_tickets(),
-                    "time_slots": AddOnTimeSlotSerializer(time_slots, many=True).data,
-                }
-            )
-        except ValueError:
-            return Response(
-                {"error": "Invalid date format. Use YYYY-MM-DD"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
+        return queryset
 
 
 class AddOnTimeSlotViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = AddOnTimeSlot.objects.all()
+    queryset = AddOnTimeSlot.objects.with_availability()
     serializer_class = AddOnTimeSlotSerializer
 
     def get_queryset(self):
         addon_id = self.request.query_params.get("addon_id")
         if addon_id:
-            return self.queryset.filter(add_on_id=addon_id)
-        return self.queryset
-
-    @action(detail=True, methods=["get"])
-    def availability(self, request, pk=None):
-        time_slot = self.get_object()
-        available_capacity = time_slot.get_available_capacity()
-        return Response(
-            {
-                "available_capacity": available_capacity,
-                "total_capacity": time_slot.total_capacity,
-                "start_time": time_slot.start_time,
-                "end_time": time_slot.end_time,
-            }
-        )
+            return super().get_queryset().filter(add_on_id=addon_id)
+        return super().get_queryset()
 
 
 class HotelBookingViewSet(viewsets.ModelViewSet):
@@ -195,17 +221,70 @@ class BookingViewSet(viewsets.ModelViewSet):
     serializer_class = BookingSerializer
     permission_classes = [AllowAny]
 
+    def get_queryset(self):
+        return (
+            super()
+            .get_queryset()
+            .select_related("event_date", "group_size", "hotel_booking__accommodation")
+            .prefetch_related(
+                models.Prefetch(
+                    "event_date__pricing_plans", queryset=pricing_plans_with_availability()
+                ),
+                models.Prefetch("pricing_plan", queryset=pricing_plans_with_availability()),
+                "hotel_booking__accommodation__images",
+                models.Prefetch("add_ons", queryset=add_ons_with_availability()),
+            )
+        )
+
     def get_serializer_class(self):
         if self.action == 'create':
             return BookingCreateSerializer
         return BookingSerializer
 
+    def create(self, request, *args, **kwargs):
+        with booking_seconds.timer():
+            return super().create(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         # Get user from request if authenticated
         user = self.request.user if self.request.user.is_authenticated else None
-        
+        booking = run_write(self.create_booking, serializer, user)
+        bookings_created.inc(from_hold=str(booking.ticket_hold_id is not None).lower())
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        # The response is rendered from a reload with the annotations and
+        # prefetches of get_queryset(), which saving has made stale
+        serializer.instance = self.get_queryset().get(pk=serializer.instance.pk)
+
+    def create_booking(self, serializer, user):
         # Get validated data
         validated_data = serializer.validated_data
+
+        # Serialize against holds and bookings checking the same inventory,
+        # then re-check it: availability may have changed since validation
+        pricing_plan = validated_data["pricing_plan"]
+        rooms_data = validated_data.get("rooms", [])
+        add_ons = validated_data.get("add_ons", [])
+        lock_inventory(
+            pricing_plan.id,
+            [room_data["room"].id for room_data in rooms_data],
+            [add_on.id for add_on in add_ons],
+        )
+        tickets_needed = validated_data["group_size"].number_of_persons
+        if pricing_plan.get_available_tickets() < tickets_needed:
+            raise ValidationError(
+                f"Not enough tickets available for pricing plan {pricing_plan.title}"
+            )
+        for room_data in rooms_data:
+            room = room_data["room"]
+            if room.get_available_rooms() < room_data["quantity"]:
+                raise ValidationError(f"Not enough rooms available for {room.title}")
+        for add_on in add_ons:
+            if add_on.get_available_tickets() < tickets_needed:
+                raise ValidationError(
+                    f"Not enough tickets available for add-on {add_on.title}"
+                )
         
         # Create hotel booking if provided
         hotel_booking_data = validated_data.pop('hotel_booking', None)
@@ -214,46 +293,182 @@ class BookingViewSet(viewsets.ModelViewSet):
             hotel_booking = HotelBooking.objects.create(**hotel_booking_data)
         
         # Create booking with user and hotel booking
-        booking = serializer.save(
+        return serializer.save(
             user=user,
             hotel_booking=hotel_booking,
             status='CONFIRMED'
         )
 
 
-@api_view(["GET"])
-def get_addon_availability(request, event_id, addon_id):
+# Availability is polled constantly and is read-only, so these are native
+# async views on the async ORM rather than DRF views holding a thread each.
+# They are routed ahead of the router (see urls.py) and keep the responses
+# of the viewset actions they replace.
+
+
+def availability_response(data, status=200):
+    return HttpResponse(
+        ORJSONRenderer().render(data), status=status, content_type="application/json"
+    )
+
+
+def parse_date(request):
+    date = request.GET.get("date")
+    if not date:
+        raise ValueError("Date parameter is required")
     try:
-        addon = AddOn.objects.get(id=addon_id, event_id=event_id)
-        available_tickets = addon.get_available_tickets()
-        return Response({"available_tickets": available_tickets})
-    except AddOn.DoesNotExist:
-        return Response({"error": "Add-on not found"}, status=status.HTTP_404_NOT_FOUND)
+        return timezone.datetime.strptime(date, "%Y-%m-%d").date()
+    except ValueError:
+        raise ValueError("Invalid date format. Use YYYY-MM-DD")
 
 
-@api_view(["GET"])
-def get_time_slot_availability(request, addon_id, time_slot_id):
+async def get_addon_availability(request, addon_id):
     try:
-        event_id = request.query_params.get("event_id")
-        if not event_id:
-            return Response(
-                {"error": "Event ID is required"}, status=status.HTTP_400_BAD_REQUEST
-            )
+        date_obj = parse_date(request)
+    except ValueError as e:
+        return availability_response({"error": str(e)}, status=400)
+
+    addons = AddOn.objects.filter(id=addon_id)
+    event_id = request.GET.get("event_id")
+    if event_id:
+        addons = addons.filter(event_id=event_id)
+    try:
+        addon = await addons.aget()
+    except (AddOn.DoesNotExist, DjangoValidationError):
+        return availability_response({"error": "Add-on not found"}, status=404)
+
+    time_slots = [
+        time_slot
+        async for time_slot in addon.time_slots.filter(
+            start_time__date=date_obj
+        ).order_by("start_time")
+    ]
+    # Active holds are per event, count them once for the add-on and all slots
+    held_tickets = await AddOn.aheld_tickets(addon.event_id)
+    available_tickets, capacity_used = await asyncio.gather(
+        addon.aget_available_tickets(held_tickets),
+        AddOnTimeSlot.acapacity_used([time_slot.id for time_slot in time_slots]),
+    )
+    serializer = AddOnTimeSlotSerializer(
+        time_slots,
+        many=True,
+        context={
+            "available_capacity": {
+                time_slot.id: time_slot.total_capacity
+                - capacity_used.get(time_slot.id, 0)
+                - held_tickets
+                for time_slot in time_slots
+            }
+        },
+    )
+    return availability_response(
+        {"available_tickets": available_tickets, "time_slots": serializer.data}
+    )
+
 
-        time_slot = AddOnTimeSlot.objects.get(
+async def time_slot_availability(request, pk):
+    try:
+        time_slot = await AddOnTimeSlot.objects.select_related("add_on").aget(id=pk)
+    except AddOnTimeSlot.DoesNotExist:
+        return availability_response({"error": "Time slot not found"}, status=404)
+
+    held_capacity = await AddOn.aheld_tickets(time_slot.add_on.event_id)
+    return availability_response(
+        {
+            "available_capacity": await time_slot.aget_available_capacity(
+                held_capacity
+            ),
+            "total_capacity": time_slot.total_capacity,
+            "start_time": time_slot.start_time,
+            "end_time": time_slot.end_time,
+        }
+    )
+
+
+async def get_time_slot_availability(request, addon_id, time_slot_id):
+    event_id = request.GET.get("event_id")
+    if not event_id:
+        return availability_response({"error": "Event ID is required"}, status=400)
+
+    try:
+        time_slot = await AddOnTimeSlot.objects.aget(
             id=time_slot_id, add_on_id=addon_id, add_on__event_id=event_id
         )
-        available_capacity = time_slot.get_available_capacity()
-        return Response({"available_capacity": available_capacity})
-    except AddOnTimeSlot.DoesNotExist:
-        return Response(
-            {"error": "Time slot not found"}, status=status.HTTP_404_NOT_FOUND
+    except (AddOnTimeSlot.DoesNotExist, DjangoValidationError):
+        return availability_response({"error": "Time slot not found"}, status=404)
+
+    held_capacity = await AddOn.aheld_tickets(event_id)
+    return availability_response(
+        {"available_capacity": await time_slot.aget_available_capacity(held_capacity)}
+    )
+
+
+STREAM_PARAMS = {
+    "pricing_plans": "pricing_plan",
+    "rooms": "room",
+    "time_slots": "time_slot",
+}
+
+
+def parse_stream_keys(request):
+    keys = set()
+    for param, kind in STREAM_PARAMS.items():
+        for id in filter(None, request.GET.get(param, "").split(",")):
+            try:
+                keys.add((kind, str(uuid.UUID(id))))
+            except ValueError:
+                raise ValueError(f"Invalid id in {param}: {id}")
+    if not keys:
+        raise ValueError("Subscribe to at least one of pricing_plans, rooms or time_slots")
+    if len(keys) > settings.EVENTS_STREAM_MAX_KEYS:
+        raise ValueError(
+            f"At most {settings.EVENTS_STREAM_MAX_KEYS} entities can be watched"
         )
+    return keys
+
+
+async def stream_availability(keys):
+    subscription = broadcaster.subscribe(keys)
+    stream_subscribers.inc()
+    try:
+        # Subscribed first, so no change can slip between snapshot and stream
+        snapshot = await sync_to_async(broadcaster.snapshot)(keys)
+        for key, value in snapshot.items():
+            yield format_event(key, value)
+        while True:
+            changes = await subscription.changes(settings.EVENTS_STREAM_HEARTBEAT)
+            if not changes:
+                yield ": keep-alive\n\n"
+            for key, value in changes.items():
+                yield format_event(key, value)
+    finally:
+        stream_subscribers.dec()
+        broadcaster.unsubscribe(subscription)
+
+
+async def availability_stream(request):
+    """
+    Server-sent events with the availability of the pricing plans, rooms and
+    time slots given as comma separated ids in the `pricing_plans`, `rooms`
+    and `time_slots` parameters: their current figures, then every change.
+    """
+    try:
+        keys = parse_stream_keys(request)
+    except ValueError as e:
+        return availability_response({"error": str(e)}, status=400)
+
+    response = StreamingHttpResponse(
+        stream_availability(keys), content_type="text/event-stream"
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
 
 class CombinedHoldView(APIView):
     permission_classes = [AllowAny]
 
+    @hold_seconds.time()
     def post(self, request):
         serializer = CombinedHoldSerializer(data=request.data)
         if serializer.is_valid():
@@ -269,29 +484,21 @@ class CombinedHoldView(APIView):
                     session_id = str(uuid.uuid4())
                     request.session["session_id"] = session_id
 
-            # Create ticket hold
-            expires_at = timezone.now() + timedelta(minutes=5)
-            ticket_hold = TicketHold.objects.create(
-                user=request.user if request.user.is_authenticated else None,
-                session_id=session_id,
-                pricing_plan=pricing_plan,
-                number_of_tickets=number_of_tickets,
-                expires_at=expires_at,
-            )
-
-            # Create room holds if provided
-            room_holds = []
-            for room_data in room_holds_data:
-                room = Room.objects.get(id=room_data["room_id"])
-                room_hold = RoomHold.objects.create(
-                    user=request.user if request.user.is_authenticated else None,
-                    session_id=session_id,
-                    room=room,
-                    quantity=room_data["quantity"],
-                    expires_at=expires_at,
+            try:
+                ticket_hold, room_holds = run_write(
+                    self.create_holds,
+                    request.user if request.user.is_authenticated else None,
+                    session_id,
+                    pricing_plan,
+                    number_of_tickets,
+                    room_holds_data,
                 )
-                room_holds.append(room_hold)
-                ticket_hold.room_holds.add(room_hold)
+            except ValidationError:
+                # Sold out between validation and taking the lock
+                holds_rejected.inc(reason="lost_race")
+                raise
+            holds_created.inc()
+            hold_tickets.inc(number_of_tickets)
 
             # Return the created holds
             return Response(
@@ -302,4 +509,45 @@ class CombinedHoldView(APIView):
                 status=status.HTTP_201_CREATED,
             )
 
+        holds_rejected.inc(reason="invalid")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def create_holds(
+        self, user, session_id, pricing_plan, number_of_tickets, room_holds_data
+    ):
+        # Re-check availability with the inventory rows locked, the serializer
+        # check alone races with concurrent holds for the same tickets
+        room_ids = [room_data["room_id"] for room_data in room_holds_data]
+        lock_inventory(pricing_plan.id, room_ids)
+        if pricing_plan.get_available_tickets() < number_of_tickets:
+            raise ValidationError(
+                f"Not enough tickets available for pricing plan {pricing_plan.title}"
+            )
+
+        # Create ticket hold
+        expires_at = timezone.now() + timedelta(minutes=5)
+        ticket_hold = TicketHold.objects.create(
+            user=user,
+            session_id=session_id,
+            pricing_plan=pricing_plan,
+            number_of_tickets=number_of_tickets,
+            expires_at=expires_at,
+        )
+
+        # Create room holds if provided
+        room_holds = []
+        for room_data in room_holds_data:
+            room = Room.objects.get(id=room_data["room_id"])
+            if room.get_available_rooms() < int(room_data["quantity"]):
+                raise ValidationError(f"Not enough rooms available for {room.title}")
+            room_hold = RoomHold.objects.create(
+                user=user,
+                session_id=session_id,
+                room=room,
+                quantity=room_data["quantity"],
+                expires_at=expires_at,
+            )
+            room_holds.append(room_hold)
+            ticket_hold.room_holds.add(room_hold)
+
+        return ticket_hold, room_holds
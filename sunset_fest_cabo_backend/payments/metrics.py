@@ -0,0 +1,18 @@
+from core.metrics import Counter, Histogram
+
+WEBHOOK_LAG_BUCKETS = (1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+
+checkout_sessions = Counter(
+    "checkout_sessions_total", "Checkout session requests by outcome", ["result"]
+)
+checkout_seconds = Histogram(
+    "checkout_session_seconds", "Time to serve a checkout session request"
+)
+stripe_webhooks = Counter(
+    "stripe_webhooks_total", "Stripe webhook deliveries", ["type", "result"]
+)
+stripe_webhook_lag = Histogram(
+    "stripe_webhook_lag_seconds",
+    "Time from a Stripe event being created to its delivery here",
+    buckets=WEBHOOK_LAG_BUCKETS,
+)
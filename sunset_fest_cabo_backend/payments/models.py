@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from events.models import Booking
 
 
@@ -17,8 +18,19 @@ class Payment(models.Model):
     currency = models.CharField(max_length=3, default="USD")
     stripe_session_id = models.CharField(max_length=255, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="pending")
+    session_expires_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def has_live_session(self):
+        # A pending session can be handed back to the client as long as Stripe
+        # still accepts it and it was opened for the booking's current total
+        return (
+            self.status == "pending"
+            and self.session_expires_at is not None
+            and timezone.now() < self.session_expires_at
+            and self.amount == self.booking.total_price
+        )
+
     def __str__(self):
         return f"Payment for Booking {self.booking.id} - {self.status}"
@@ -0,0 +1,7 @@
+# Most queries per request for each route, on the query budget fixture
+# (see core/query_budgets.py). Enforced by QueryBudgetTests in tests.py.
+QUERY_BUDGETS = {
+    ("payments:create-checkout-session", "POST"): 10,
+    ("payments:stripe-webhook", "POST"): 8,
+    ("payments:get-booking-by-session", "GET"): 16,
+}
@@ -1,3 +1,170 @@
+import itertools
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.query_budgets import QueryBudgetMixin
+
+from events.models import Booking, Event, EventDate, GroupSize, PricingPlan
+from .models import Payment
+from .query_budgets import QUERY_BUDGETS
+
+
+def create_booking():
+    event = Event.objects.create(
+        title="Sunset Fest", description="", event_type="festival", image="events/x.jpg"
+    )
+    event_date = EventDate.objects.create(
+        event=event, date=timezone.now(), city="Cabo", title="Day 1", description=""
+    )
+    pricing_plan = PricingPlan.objects.create(
+        event_date=event_date, title="GA", description="", price=100, total_tickets=50
+    )
+    group_size = GroupSize.objects.create(
+        pricing_plan=pricing_plan, number_of_persons=2, base_price=20
+    )
+    return Booking.objects.create(
+        event_date=event_date,
+        pricing_plan=pricing_plan,
+        group_size=group_size,
+        total_price=0,
+    )
+
+
+def fake_session(session_id, expires_in=timedelta(hours=24)):
+    return SimpleNamespace(
+        id=session_id, expires_at=int((timezone.now() + expires_in).timestamp())
+    )
+
+
+@mock.patch("payments.views.stripe.checkout.Session")
+class CheckoutSessionReuseTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.booking = create_booking()
+        self.url = reverse(
+            "payments:create-checkout-session", args=[self.booking.id]
+        )
+
+    def test_live_pending_session_is_reused(self, session_api):
+        session_api.create.return_value = fake_session("cs_first")
+
+        first = self.client.post(self.url)
+        second = self.client.post(self.url)
+
+        self.assertEqual(session_api.create.call_count, 1)
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(second.data["session_id"], "cs_first")
+
+    def test_expired_session_is_rotated_in_place(self, session_api):
+        session_api.create.return_value = fake_session("cs_first")
+        self.client.post(self.url)
+        Payment.objects.update(session_expires_at=timezone.now() - timedelta(minutes=1))
+
+        session_api.create.return_value = fake_session("cs_second")
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["session_id"], "cs_second")
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Payment.objects.get().stripe_session_id, "cs_second")
+        session_api.expire.assert_not_called()
+
+    def test_session_for_stale_amount_is_expired_and_rotated(self, session_api):
+        session_api.create.return_value = fake_session("cs_first")
+        self.client.post(self.url)
+        Payment.objects.update(amount=1)
+
+        session_api.create.return_value = fake_session("cs_second")
+        response = self.client.post(self.url)
+
+        session_api.expire.assert_called_once_with("cs_first")
+        self.assertEqual(response.data["session_id"], "cs_second")
+        self.assertEqual(Payment.objects.get().amount, self.booking.total_price)
+
+    def test_paid_booking_is_rejected(self, session_api):
+        session_api.create.return_value = fake_session("cs_first")
+        self.client.post(self.url)
+        Payment.objects.update(status="completed")
+
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(session_api.create.call_count, 1)
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    urlconf = "payments.urls"
+    query_budgets = QUERY_BUDGETS
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.pricing_plan = PricingPlan.objects.first()
+        self.group_size = self.pricing_plan.group_sizes.first()
+        self.session_ids = itertools.count()
+        session_api = self.enterContext(
+            mock.patch("payments.views.stripe.checkout.Session")
+        )
+        session_api.create.side_effect = lambda **kwargs: fake_session(
+            f"cs_{next(self.session_ids)}"
+        )
+
+    def new_booking(self):
+        return Booking.objects.create(
+            event_date_id=self.pricing_plan.event_date_id,
+            pricing_plan=self.pricing_plan,
+            group_size=self.group_size,
+            user_email="guest@example.com",
+            total_price=0,
+        )
+
+    def new_payment(self):
+        booking = self.new_booking()
+        return Payment.objects.create(
+            booking=booking,
+            amount=booking.total_price,
+            currency="USD",
+            stripe_session_id=f"cs_paid_{next(self.session_ids)}",
+        )
+
+    def checkout_session(self):
+        url = reverse("payments:create-checkout-session", args=[self.new_booking().id])
+        return lambda: self.client.post(url)
+
+    def webhook(self):
+        event = {
+            "type": "checkout.session.completed",
+            "data": {"object": SimpleNamespace(id=self.new_payment().stripe_session_id)},
+        }
+
+        def send():
+            with mock.patch(
+                "payments.views.stripe.Webhook.construct_event", return_value=event
+            ):
+                return self.client.post(
+                    reverse("payments:stripe-webhook"),
+                    "{}",
+                    content_type="application/json",
+                    HTTP_STRIPE_SIGNATURE="t=0,v1=test",
+                )
+
+        return send
+
+    def booking_by_session(self):
+        url = reverse(
+            "payments:get-booking-by-session", args=[self.new_payment().stripe_session_id]
+        )
+        return lambda: self.client.get(url)
 
-# Create your tests here.
+    def route_requests(self):
+        return {
+            ("payments:create-checkout-session", "POST"): self.checkout_session,
+            ("payments:stripe-webhook", "POST"): self.webhook,
+            ("payments:get-booking-by-session", "GET"): self.booking_by_session,
+        }
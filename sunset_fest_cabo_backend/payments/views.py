@@ -2,12 +2,22 @@ from django.shortcuts import render
 
 # Create your views here.
 import stripe
+import time
+from datetime import datetime, timezone as dt_timezone
 from django.conf import settings
 from rest_framework import status
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from core.tracing import span
 from events.models import Booking
+from .metrics import (
+    checkout_seconds,
+    checkout_sessions,
+    stripe_webhook_lag,
+    stripe_webhooks,
+)
 from .models import Payment
 from .serializers import PaymentSerializer
 
@@ -15,9 +25,39 @@ stripe.api_key = settings.STRIPE_SECRET_KEY
 
 
 @api_view(["POST"])
+@checkout_seconds.time()
 def create_checkout_session(request, booking_id):
     try:
         booking = get_object_or_404(Booking, id=booking_id)
+
+        # Hand back a pending session that is still open instead of asking
+        # Stripe for a new one every time a checkout is resumed
+        try:
+            payment = booking.payment
+        except Payment.DoesNotExist:
+            payment = None
+
+        if payment:
+            if payment.status == "completed":
+                checkout_sessions.inc(result="already_paid")
+                return Response(
+                    {"error": "Booking is already paid"},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if payment.has_live_session():
+                checkout_sessions.inc(result="reused")
+                return Response(
+                    {"session_id": payment.stripe_session_id, "payment_id": payment.id}
+                )
+            if (
+                payment.session_expires_at
+                and timezone.now() < payment.session_expires_at
+            ):
+                # The booking total changed under an open session, close it so
+                # it can no longer be paid at the old amount
+                with span("stripe.checkout.Session.expire"):
+                    stripe.checkout.Session.expire(payment.stripe_session_id)
+
         # # Get email from booking user or booking email field
         # customer_email = booking.user.email if booking.user else booking.email
 
@@ -34,41 +74,50 @@ def create_checkout_session(request, booking_id):
         #     )
 
         # Create Stripe checkout session
-        session = stripe.checkout.Session.create(
-            # customer=customer.id,
-            payment_method_types=["card"],
-            line_items=[
-                {
-                    "price_data": {
-                        "currency": "usd",
-                        "product_data": {
-                            "name": f"Booking for {booking.event_date.event.title}",
+        with span("stripe.checkout.Session.create"):
+            session = stripe.checkout.Session.create(
+                # customer=customer.id,
+                payment_method_types=["card"],
+                line_items=[
+                    {
+                        "price_data": {
+                            "currency": "usd",
+                            "product_data": {
+                                "name": f"Booking for {booking.event_date.event.title}",
+                            },
+                            "unit_amount": int(
+                                booking.total_price * 100
+                            ),  # Convert to cents
                         },
-                        "unit_amount": int(
-                            booking.total_price * 100
-                        ),  # Convert to cents
-                    },
-                    "quantity": 1,
-                }
-            ],
-            mode="payment",
-            success_url=settings.FRONTEND_URL + "/booking/success/",
-            cancel_url=settings.FRONTEND_URL + "/booking/cancel/",
-            metadata={"booking_id": str(booking.id)},
-        )
-
-        # Create payment record
-        payment = Payment.objects.create(
+                        "quantity": 1,
+                    }
+                ],
+                mode="payment",
+                success_url=settings.FRONTEND_URL + "/booking/success/",
+                cancel_url=settings.FRONTEND_URL + "/booking/cancel/",
+                metadata={"booking_id": str(booking.id)},
+            )
+
+        # Create the payment record, or rotate the expired session on the
+        # existing one so the one-to-one booking constraint still holds
+        payment, _ = Payment.objects.update_or_create(
             booking=booking,
-            amount=booking.total_price,
-            currency="USD",
-            stripe_session_id=session.id,
-            status="pending",
+            defaults={
+                "amount": booking.total_price,
+                "currency": "USD",
+                "stripe_session_id": session.id,
+                "session_expires_at": datetime.fromtimestamp(
+                    session.expires_at, tz=dt_timezone.utc
+                ),
+                "status": "pending",
+            },
         )
 
+        checkout_sessions.inc(result="created")
         return Response({"session_id": session.id, "payment_id": payment.id})
 
     except Exception as e:
+        checkout_sessions.inc(result="error")
         return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 
@@ -79,14 +128,21 @@ def stripe_webhook(request):
     event = None
 
     try:
-        event = stripe.Webhook.construct_event(
-            payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
-        )
+        with span("stripe.Webhook.construct_event"):
+            event = stripe.Webhook.construct_event(
+                payload, sig_header, settings.STRIPE_WEBHOOK_SECRET
+            )
     except ValueError as e:
+        stripe_webhooks.inc(type="unknown", result="invalid_payload")
         return Response(status=400)
     except stripe.error.SignatureVerificationError as e:
+        stripe_webhooks.inc(type="unknown", result="invalid_signature")
         return Response(status=400)
 
+    created = getattr(event, "created", None)
+    if created:
+        stripe_webhook_lag.observe(max(0, time.time() - created))
+
     if event["type"] == "checkout.session.completed":
         session = event["data"]["object"]
         try:
@@ -100,7 +156,11 @@ def stripe_webhook(request):
             booking.is_paid = True
             booking.save()
         except Payment.DoesNotExist:
+            stripe_webhooks.inc(type=event["type"], result="unknown_payment")
             return Response(status=404)
+        stripe_webhooks.inc(type=event["type"], result="processed")
+    else:
+        stripe_webhooks.inc(type=event["type"], result="ignored")
 
     return Response(status=200)
 
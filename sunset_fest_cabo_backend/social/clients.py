@@ -0,0 +1,122 @@
+# clients.py
+import hashlib
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Cached in place of a document whose fetch failed
+FAILED = "failed"
+
+
+class ProviderClient:
+    """
+    HTTP client shared by all logins against one OAuth provider.
+
+    Keeps a pooled keep-alive session, bounds every call with connect and read
+    timeouts so a slow provider cannot hold a worker, and retries connection
+    failures and gateway errors.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.timeout = (
+            settings.SOCIAL_HTTP_CONNECT_TIMEOUT,
+            settings.SOCIAL_HTTP_READ_TIMEOUT,
+        )
+        retry = Retry(
+            total=settings.SOCIAL_HTTP_RETRIES,
+            connect=settings.SOCIAL_HTTP_RETRIES,
+            # A request that timed out reading may already have consumed a
+            # one-time authorization code, so only retry when nothing was
+            # sent or the gateway rejected a GET outright
+            read=0,
+            allowed_methods=frozenset({"GET"}),
+            status_forcelist=(502, 503, 504),
+            backoff_factor=0.2,
+            raise_on_status=False,
+        )
+        self.session = self._session(retry)
+        # For calls that spend a one-time code: a 502 does not prove the
+        # provider never saw it, so they are never replayed
+        self.single_attempt_session = self._session(Retry(0, read=False))
+
+    def _session(self, retry: Retry) -> requests.Session:
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=settings.SOCIAL_HTTP_POOL_SIZE,
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _cache_key(self, url: str, params: Optional[Dict[str, Any]]) -> str:
+        raw = json.dumps([url, params or {}], sort_keys=True)
+        return f"social:{self.name}:{hashlib.sha256(raw.encode()).hexdigest()}"
+
+    def request(
+        self, method: str, url: str, error: str, retry: bool = True, **kwargs
+    ) -> Dict[str, Any]:
+        session = self.session if retry else self.single_attempt_session
+        try:
+            response = session.request(method, url, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            logger.warning("%s %s %s failed: %s", self.name, method, url, type(e).__name__)
+            raise ValidationError(error)
+
+        if not response.ok:
+            logger.warning(
+                "%s %s %s returned %s", self.name, method, url, response.status_code
+            )
+            raise ValidationError(error)
+        return response.json()
+
+    def post(self, url: str, error: str, data: Dict[str, Any]) -> Dict[str, Any]:
+        return self.request("POST", url, error, data=data)
+
+    def get(
+        self,
+        url: str,
+        error: str,
+        params: Optional[Dict[str, Any]] = None,
+        cache_timeout: Optional[int] = None,
+        failure_cache_timeout: Optional[int] = None,
+        retry: bool = True,
+    ) -> Dict[str, Any]:
+        """
+        GET a JSON document. With `cache_timeout` the answer is kept in the
+        Django cache for that many seconds, keyed by URL and params, and with
+        `failure_cache_timeout` a failure is remembered for that long, so
+        calls fail fast instead of waiting out the timeouts again. Pass
+        `retry=False` for calls that must not be replayed.
+        """
+        if cache_timeout is None:
+            return self.request("GET", url, error, retry=retry, params=params)
+
+        key = self._cache_key(url, params)
+        data = cache.get(key)
+        if data == FAILED:
+            raise ValidationError(error)
+        if data is None:
+            try:
+                data = self.request("GET", url, error, retry=retry, params=params)
+            except ValidationError:
+                if failure_cache_timeout:
+                    cache.set(key, FAILED, failure_cache_timeout)
+                raise
+            cache.set(key, data, cache_timeout)
+        return data
+
+
+google_client = ProviderClient("google")
+facebook_client = ProviderClient("facebook")
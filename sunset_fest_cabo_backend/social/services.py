@@ -4,17 +4,38 @@ from django.shortcuts import redirect
 from django.core.exceptions import ValidationError
 from urllib.parse import urlencode
 from typing import Dict, Any
-import requests
 import jwt
 from django.contrib.auth import get_user_model
+from .clients import google_client, facebook_client
 
 User = get_user_model()
 
+GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
 GOOGLE_ACCESS_TOKEN_OBTAIN_URL = "https://oauth2.googleapis.com/token"
 GOOGLE_USER_INFO_URL = "https://www.googleapis.com/oauth2/v3/userinfo"
 LOGIN_URL = f"{settings.BACKEND_URL}/api/accounts/login"
 
 
+# Resolve Google endpoints from the (cached) OpenID discovery document
+def google_get_endpoints() -> Dict[str, str]:
+    try:
+        discovery = google_client.get(
+            GOOGLE_DISCOVERY_URL,
+            error="Could not get Google discovery document.",
+            cache_timeout=settings.SOCIAL_DISCOVERY_CACHE_TIMEOUT,
+            failure_cache_timeout=settings.SOCIAL_DISCOVERY_FAILURE_CACHE_TIMEOUT,
+        )
+    except ValidationError:
+        discovery = {}
+
+    return {
+        "token_endpoint": discovery.get(
+            "token_endpoint", GOOGLE_ACCESS_TOKEN_OBTAIN_URL
+        ),
+        "userinfo_endpoint": discovery.get("userinfo_endpoint", GOOGLE_USER_INFO_URL),
+    }
+
+
 # Exchange authorization token with access token
 def google_get_access_token(code: str, redirect_uri: str) -> str:
     data = {
@@ -25,24 +46,23 @@ def google_get_access_token(code: str, redirect_uri: str) -> str:
         "grant_type": "authorization_code",
     }
 
-    response = requests.post(GOOGLE_ACCESS_TOKEN_OBTAIN_URL, data=data)
-    if not response.ok:
-        print("RESPONSE", response.json())
-        raise ValidationError("Could not get access token from Google.")
-
-    access_token = response.json()["access_token"]
+    response = google_client.post(
+        google_get_endpoints()["token_endpoint"],
+        error="Could not get access token from Google.",
+        data=data,
+    )
 
-    return access_token
+    return response["access_token"]
 
 
 # Get user info from google
 def google_get_user_info(access_token: str) -> Dict[str, Any]:
-    response = requests.get(GOOGLE_USER_INFO_URL, params={"access_token": access_token})
-
-    if not response.ok:
-        raise ValidationError("Could not get user info from Google.")
-
-    return response.json()
+    return google_client.get(
+        google_get_endpoints()["userinfo_endpoint"],
+        error="Could not get user info from Google.",
+        params={"access_token": access_token},
+        cache_timeout=settings.SOCIAL_PROFILE_CACHE_TIMEOUT,
+    )
 
 
 def get_user_data(validated_data):
@@ -86,35 +106,25 @@ def facebook_get_access_token(code: str, redirect_uri: str) -> str:
         "code": code,
     }
 
-    response = requests.get(FACEBOOK_ACCESS_TOKEN_OBTAIN_URL, params=params)
-
-    print("FACEBOOK RESPONSE ACCESS TOKEN", response.json())
-    if not response.ok:
-        raise ValidationError("Could not get access token from Facebook.")
-
-    return response.json().get("access_token")
-
-
-def facebook_get_user_info(access_token: str) -> Dict[str, Any]:
-    response = requests.get(
-        FACEBOOK_USER_INFO_URL, params={"access_token": access_token}
+    # The code is single use, so the exchange is never cached or retried
+    response = facebook_client.get(
+        FACEBOOK_ACCESS_TOKEN_OBTAIN_URL,
+        error="Could not get access token from Facebook.",
+        params=params,
+        retry=False,
     )
-    print("FACEBOOK RESPONSE", response.json())
 
-    if not response.ok:
-        raise ValidationError("Could not get user info from Facebook.")
+    return response.get("access_token")
 
-    return response.json()
 
-
-def facebook_get_user_email(user_id: str, access_token: str) -> str:
-    response = requests.get(
-        f"https://graph.facebook.com/{user_id}",
-        params={"access_token": access_token, "fields": "email,name"},
+# Id, name and email in one Graph call instead of /me followed by /{user_id}
+def facebook_get_user_info(access_token: str) -> Dict[str, Any]:
+    return facebook_client.get(
+        FACEBOOK_USER_INFO_URL,
+        error="Could not get user info from Facebook.",
+        params={"access_token": access_token, "fields": "id,email,name"},
+        cache_timeout=settings.SOCIAL_PROFILE_CACHE_TIMEOUT,
     )
-    print("FACEBOOK RESPONSE EMAIL", response.json())
-
-    return response.json()
 
 
 def get_facebook_user_data(validated_data):
@@ -129,10 +139,7 @@ def get_facebook_user_data(validated_data):
         return redirect(f"{LOGIN_URL}?{params}")
 
     access_token = facebook_get_access_token(code=code, redirect_uri=redirect_uri)
-    user_data = facebook_get_user_info(access_token=access_token)
-    user_email = facebook_get_user_email(
-        user_id=user_data.get("id"), access_token=access_token
-    )
+    user_email = facebook_get_user_info(access_token=access_token)
 
     # Creates user in DB if first time login
     User.objects.get_or_create(
@@ -1,3 +1,98 @@
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from django.test import TestCase
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import CustomUser
+from . import services
+from .clients import facebook_client, google_client
+
+
+def json_response(data, status_code=200):
+    response = mock.Mock(ok=status_code < 400, status_code=status_code)
+    response.json.return_value = data
+    return response
+
+
+class ProviderClientTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_facebook_profile_is_one_bounded_call(self):
+        with mock.patch.object(
+            facebook_client.session,
+            "request",
+            return_value=json_response({"id": "1", "email": "a@b.com", "name": "A"}),
+        ) as request:
+            data = services.facebook_get_user_info("token")
+
+        self.assertEqual(data["email"], "a@b.com")
+        request.assert_called_once()
+        self.assertEqual(request.call_args.kwargs["timeout"], facebook_client.timeout)
+        self.assertEqual(
+            request.call_args.kwargs["params"]["fields"], "id,email,name"
+        )
+
+    def test_google_discovery_is_cached(self):
+        discovery = {
+            "token_endpoint": "https://example.com/token",
+            "userinfo_endpoint": "https://example.com/userinfo",
+        }
+        with mock.patch.object(
+            google_client.session, "request", return_value=json_response(discovery)
+        ) as request:
+            services.google_get_endpoints()
+            endpoints = services.google_get_endpoints()
+
+        request.assert_called_once()
+        self.assertEqual(endpoints, discovery)
+
+    def test_failed_google_discovery_is_cached(self):
+        with mock.patch.object(
+            google_client.session, "request", side_effect=requests.ConnectTimeout()
+        ) as request:
+            services.google_get_endpoints()
+            endpoints = services.google_get_endpoints()
+
+        request.assert_called_once()
+        self.assertEqual(endpoints["token_endpoint"], services.GOOGLE_ACCESS_TOKEN_OBTAIN_URL)
+
+    def test_facebook_code_exchange_is_never_retried(self):
+        adapter = facebook_client.single_attempt_session.get_adapter(
+            services.FACEBOOK_ACCESS_TOKEN_OBTAIN_URL
+        )
+        self.assertEqual(adapter.max_retries.total, 0)
+        with mock.patch.object(
+            facebook_client.single_attempt_session,
+            "request",
+            return_value=json_response({"access_token": "token"}),
+        ) as request:
+            token = services.facebook_get_access_token("code", "https://example.com/cb")
+
+        self.assertEqual(token, "token")
+        request.assert_called_once()
+
+    def test_timeouts_surface_as_validation_errors(self):
+        with mock.patch.object(
+            google_client.session, "request", side_effect=requests.ReadTimeout()
+        ):
+            with self.assertRaises(ValidationError):
+                services.google_get_user_info("token")
+
+
+class SocialLoginTests(TestCase):
+    def test_issued_token_carries_token_version(self):
+        user = CustomUser.objects.create_user(
+            username="ana", email="ana@example.com", password="x", token_version=3
+        )
+        with mock.patch(
+            "social.views.get_user_data", return_value={"email": user.email}
+        ):
+            response = self.client.get(reverse("google_login"), {"code": "c"})
 
-# Create your tests here.
+        token = AccessToken(response["Location"].split("token=", 1)[1])
+        self.assertEqual(token["token_version"], 3)
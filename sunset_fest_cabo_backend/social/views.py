@@ -4,7 +4,7 @@ from django.conf import settings
 from rest_framework.views import APIView
 from .serializers import AuthSerializer
 from django.contrib.auth import get_user_model
-from rest_framework_simplejwt.tokens import RefreshToken
+from accounts.serializers import MyTokenObtainPairSerializer
 
 User = get_user_model()
 
@@ -19,8 +19,8 @@ class GoogleLoginApi(APIView):
 
         user = User.objects.get(email=user_data["email"])
 
-        # Generate JWT token
-        refresh = RefreshToken.for_user(user)
+        # Generate JWT token, with the claims of a password login
+        refresh = MyTokenObtainPairSerializer.get_token(user)
         access_token = str(refresh.access_token)
 
         # Add token to redirect URL - now pointing to the specific callback endpoint
@@ -40,7 +40,7 @@ class FacebookLoginApi(APIView):
 
         user = User.objects.get(email=user_data["email"])
 
-        refresh = RefreshToken.for_user(user)
+        refresh = MyTokenObtainPairSerializer.get_token(user)
         access_token = str(refresh.access_token)
 
         redirect_url = (